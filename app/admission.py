@@ -0,0 +1,164 @@
+"""
+Admission control: one lane per route class.
+
+Each lane runs at most `limit` requests at once and lets at most `queue_size`
+more wait, in arrival order; past that a request is turned away with 503 and
+a Retry-After estimated from the lane's recent service time. The lane limits
+split the connection pool, so the listing lane keeps its share however many
+exports are running. Export jobs wait in the export lane too, without a bound,
+and each query of a batch request takes a listing slot.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from app.budget import route_class
+from app.config import settings
+from app.metrics import ADMISSION_ACTIVE, ADMISSION_WAITING, ADMISSION_REJECTED
+from app.serialization import error_response
+
+# weight of the latest request in the service time average
+SERVICE_TIME_WEIGHT = 0.2
+
+
+class LaneFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"lane queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Lane:
+    def __init__(self, name: str, limit: int, queue_size: int):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.service_time: float | None = None
+        self._waiters: deque[asyncio.Future] = deque()
+        self._publish()
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    def retry_after(self):
+        # time for the lane to work through the queue at its recent pace
+        return max(1, math.ceil((self.service_time or 1.0) * (self.waiting + 1) / self.limit))
+
+    def _publish(self):
+        ADMISSION_ACTIVE.set((self.name,), self.active)
+        ADMISSION_WAITING.set((self.name,), self.waiting)
+
+    def _admit(self):
+        self.admitted += 1
+        self._publish()
+
+    async def acquire(self, bounded: bool = True):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self._admit()
+            return
+        if bounded and self.waiting >= self.queue_size:
+            self.rejected += 1
+            ADMISSION_REJECTED.inc((self.name,))
+            raise LaneFull(self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._publish()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed to us as we were cancelled, pass it on
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+                self._publish()
+            raise
+        self._admit()
+
+    def release(self, elapsed: float | None = None):
+        if elapsed is not None:
+            self.service_time = elapsed if self.service_time is None else (
+                SERVICE_TIME_WEIGHT * elapsed + (1 - SERVICE_TIME_WEIGHT) * self.service_time
+            )
+        while self._waiters:
+            # the slot goes straight to the next waiter, `active` does not change
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._publish()
+                return
+        self.active -= 1
+        self._publish()
+
+    @asynccontextmanager
+    async def slot(self, bounded: bool = True):
+        await self.acquire(bounded)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "queue_size": self.queue_size,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "service_time_seconds": None if self.service_time is None else round(self.service_time, 6),
+        }
+
+
+lanes = {
+    "listing": Lane("listing", settings.ADMISSION_LISTING_LIMIT, settings.ADMISSION_LISTING_QUEUE),
+    "export": Lane("export", settings.ADMISSION_EXPORT_LIMIT, settings.ADMISSION_EXPORT_QUEUE),
+    "feedback": Lane("feedback", settings.ADMISSION_FEEDBACK_LIMIT, settings.ADMISSION_FEEDBACK_QUEUE),
+}
+
+
+@asynccontextmanager
+async def lane_slot(name: str, bounded: bool = True):
+    """A slot of a lane for work the middleware does not see (export jobs, batch queries)."""
+    if not settings.ADMISSION_ENABLED:
+        yield
+        return
+    async with lanes[name].slot(bounded):
+        yield
+
+
+class AdmissionMiddleware:
+    """Queue the listing, export and feedback requests in their lane, 503 when the queue is full."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        kind = route_class(scope) if scope["type"] == "http" else None
+        lane = lanes.get(kind)
+        if lane is None:
+            # batch requests take listing slots per query, inside the handler
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await lane.acquire()
+        except LaneFull as exc:
+            response = error_response(
+                503, f"Too many {kind} requests, retry later.", headers={"Retry-After": str(exc.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            lane.release(time.perf_counter() - start)
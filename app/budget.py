@@ -0,0 +1,207 @@
+"""
+Execution time budgets of the listing, batch, export and feedback routes.
+
+`BudgetMiddleware` runs a request in its own task and cancels it when its
+route's budget runs out (answered with 504) or when the client disconnects.
+Each SELECT of the request carries the remaining budget as an optimizer hint
+(QUERY_BUDGET_HINT, StarRocks `query_timeout` by default), so the database
+gives up on its own too. When a request is cancelled, the queries still running
+on its connections are stopped with KILL QUERY and those connections are
+discarded instead of being handed to the next request.
+"""
+import asyncio
+import math
+import logging
+import time
+from contextvars import ContextVar
+from sqlalchemy import event, text
+from sqlalchemy.exc import DisconnectionError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+from sqlalchemy.sql import Select
+from app.config import settings
+from app.metrics import REQUEST_CANCELLATIONS, QUERIES_KILLED, current_endpoint
+from app.serialization import error_response
+
+logger = logging.getLogger(__name__)
+
+BUDGETS = {
+    "listing": settings.QUERY_BUDGET_LISTING_SECONDS,
+    "batch": settings.QUERY_BUDGET_LISTING_SECONDS,
+    "export": settings.QUERY_BUDGET_EXPORT_SECONDS,
+    "feedback": settings.QUERY_BUDGET_FEEDBACK_SECONDS,
+}
+
+
+def route_class(scope):
+    """listing, batch, export or feedback for the routes with a budget, None for the others."""
+    path = scope["path"].rstrip("/")
+    if path == "/batch" and scope["method"] == "POST":
+        return "batch"
+    if path.startswith(("/content/", "/frequency/")) and path.endswith("/messages") and scope["method"] == "GET":
+        # the messages of one group, a listing query
+        return "listing"
+    if path not in ("/content", "/frequency") and not path.endswith("/export"):
+        return None
+    if scope["method"] == "PUT":
+        return "feedback"
+    if scope["method"] == "GET":
+        return "export" if path.endswith("/export") else "listing"
+    return None
+
+
+class QueryBudget:
+    def __init__(self, kind: str, seconds: float):
+        self.kind = kind
+        self.deadline = time.monotonic() + seconds
+        # connections this request has run statements on: id(record info) -> (engine, record info)
+        self.connections = {}
+
+    def remaining(self):
+        return max(self.deadline - time.monotonic(), 0.0)
+
+
+_budget: ContextVar[QueryBudget | None] = ContextVar("query_budget", default=None)
+# KILL QUERY goes through its own connection, the pool may be exhausted by the very queries to stop
+_killers = {}
+
+
+def _hint_statement(orm_execute_state):
+    budget = _budget.get()
+    if budget is None or not settings.QUERY_BUDGET_HINT or not isinstance(orm_execute_state.statement, Select):
+        return
+    seconds = max(math.ceil(budget.remaining()), 1)
+    hint = settings.QUERY_BUDGET_HINT.format(seconds=seconds, milliseconds=seconds * 1000)
+    orm_execute_state.statement = orm_execute_state.statement.prefix_with(f"/*+ {hint} */", dialect="mysql")
+
+
+event.listen(Session, "do_orm_execute", _hint_statement)
+
+
+def instrument_budget(engine):
+    """Track the connections each budgeted request runs statements on, so they can be killed."""
+    if engine.dialect.name == "mysql":
+        @event.listens_for(engine.sync_engine, "connect")
+        def _connect(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("SELECT CONNECTION_ID()")
+            connection_record.info["server_id"] = cursor.fetchone()[0]
+            cursor.close()
+
+    @event.listens_for(engine.sync_engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        if connection_record.info.pop("doomed", False):
+            # the pool replaces it with a fresh connection
+            raise DisconnectionError("connection of a cancelled request")
+
+    @event.listens_for(engine.sync_engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        budget = _budget.get()
+        if budget is not None:
+            budget.connections.pop(id(connection_record.info), None)
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        budget = _budget.get()
+        if budget is not None:
+            info = conn.connection.info
+            budget.connections[id(info)] = (engine, info)
+
+
+async def _kill(connections):
+    for engine, server_id in connections:
+        killer = _killers.get(engine)
+        if killer is None:
+            killer = _killers[engine] = create_async_engine(engine.url, poolclass=NullPool)
+        try:
+            async with killer.connect() as conn:
+                await conn.execute(text(f"KILL QUERY {int(server_id)}"))
+            QUERIES_KILLED.inc((current_endpoint(),))
+        except Exception:
+            # the query may have finished in the meantime
+            logger.warning("KILL QUERY %s failed", server_id, exc_info=True)
+
+
+class BudgetMiddleware:
+    """Cancel budgeted requests on timeout or client disconnect, and stop their queries."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        kind = route_class(scope) if scope["type"] == "http" else None
+        if kind is None or not BUDGETS[kind]:
+            await self.app(scope, receive, send)
+            return
+
+        budget = QueryBudget(kind, BUDGETS[kind])
+        messages = asyncio.Queue()
+        response = {"started": False, "done": False, "abandoned": False}
+
+        async def send_tracked(message):
+            if response["abandoned"]:
+                return
+            if message["type"] == "http.response.start":
+                response["started"] = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                response["done"] = True
+            await send(message)
+
+        async def listen():
+            # the app reads the body from `messages`; a disconnect ends the listening
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    return
+
+        token = _budget.set(budget)
+        try:
+            request = asyncio.create_task(self.app(scope, messages.get, send_tracked))
+        finally:
+            _budget.reset(token)
+        listener = asyncio.create_task(listen())
+        reason = None
+        try:
+            pending = {request, listener}
+            while request in pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=budget.remaining(), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    reason = "timeout"
+                    break
+                if listener in done and request in pending and not response["done"]:
+                    reason = "disconnect"
+                    break
+        finally:
+            listener.cancel()
+            if reason is None and not request.done():
+                # our own cancellation, e.g. server shutdown
+                request.cancel()
+
+        if reason is None:
+            await request
+            return
+
+        REQUEST_CANCELLATIONS.inc((current_endpoint(), reason))
+        # the ids are read now, the pool clears the info of a connection it invalidates
+        connections = []
+        for engine, info in budget.connections.values():
+            info["doomed"] = True
+            if "server_id" in info:
+                connections.append((engine, info["server_id"]))
+        request.cancel()
+        response["abandoned"] = True
+
+        # answer before the cleanup, a driver may take a while to give the connection back
+        if reason == "timeout" and not response["started"]:
+            await error_response(504, f"The request exceeded its {kind} time budget.")(scope, messages.get, send)
+        await _kill(connections)
+        try:
+            await request
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.debug("cancelled request raised", exc_info=True)
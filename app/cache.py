@@ -0,0 +1,168 @@
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from app.config import settings
+from app.utils import naive
+
+
+def listing_key(kind: str, from_datetime: datetime, to_datetime: datetime, *params):
+    """
+    Cache key of a listing request, built from the normalized query
+    (after `validate_time_range`, page/page_size validation).
+    """
+    parts = [kind, naive(from_datetime).isoformat(), naive(to_datetime).isoformat()]
+    parts += ["" if p is None else str(p) for p in params]
+    return "listing:" + "|".join(parts)
+
+
+class CacheBackend:
+    """
+    Result cache interface. Values are encoded JSON response bodies; entries
+    are tagged with the group_ids they contain so feedback writes can drop
+    exactly the entries they touch.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def get(self, key: str) -> bytes | None:
+        raise NotImplementedError
+
+    async def set(self, key: str, body: bytes, tags=()):
+        raise NotImplementedError
+
+    async def invalidate(self, tags):
+        raise NotImplementedError
+
+    def _record(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def stats(self):
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+class NullCache(CacheBackend):
+    async def get(self, key):
+        self._record(False)
+        return None
+
+    async def set(self, key, body, tags=()):
+        pass
+
+    async def invalidate(self, tags):
+        pass
+
+
+class MemoryCache(CacheBackend):
+    """In-process cache with a per-entry TTL and LRU eviction above `max_entries`."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        super().__init__()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expires_at, body, tags)
+        self._tags = defaultdict(set)  # tag -> keys
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            self._drop(key)
+            entry = None
+        self._record(entry is not None)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    async def set(self, key, body, tags=()):
+        if key in self._entries:
+            self._drop(key)
+        tags = frozenset(tags)
+        self._entries[key] = (time.monotonic() + self.ttl, body, tags)
+        for tag in tags:
+            self._tags[tag].add(key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    async def invalidate(self, tags):
+        for tag in set(tags):
+            for key in self._tags.pop(tag, ()):
+                if key in self._entries:
+                    self._drop(key)
+                    self.invalidations += 1
+
+    def _drop(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self):
+        return {
+            **super().stats(),
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+        }
+
+
+class RedisCache(CacheBackend):
+    """
+    Shared cache on Redis (optional `redis` package). Entries expire by TTL;
+    size-bounded eviction is left to the server's maxmemory-policy (allkeys-lru).
+    """
+
+    def __init__(self, url: str, ttl: float):
+        super().__init__()
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package")
+        self.client = redis.from_url(url)
+        self.ttl = int(ttl)
+
+    async def get(self, key):
+        body = await self.client.get(key)
+        self._record(body is not None)
+        return body
+
+    async def set(self, key, body, tags=()):
+        pipe = self.client.pipeline()
+        pipe.set(key, body, ex=self.ttl)
+        for tag in set(tags):
+            pipe.sadd(f"tag:{tag}", key)
+            pipe.expire(f"tag:{tag}", self.ttl)
+        await pipe.execute()
+
+    async def invalidate(self, tags):
+        for tag in set(tags):
+            keys = await self.client.smembers(f"tag:{tag}")
+            if keys:
+                self.invalidations += await self.client.delete(*keys)
+            await self.client.delete(f"tag:{tag}")
+
+
+def create_cache() -> CacheBackend:
+    if settings.CACHE_BACKEND == "memory":
+        return MemoryCache(settings.CACHE_TTL_SECONDS, settings.CACHE_MAX_ENTRIES)
+    if settings.CACHE_BACKEND == "redis":
+        return RedisCache(settings.CACHE_REDIS_URL, settings.CACHE_TTL_SECONDS)
+    return NullCache()
+
+
+result_cache = create_cache()
@@ -0,0 +1,90 @@
+"""
+Single-flight coalescing of identical concurrent listing queries.
+
+The first request for a key (the leader) runs the query; requests for the
+same key arriving while it is in flight await its result instead of checking
+out their own connection. A follower that waits longer than the bound, or
+whose leader fails or is cancelled, runs the query itself.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, TypeVar
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self, wait_timeout: float):
+        self.wait_timeout = wait_timeout
+        self._flights: dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.fallbacks = 0
+        self.timeouts = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        flight = self._flights.get(key)
+        if flight is None:
+            return await self._lead(key, fn)
+
+        self.followers += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(flight), self.wait_timeout)
+        except TimeoutError:
+            self.timeouts += 1
+        except asyncio.CancelledError:
+            # our own cancellation, not the leader's
+            if not flight.cancelled():
+                raise
+            self.fallbacks += 1
+        except Exception:
+            self.fallbacks += 1
+        logger.debug("single-flight follower runs %s on its own", key)
+        return await fn()
+
+    async def _lead(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        self.leaders += 1
+        flight = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except BaseException as exc:
+            flight.set_exception(exc)
+            # followers fall back on their own, nobody has to retrieve it
+            flight.exception()
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def stats(self):
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "fallbacks": self.fallbacks,
+            "timeouts": self.timeouts,
+        }
+
+
+class NoFlight(SingleFlight):
+    """Coalescing disabled: every request runs its own query."""
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        self.leaders += 1
+        return await fn()
+
+
+listing_flight = (
+    SingleFlight(settings.COALESCE_WAIT_SECONDS) if settings.COALESCE_ENABLED
+    else NoFlight(settings.COALESCE_WAIT_SECONDS)
+)
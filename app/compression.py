@@ -0,0 +1,125 @@
+"""
+Negotiated response compression.
+
+A response is compressed with the best of zstd (when the `zstandard` package is
+installed) and gzip that the request's Accept-Encoding allows, zstd first at
+equal q-values, once its body reaches COMPRESSION_MIN_SIZE bytes. A streamed
+response (the exports) is compressed chunk by chunk as it is produced, each
+chunk flushed so the client never waits for the end of the export. Responses
+that already have a Content-Encoding or a Content-Range, event streams and the
+media types that are compressed already (Arrow, Parquet, export job files) pass
+through untouched.
+"""
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+from app.config import settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# compressed already, or flushed event by event
+SKIPPED_MEDIA_TYPES = {
+    "application/vnd.apache.arrow.stream",
+    "application/vnd.apache.parquet",
+    "application/gzip",
+    "application/zstd",
+    "text/event-stream",
+}
+
+
+def negotiate(accept_encoding: str) -> str | None:
+    """zstd, gzip or None for an Accept-Encoding header."""
+    offered = {}
+    for part in accept_encoding.lower().split(","):
+        name, *params = (p.strip() for p in part.split(";"))
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            offered[name] = q
+
+    candidates = ["zstd", "gzip"] if zstandard is not None else ["gzip"]
+    best = max(candidates, key=lambda c: offered.get(c, offered.get("*", 0.0)))
+    return best if offered.get(best, offered.get("*", 0.0)) > 0 else None
+
+
+class _Encoder:
+    def __init__(self, encoding: str):
+        if encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=settings.COMPRESSION_ZSTD_LEVEL).compressobj()
+            self._sync = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            self._compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, wbits=31)
+            self._sync = zlib.Z_SYNC_FLUSH
+
+    def chunk(self, data: bytes, final: bool) -> bytes:
+        data = self._compressor.compress(data)
+        return data + (self._compressor.flush() if final else self._compressor.flush(self._sync))
+
+
+def _compressible(status: int, headers: Headers):
+    media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+    return (
+        status not in (204, 206, 304)
+        and "content-encoding" not in headers
+        and "content-range" not in headers
+        and media_type not in SKIPPED_MEDIA_TYPES
+    )
+
+
+class CompressionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        encoder: _Encoder | None = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, encoder, passthrough
+            if passthrough or message["type"] not in ("http.response.start", "http.response.body"):
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                # held back until the first body chunk shows the size
+                start = message
+                return
+
+            body, more_body = message.get("body", b""), message.get("more_body", False)
+            if encoder is None:
+                headers = MutableHeaders(raw=list(start.get("headers", ())))
+                if not _compressible(start["status"], headers) or (not more_body and len(body) < settings.COMPRESSION_MIN_SIZE):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                # a streamed body is compressed whatever its size, its end is not known yet
+                encoder = _Encoder(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                del headers["Content-Length"]
+                body = encoder.chunk(body, not more_body)
+                if not more_body:
+                    headers["Content-Length"] = str(len(body))
+                await send({**start, "headers": headers.raw})
+            else:
+                body = encoder.chunk(body, not more_body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,143 @@
+"""
+Conditional GET for the listing, messages and export routes.
+
+A response's validator is a weak ETag hashed from its normalized query, the
+data watermark at the end of its window and a version bumped by every
+feedback write of this process. The watermark is the newest `ts`, read through
+`read_session` at most once per CONDITIONAL_WATERMARK_SECONDS for all
+requests. A window whose end lies more than CONDITIONAL_LATENESS_SECONDS
+before it is closed: its ETag stays the same while newer rows keep arriving.
+An open window's ETag changes with every new row. A request whose
+If-None-Match holds the current ETag is answered 304 before any cache lookup
+or aggregation.
+
+The body sent with an ETag must not predate its validator, so validators are
+only handed out once the cached bodies, the in-memory window and the replicas
+in rotation have caught up: a closed window once the newest `ts` is that long
+past its closing, an open one once the watermark has stood still that long.
+If-Modified-Since is not honoured: the default "last hour" moves while the
+data stands still. Rows arriving later than CONDITIONAL_LATENESS_SECONDS into a
+closed window do not change its ETag.
+"""
+import asyncio
+import hashlib
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy import select, func
+from app.config import settings
+from app.metrics import stage
+from app.models import SMS_Data
+from app.replicas import read_session
+from app.utils import naive
+
+
+def _settle_seconds():
+    # how old the data behind a body may be: cache entries, the window tick, replica lag
+    seconds = settings.CACHE_TTL_SECONDS if settings.CACHE_BACKEND != "none" else 0
+    if settings.WINDOW_STORE_ENABLED:
+        seconds = max(seconds, settings.WINDOW_TICK_SECONDS + settings.WINDOW_LATENESS_SECONDS)
+    if settings.DB_REPLICA_URLS:
+        seconds = max(seconds, settings.DB_REPLICA_MAX_LAG_SECONDS + settings.DB_REPLICA_LAG_CHECK_SECONDS)
+    return seconds + settings.CONDITIONAL_WATERMARK_SECONDS
+
+
+class Watermark:
+    def __init__(self):
+        self.max_ts: datetime | None = None
+        self.feedback_version = 0
+        self.changed_at = datetime.now(timezone.utc)
+        self._changed = time.monotonic()
+        self._read_at: float | None = None
+        self._lock = asyncio.Lock()
+        self.reads = 0
+        self.not_modified = 0
+
+    def _fresh(self):
+        return self._read_at is not None and time.monotonic() - self._read_at < settings.CONDITIONAL_WATERMARK_SECONDS
+
+    async def current(self):
+        """(newest ts, feedback version), the newest ts read again when it is older than CONDITIONAL_WATERMARK_SECONDS."""
+        if not self._fresh():
+            async with self._lock:
+                if not self._fresh():
+                    async with read_session() as session:
+                        with stage("watermark"):
+                            max_ts = await session.scalar(select(func.max(SMS_Data.ts)))
+                    self.reads += 1
+                    self._read_at = time.monotonic()
+                    if max_ts != self.max_ts or self.reads == 1:
+                        self.max_ts = max_ts
+                        self._touch()
+        return self.max_ts, self.feedback_version
+
+    def bump_feedback(self):
+        self.feedback_version += 1
+        self._touch()
+
+    def _touch(self):
+        self.changed_at = datetime.now(timezone.utc)
+        self._changed = time.monotonic()
+
+    @property
+    def settled(self):
+        return time.monotonic() - self._changed >= _settle_seconds()
+
+    def closed(self, to_datetime: datetime, margin: float = 0):
+        """Whether the newest ts is past the end of a window ending at `to_datetime`, by `margin` seconds more."""
+        lateness = timedelta(seconds=settings.CONDITIONAL_LATENESS_SECONDS + margin)
+        return self.max_ts is not None and self.max_ts >= naive(to_datetime) + lateness
+
+    def status(self):
+        return {
+            "max_ts": self.max_ts,
+            "feedback_version": self.feedback_version,
+            "changed_at": self.changed_at,
+            "settled": self.settled,
+            "reads": self.reads,
+            "not_modified": self.not_modified,
+        }
+
+
+data_watermark = Watermark()
+
+
+def _matches(if_none_match: str, etag: str):
+    # weak comparison, as If-None-Match asks for
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in tags)
+
+
+async def conditional_get(request: Request, key: str, to_datetime: datetime):
+    """
+    (304 response or None, validator headers for the full response) of the
+    request for the normalized query `key`, whose window ends at `to_datetime`.
+    """
+    if not settings.CONDITIONAL_GET_ENABLED:
+        return None, {}
+    max_ts, feedback_version = await data_watermark.current()
+    if data_watermark.closed(to_datetime):
+        watermark = "closed"
+        end = to_datetime if to_datetime.tzinfo else to_datetime.astimezone()
+        last_modified = end + timedelta(seconds=settings.CONDITIONAL_LATENESS_SECONDS)
+        ready = data_watermark.closed(to_datetime, margin=_settle_seconds())
+    else:
+        watermark = max_ts.isoformat() if max_ts else ""
+        last_modified = data_watermark.changed_at
+        ready = data_watermark.settled
+
+    raw = f"{key}|{watermark}|{feedback_version}"
+    etag = f'W/"{hashlib.sha256(raw.encode()).hexdigest()[:32]}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified.astimezone(timezone.utc), usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, etag):
+        data_watermark.not_modified += 1
+        return Response(status_code=304, headers=headers), headers
+    return None, headers if ready else {}
@@ -1,5 +1,8 @@
+from typing import Literal
 from pydantic_settings import BaseSettings
 
+# behaviour beyond the plain listing/export/feedback routes is off by default and turned on
+# per deployment (docker-compose.yaml, k8s/fastapi_deployment.yaml)
 class Settings(BaseSettings):
     DB_USER: str
     DB_PASSWORD: str
@@ -7,7 +10,147 @@ class Settings(BaseSettings):
     DB_PORT: int
     DB_DATABASE: str
     TABLE_NAME: str
+    # full SQLAlchemy URL, overrides the DB_* parts (e.g. the local benchmark stand-in)
+    DATABASE_URL: str | None = None
 
+    # connection pool
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # connections opened at startup (capped at DB_POOL_SIZE)
+    DB_POOL_WARMUP: int = 0
+
+    # read replicas for the GET and export routes (see app/replicas.py), a JSON list of SQLAlchemy URLs
+    DB_REPLICA_URLS: list[str] = []
+    DB_REPLICA_POLICY: Literal["round_robin", "least_connections"] = "round_robin"
+    # a replica lagging more than this is out of rotation until it catches up
+    DB_REPLICA_MAX_LAG_SECONDS: float = 30
+    DB_REPLICA_LAG_CHECK_SECONDS: float = 5
+
+    # execution budget per route class (see app/budget.py), 0 disables it
+    QUERY_BUDGET_LISTING_SECONDS: float = 0
+    QUERY_BUDGET_EXPORT_SECONDS: float = 0
+    QUERY_BUDGET_FEEDBACK_SECONDS: float = 0
+    # optimizer hint carrying the remaining budget into each SELECT, empty disables it;
+    # MySQL takes "MAX_EXECUTION_TIME({milliseconds})"
+    QUERY_BUDGET_HINT: str = "SET_VAR(query_timeout = {seconds})"
+
+    # admission control per route class (see app/admission.py): requests running at once, then
+    # requests allowed to wait; keep the limits within DB_POOL_SIZE + DB_MAX_OVERFLOW
+    ADMISSION_ENABLED: bool = False
+    ADMISSION_LISTING_LIMIT: int = 14
+    ADMISSION_LISTING_QUEUE: int = 100
+    ADMISSION_EXPORT_LIMIT: int = 3
+    ADMISSION_EXPORT_QUEUE: int = 10
+    ADMISSION_FEEDBACK_LIMIT: int = 3
+    ADMISSION_FEEDBACK_QUEUE: int = 50
+
+    # POST /batch: queries per request, queries run at once, and the most rows one shared
+    # query may span to serve several pages of the same filters
+    BATCH_MAX_QUERIES: int = 50
+    BATCH_CONCURRENCY: int = 4
+    BATCH_SPAN_MAX_ROWS: int = 500
+
+    # number of rows fetched per server-side cursor batch in streaming exports
+    EXPORT_BATCH_SIZE: int = 5000
+
+    # asynchronous export jobs written to compressed files (see app/jobs.py)
+    EXPORT_SPOOL_DIR: str = "export_spool"
+    EXPORT_JOB_WORKERS: int = 2
+    EXPORT_JOB_QUEUE_SIZE: int = 20
+    # finished files are deleted this long after completion
+    EXPORT_JOB_TTL_SECONDS: float = 3600
+
+    # per-minute rollup (see app/rollup.py)
+    ROLLUP_ENABLED: bool = False
+    ROLLUP_LATENESS_SECONDS: int = 60
+    ROLLUP_INTERVAL_SECONDS: int = 30
+    # sealed minutes re-counted on each refresh, rebuilt when late rows arrived
+    ROLLUP_RECHECK_MINUTES: int = 60
+    # run the refresh loop inside the app instead of `python -m app.rollup refresh --loop`;
+    # refreshes must not overlap, turn it on in one process only
+    ROLLUP_REFRESH_IN_APP: bool = False
+
+    # in-memory window of the latest rows answering the GET listings (see app/window.py), needs numpy;
+    # keep the retention above an hour so the default last-hour listing fits
+    WINDOW_STORE_ENABLED: bool = False
+    WINDOW_RETENTION_SECONDS: int = 3660
+    WINDOW_TICK_SECONDS: float = 1
+    # the newest rows are read again each tick, rows written up to this late are picked up
+    WINDOW_LATENESS_SECONDS: int = 10
+
+    # listing result cache (see app/cache.py)
+    CACHE_BACKEND: Literal["memory", "redis", "none"] = "none"
+    CACHE_TTL_SECONDS: float = 10
+    CACHE_MAX_ENTRIES: int = 1024
+    CACHE_REDIS_URL: str = "redis://localhost:6379/0"
+    # the default "last hour" window ends on a multiple of this, so polls share cache keys
+    CACHE_WINDOW_SNAP_SECONDS: int = 0
+
+    # listing totals, counted with the first page and reused by the next ones (see app/totals.py);
+    # kept apart from the result cache whatever CACHE_BACKEND is; 0 stores none, every page counts
+    TOTALS_TTL_SECONDS: float = 30
+    TOTALS_MAX_ENTRIES: int = 1024
+
+    # conditional GET on the listing, messages and export routes (see app/conditional.py),
+    # the newest ts behind the ETags is read at most this often
+    CONDITIONAL_GET_ENABLED: bool = False
+    CONDITIONAL_WATERMARK_SECONDS: float = 1
+    # a window ending this long before the newest ts is closed, its ETag no longer changes
+    CONDITIONAL_LATENESS_SECONDS: int = 10
+
+    # gzip/zstd response compression negotiated from Accept-Encoding (see app/compression.py),
+    # bodies under COMPRESSION_MIN_SIZE bytes are sent as they are; zstd needs 'zstandard'
+    COMPRESSION_ENABLED: bool = False
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_ZSTD_LEVEL: int = 3
+
+    # text_keyword matching: ILIKE scan, or the n-gram indexed text_sms_lower (see app/search.py)
+    KEYWORD_SEARCH: Literal["ilike", "ngram"] = "ilike"
+
+    # phone_num exact/prefix/suffix matching on the generated sdt_in_canonical/sdt_in_reversed
+    # columns (see app/phone.py); off computes the same expressions inline
+    PHONE_INDEXED: bool = False
+    PHONE_COUNTRY_CODE: str = "84"
+
+    # identical concurrent listing requests share one query (see app/coalesce.py)
+    COALESCE_ENABLED: bool = False
+    # how long a follower waits for the leader before querying on its own
+    COALESCE_WAIT_SECONDS: float = 10
+
+    # live grouped updates over SSE (see app/live.py)
+    LIVE_TICK_SECONDS: float = 5
+    LIVE_WINDOW_SECONDS: int = 3600
+    LIVE_LATENESS_SECONDS: int = 10
+    # pending events per subscriber before it is resynced with a snapshot
+    LIVE_QUEUE_SIZE: int = 100
+    LIVE_HEARTBEAT_SECONDS: float = 15
+
+    # messages embedded per group in a listing page, most frequent first; the others are paged
+    # through /content/{group_id}/{sdt_in}/messages and /frequency/{group_id}/messages
+    LISTING_TOP_MESSAGES: int = 10
+
+    # distinct feedback keys per UPDATE transaction
+    FEEDBACK_BATCH_SIZE: int = 500
+    # write-behind feedback (see app/feedback_queue.py): the PUT routes answer 202 once the feedback
+    # is buffered and logged, the buffer is flushed every FEEDBACK_FLUSH_MS or at FEEDBACK_FLUSH_ITEMS keys
+    FEEDBACK_WRITE_BEHIND: bool = False
+    FEEDBACK_FLUSH_MS: int = 200
+    FEEDBACK_FLUSH_ITEMS: int = 500
+    FEEDBACK_LOG_DIR: str = "feedback_log"
+    # fsync the log before answering, so acknowledged feedback survives a host crash too
+    FEEDBACK_LOG_FSYNC: bool = True
+
+    # encode listing/export rows straight to JSON instead of building response models
+    FAST_SERIALIZATION: bool = False
+
+    # request/stage/query metrics at /metrics (see app/metrics.py)
+    METRICS_ENABLED: bool = False
+    # requests carrying this header get their timing breakdown in a Server-Timing header
+    METRICS_DEBUG_HEADER: str = "X-Debug-Timing"
 
     class Config:
         env_file = ".env"
@@ -1,15 +1,84 @@
+import asyncio
+import logging
+import time
+from contextlib import AsyncExitStack
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from urllib.parse import quote_plus
 from app.config import settings
+from app.metrics import instrument_engine
+from app.budget import instrument_budget
+
+logger = logging.getLogger(__name__)
 
 password = quote_plus(settings.DB_PASSWORD)
-DATABASE_URL = (
+DATABASE_URL = settings.DATABASE_URL or (
     f"mysql+aiomysql://{settings.DB_USER}:"
     f"{password}@{settings.DB_HOST}:"
     f"{settings.DB_PORT}/{settings.DB_DATABASE}"
 )
 
-engine = create_async_engine(DATABASE_URL)
+
+class PoolWaitStats:
+    """Time spent waiting for a connection from the pool."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float, timed_out: bool = False):
+        self.checkouts += 1
+        self.timeouts += timed_out
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def snapshot(self):
+        return {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": round(self.total_wait, 6),
+            "wait_seconds_avg": round(self.total_wait / self.checkouts, 6) if self.checkouts else 0.0,
+            "wait_seconds_max": round(self.max_wait, 6),
+        }
+
+
+pool_wait_stats = PoolWaitStats()
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            pool_wait_stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_wait_stats.record(time.perf_counter() - start)
+        return conn
+
+
+def make_engine(url: str, poolclass=TimedQueuePool):
+    """An engine with the configured pool settings, instrumented when metrics are on."""
+    engine = create_async_engine(
+        url,
+        poolclass=poolclass,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    if settings.METRICS_ENABLED:
+        instrument_engine(engine)
+    instrument_budget(engine)
+    return engine
+
+
+engine = make_engine(DATABASE_URL)
 
 
 # Tạo session factory
@@ -21,3 +90,31 @@ async def get_session():
     async with SessionLocal() as session:
         yield session
 
+
+async def warm_up_pool(n: int):
+    """Open `n` connections at once so they are idle in the pool before the first request."""
+    n = min(n, settings.DB_POOL_SIZE)
+    if n <= 0:
+        return
+
+    async def _open(stack: AsyncExitStack):
+        conn = await stack.enter_async_context(engine.connect())
+        await conn.execute(text("SELECT 1"))
+
+    try:
+        async with AsyncExitStack() as stack:
+            await asyncio.gather(*(_open(stack) for _ in range(n)))
+    except Exception:
+        logger.exception("connection pool warm-up failed")
+
+
+def pool_status():
+    pool = engine.pool
+    return {
+        "pool_size": pool.size(),
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        **pool_wait_stats.snapshot(),
+    }
@@ -0,0 +1,162 @@
+import csv
+import io
+import json
+from datetime import datetime
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from app.config import settings
+from app.replicas import read_session
+from app.metrics import stage
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# low-cardinality text columns, dictionary-encoded in the columnar formats
+DICTIONARY_FIELDS = {"label"}
+# buffer compression of the Arrow stream and Parquet pages, readers decompress it transparently
+ARROW_COMPRESSION = "zstd"
+
+
+def _encode_value(v):
+    if isinstance(v, datetime):
+        return v.isoformat()
+    return v
+
+
+async def iter_export_rows(stmt, batch_size: int = None, session=None):
+    """
+    Yield lists of rows read from a server-side cursor, `batch_size` rows at a time.
+    Without `session`, one is opened here (not through `get_read_session`) so it
+    stays alive for as long as the response is being streamed.
+    """
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    if session is None:
+        async with read_session() as session:
+            async for rows in iter_export_rows(stmt, batch_size, session):
+                yield rows
+        return
+    with stage("export_stream"):
+        result = await session.stream(stmt.execution_options(yield_per=batch_size))
+    async for rows in result.partitions():
+        yield rows
+
+
+async def iter_csv(stmt, fields: list[str], progress=None, session=None):
+    """CSV text of `stmt`, header first, then one chunk per batch; `progress(n)` gets each batch size."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    yield buffer.getvalue()
+
+    async for rows in iter_export_rows(stmt, session=session):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_encode_value(v) for v in row] for row in rows)
+        if progress:
+            progress(len(rows))
+        yield buffer.getvalue()
+
+
+async def _iter_ndjson(stmt, fields: list[str]):
+    async for rows in iter_export_rows(stmt):
+        yield "".join(
+            json.dumps(dict(zip(fields, map(_encode_value, row))), ensure_ascii=False) + "\n"
+            for row in rows
+        )
+
+
+def _import_pyarrow(fmt: str):
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"format={fmt} requires the 'pyarrow' package"
+        )
+    return pyarrow
+
+
+def arrow_schema(pa, model: type[BaseModel]):
+    """Typed Arrow columns for the fields of `model`."""
+    types = {datetime: pa.timestamp("us"), int: pa.int64(), float: pa.float64()}
+    return pa.schema([
+        (name, pa.dictionary(pa.int8(), pa.string()) if name in DICTIONARY_FIELDS
+            else types.get(field.annotation, pa.string()))
+        for name, field in model.model_fields.items()
+    ])
+
+
+class _ChunkSink:
+    """Write-only file for pyarrow writers, handing out what was written since the last `drain`."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+async def _iter_columnar(pa, stmt, model: type[BaseModel], fmt: str):
+    # one record batch (Arrow IPC) or row group (Parquet) per cursor batch
+    schema = arrow_schema(pa, model)
+    sink = _ChunkSink()
+    file = pa.PythonFile(sink, mode="w")
+    if fmt == "arrow":
+        writer = pa.ipc.new_stream(file, schema, options=pa.ipc.IpcWriteOptions(compression=ARROW_COMPRESSION))
+    else:
+        writer = pa.parquet.ParquetWriter(file, schema, compression=ARROW_COMPRESSION)
+    try:
+        async for rows in iter_export_rows(stmt):
+            columns = zip(*rows)
+            batch = pa.record_batch(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema,
+            )
+            writer.write_batch(batch)
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def streaming_export(stmt, model: type[BaseModel], fmt: str, filename: str):
+    """
+    Stream the result of `stmt` as CSV, NDJSON, Arrow IPC stream or Parquet.
+    The selected columns must follow the field order of `model`.
+    """
+    fields = list(model.model_fields)
+    if fmt in ("arrow", "parquet"):
+        body = _iter_columnar(_import_pyarrow(fmt), stmt, model, fmt)
+    elif fmt == "csv":
+        body = iter_csv(stmt, fields)
+    else:
+        body = _iter_ndjson(stmt, fields)
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'}
+    )
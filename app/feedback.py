@@ -0,0 +1,59 @@
+from itertools import islice
+from sqlalchemy import update, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.models import SMS_Data
+
+
+def latest_feedback(items, key_columns):
+    """Map each (group_id[, sdt_in]) key to its feedback; the last item for a key wins."""
+    latest = {}
+    for item in items:
+        latest[tuple(getattr(item, c.key) for c in key_columns)] = item.feedback
+    return latest
+
+
+def feedback_update_stmts(batch, key_columns):
+    """
+    Build one UPDATE per distinct feedback value in `batch`, each matching
+    its keys with a single `IN` list, e.g. `(group_id, sdt_in) IN (...)`.
+    """
+    stmts = []
+    for value in (True, False):
+        keys = [key for key, feedback in batch if feedback is value]
+        if not keys:
+            continue
+        if len(key_columns) == 1:
+            target = key_columns[0].in_([key[0] for key in keys])
+        else:
+            target = tuple_(*key_columns).in_(keys)
+        stmts.append(
+            update(SMS_Data)
+            .where(target)
+            .values(feedback=value)
+            .execution_options(synchronize_session=False)
+        )
+    return stmts
+
+
+async def bulk_update_feedback(session: AsyncSession, items, key_columns, batch_size: int | None = None):
+    """
+    Apply feedback in batches of `batch_size` distinct keys, one transaction
+    per batch. Return the number of updated rows of each batch.
+    """
+    return await apply_feedback(session, latest_feedback(items, key_columns), key_columns, batch_size)
+
+
+async def apply_feedback(session: AsyncSession, latest: dict, key_columns, batch_size: int | None = None):
+    """`bulk_update_feedback` of a key -> feedback mapping that is already deduplicated."""
+    batch_size = batch_size or settings.FEEDBACK_BATCH_SIZE
+    pending = iter(latest.items())
+    counts = []
+    while batch := list(islice(pending, batch_size)):
+        updated = 0
+        for stmt in feedback_update_stmts(batch, key_columns):
+            result = await session.execute(stmt)
+            updated += result.rowcount or 0
+        await session.commit()
+        counts.append(updated)
+    return counts
@@ -0,0 +1,322 @@
+"""
+Write-behind feedback.
+
+With FEEDBACK_WRITE_BEHIND the feedback PUT routes answer 202 once the
+feedback is in an in-process buffer and in a local append-only log. The buffer
+keeps the latest feedback per `(group_id, sdt_in)` (content) or `group_id`
+(frequency), so a group toggled several times costs one update. It is flushed
+with the batched UPDATEs of `apply_feedback` every FEEDBACK_FLUSH_MS, or as
+soon as FEEDBACK_FLUSH_ITEMS keys are pending.
+
+A frequency feedback covers every row of its group: it drops the pending
+content feedback of that group, and frequency feedback is applied before
+content feedback, so the rows end up as if the writes had run in order.
+
+The log is split in segments named after the process that wrote them
+(`feedback.<segment>.<host>-<pid>.log`), each process holding an flock on its
+own `feedback.<host>-<pid>.lock` for as long as it runs. Each flush starts a
+new segment and deletes the older segments of this queue once their feedback
+is in the database; a failed flush keeps its feedback pending and its segments
+on disk. At startup a queue adopts the segments of the owners whose lock it can
+take, i.e. processes that are gone, reads them back into the buffer and deletes
+them with its first successful flush; the segments of live workers sharing the
+directory are left alone. The lock is an flock, so the directory must be on a
+local filesystem.
+
+Each accepted PUT gets a sequence number, which is in the database once
+`flushed_sequence` of `GET /internal/feedback` reaches it;
+`POST /internal/feedback/flush` flushes right away, for a client that wants
+to read its own writes.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import fcntl
+import os
+import socket
+import threading
+from datetime import datetime
+from app.admission import lane_slot
+from app.cache import result_cache
+from app.conditional import data_watermark
+from app.config import settings
+from app.db import SessionLocal
+from app.feedback import apply_feedback, latest_feedback
+from app.models import SMS_Data
+
+logger = logging.getLogger(__name__)
+
+KEY_COLUMNS = {
+    "frequency": (SMS_Data.group_id,),
+    "content": (SMS_Data.group_id, SMS_Data.sdt_in),
+}
+
+
+class FeedbackQueue:
+    def __init__(self, log_dir: str):
+        self.log_dir = log_dir
+        self.owner = f"{socket.gethostname()}-{os.getpid()}"
+        # kind -> key -> latest feedback
+        self.pending: dict[str, dict] = {kind: {} for kind in KEY_COLUMNS}
+        self.sequence = 0
+        self.flushed_sequence = 0
+        self.flushes = 0
+        self.flushed_keys = 0
+        self.updated_rows = 0
+        self.last_flush_at: datetime | None = None
+        self.last_error: str | None = None
+        self._segment = 0
+        self._fd: int | None = None
+        # closed or adopted segments whose feedback is not known to be written yet
+        self._held: list[str] = []
+        # lock file descriptors: this queue's own, and the ones of adopted owners until their segments are gone
+        self._lock_fd: int | None = None
+        self._adopted_locks: list[tuple[str, int]] = []
+        # fsync runs in a thread, the segment it syncs must not be closed under it
+        self._log_lock = threading.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._full = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def pending_keys(self):
+        return sum(len(keys) for keys in self.pending.values())
+
+    def _path(self, segment: int, owner: str | None = None):
+        return os.path.join(self.log_dir, f"feedback.{segment:012d}.{owner or self.owner}.log")
+
+    def _lock_path(self, owner: str):
+        return os.path.join(self.log_dir, f"feedback.{owner}.lock")
+
+    def _segments(self, owner: str | None = None):
+        """Segment numbers of `owner` (this queue by default), oldest first."""
+        owner = owner or self.owner
+        segments = []
+        for name in os.listdir(self.log_dir):
+            prefix, _, rest = name.partition(".")
+            segment, _, rest = rest.partition(".")
+            if prefix == "feedback" and segment.isdigit() and rest == f"{owner}.log":
+                segments.append(int(segment))
+        return sorted(segments)
+
+    def _owners(self):
+        return sorted(
+            name[len("feedback."):-len(".lock")] for name in os.listdir(self.log_dir)
+            if name.startswith("feedback.") and name.endswith(".lock")
+        )
+
+    def _try_lock(self, owner: str) -> int | None:
+        fd = os.open(self._lock_path(owner), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    def _open_segment(self):
+        self._segment += 1
+        self._fd = os.open(self._path(self._segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def _replay(self, path: str):
+        try:
+            f = open(path, encoding="utf-8")
+        except FileNotFoundError:
+            # flushed and deleted by another queue that adopted it first
+            return False
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    self._buffer(record["kind"], tuple(record["key"]), bool(record["feedback"]))
+                except (ValueError, KeyError, TypeError):
+                    # the torn last line of a crash
+                    continue
+        return True
+
+    def _buffer(self, kind: str, key: tuple, feedback: bool):
+        if kind == "frequency":
+            # covers the whole group, the group's earlier content feedback is superseded
+            content = self.pending["content"]
+            for stale in [k for k in content if k[0] == key[0]]:
+                del content[stale]
+        self.pending[kind][key] = feedback
+
+    async def start(self):
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._lock_fd = self._try_lock(self.owner)
+        if self._lock_fd is None:
+            raise RuntimeError(f"feedback log {self.log_dir} is already used by {self.owner}")
+
+        # segments of owners that are gone: this queue's own from a previous run with the same pid,
+        # and the ones of other processes whose lock is free
+        for owner in self._owners():
+            lock_fd = self._lock_fd if owner == self.owner else self._try_lock(owner)
+            if lock_fd is None:
+                continue
+            for segment in self._segments(owner):
+                path = self._path(segment, owner)
+                if self._replay(path):
+                    self._held.append(path)
+            if owner != self.owner:
+                self._adopted_locks.append((owner, lock_fd))
+        if self.pending_keys:
+            logger.info("%d feedback keys recovered from %s", self.pending_keys, self.log_dir)
+
+        segments = self._segments()
+        self._segment = segments[-1] if segments else 0
+        self._open_segment()
+        self._task = asyncio.create_task(self._run(), context=contextvars.Context())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # what cannot be written now stays in the log for the next start
+        await self.flush()
+        with self._log_lock:
+            os.close(self._fd)
+            self._fd = None
+        if not self.pending_keys:
+            # everything is written, nothing for the next start to adopt
+            os.remove(self._path(self._segment))
+            os.remove(self._lock_path(self.owner))
+        for _, lock_fd in self._adopted_locks:
+            os.close(lock_fd)
+        self._adopted_locks = []
+        os.close(self._lock_fd)
+        self._lock_fd = None
+
+    async def enqueue(self, kind: str, items):
+        """Buffer and log the feedback of one PUT; return (distinct keys, sequence number)."""
+        latest = latest_feedback(items, KEY_COLUMNS[kind])
+        data = "".join(
+            json.dumps({"kind": kind, "key": list(key), "feedback": feedback}, ensure_ascii=False) + "\n"
+            for key, feedback in latest.items()
+        ).encode()
+        # logged and buffered without yielding, the log keeps the buffer's write order
+        os.write(self._fd, data)
+        for key, feedback in latest.items():
+            self._buffer(kind, key, feedback)
+        self.sequence += 1
+        sequence = self.sequence
+
+        if settings.FEEDBACK_LOG_FSYNC:
+            await asyncio.to_thread(self._sync)
+        if self.pending_keys >= settings.FEEDBACK_FLUSH_ITEMS:
+            self._full.set()
+        return len(latest), sequence
+
+    def _sync(self):
+        with self._log_lock:
+            os.fsync(self._fd)
+
+    def _rotate(self):
+        # a segment is synced before it is closed, the feedback written to it may still await its own sync
+        with self._log_lock:
+            os.fsync(self._fd)
+            os.close(self._fd)
+            self._held.append(self._path(self._segment))
+            self._open_segment()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), settings.FEEDBACK_FLUSH_MS / 1000)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("feedback flush failed")
+
+    async def flush(self) -> bool:
+        """Apply the pending feedback. False when it failed, the feedback then stays pending and logged."""
+        async with self._flush_lock:
+            self._full.clear()
+            if not self.pending_keys:
+                # adopted segments holding nothing still pending
+                self._release(list(self._held))
+                return True
+            self._rotate()
+            # the held segments hold nothing newer than this batch
+            applied = list(self._held)
+            batch, self.pending = self.pending, {kind: {} for kind in KEY_COLUMNS}
+            sequence = self.sequence
+
+            try:
+                updated = 0
+                async with lane_slot("feedback", bounded=False), SessionLocal() as session:
+                    # pending content feedback is newer than its group's frequency feedback
+                    for kind in ("frequency", "content"):
+                        if batch[kind]:
+                            updated += sum(await apply_feedback(session, batch[kind], KEY_COLUMNS[kind]))
+            except BaseException as exc:
+                self._restore(batch)
+                if not isinstance(exc, Exception):
+                    raise
+                logger.exception("feedback flush of %d keys failed", sum(len(keys) for keys in batch.values()))
+                self.last_error = str(exc)
+                return False
+
+            self.flushes += 1
+            self.flushed_keys += sum(len(keys) for keys in batch.values())
+            self.updated_rows += updated
+            self.flushed_sequence = sequence
+            self.last_flush_at, self.last_error = datetime.now(), None
+            self._release(applied)
+
+            await result_cache.invalidate({key[0] for keys in batch.values() for key in keys})
+            data_watermark.bump_feedback()
+            return True
+
+    def _release(self, paths: list[str]):
+        """Delete segments whose feedback is written, then let go of the adopted owners."""
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._held = [path for path in self._held if path not in paths]
+        # the adopted owners have no segment left
+        for owner, lock_fd in self._adopted_locks:
+            try:
+                os.remove(self._lock_path(owner))
+            except FileNotFoundError:
+                pass
+            os.close(lock_fd)
+        self._adopted_locks = []
+
+    def _restore(self, batch: dict):
+        # feedback written since the batch was taken wins over it
+        frequency = self.pending["frequency"]
+        for kind, keys in batch.items():
+            pending = self.pending[kind]
+            for key, feedback in keys.items():
+                if key in pending or (kind == "content" and (key[0],) in frequency):
+                    continue
+                pending[key] = feedback
+
+    def status(self):
+        return {
+            "enabled": settings.FEEDBACK_WRITE_BEHIND,
+            "pending": {kind: len(keys) for kind, keys in self.pending.items()},
+            "sequence": self.sequence,
+            "flushed_sequence": self.flushed_sequence,
+            "flushes": self.flushes,
+            "flushed_keys": self.flushed_keys,
+            "updated_rows": self.updated_rows,
+            "last_flush_at": self.last_flush_at,
+            "last_error": self.last_error,
+            "owner": self.owner,
+            "log_segments": len(self._held) + (self._fd is not None),
+        }
+
+
+feedback_queue = FeedbackQueue(settings.FEEDBACK_LOG_DIR)
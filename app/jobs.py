@@ -0,0 +1,230 @@
+"""
+Asynchronous export jobs written to compressed CSV files.
+
+A job runs the export statement of `/content/export` or `/frequency/export`
+on one of EXPORT_JOB_WORKERS workers and writes gzip or zstd CSV to
+EXPORT_SPOOL_DIR, where it is served with Range support. The job id is a
+hash of the kind, compression and normalized filters, so submitting the same
+export again returns the queued, running or finished job instead of a new
+one. Finished files are kept for EXPORT_JOB_TTL_SECONDS, expired ones are
+removed whenever jobs are looked up; a JSON sidecar per file lets them survive
+a restart.
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import zlib
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+from fastapi import HTTPException, status
+from app.admission import lane_slot
+from app.config import settings
+from app.replicas import read_session
+from app.export import iter_csv
+from app.schemas import ExportJob
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {"gzip": ".csv.gz", "zstd": ".csv.zst"}
+MEDIA_TYPES = {"gzip": "application/gzip", "zstd": "application/zstd"}
+
+
+def job_id(kind: str, compression: str, params: dict):
+    raw = json.dumps(
+        [kind, compression, sorted(params.items())],
+        default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v),
+    )
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def _compressor(compression: str):
+    if compression == "gzip":
+        return zlib.compressobj(wbits=31)
+    try:
+        import zstandard
+    except ImportError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="zstd compression requires the 'zstandard' package"
+        )
+    return zstandard.ZstdCompressor().compressobj()
+
+
+class Job:
+    def __init__(self, job_id: str, kind: str, compression: str, build=None, fields=None):
+        self.job_id = job_id
+        self.kind = kind
+        self.compression = compression
+        # async (session) -> select statement, its columns follow `fields`
+        self.build: Callable[..., Awaitable] | None = build
+        self.fields: list[str] | None = fields
+        self.status = "queued"
+        self.rows = 0
+        self.bytes = 0
+        self.created_at = datetime.now()
+        self.finished_at: datetime | None = None
+        self.error: str | None = None
+
+    @property
+    def filename(self):
+        return f"{self.kind}_export_{self.job_id}{EXTENSIONS[self.compression]}"
+
+    def info(self):
+        return ExportJob(
+            job_id=self.job_id,
+            kind=self.kind,
+            status=self.status,
+            compression=self.compression,
+            rows=self.rows,
+            bytes=self.bytes,
+            created_at=self.created_at,
+            finished_at=self.finished_at,
+            error=self.error,
+            download_url=f"/{self.kind}/export/jobs/{self.job_id}/download" if self.status == "done" else None,
+        )
+
+
+class ExportJobs:
+    def __init__(self, spool_dir: str, workers: int, queue_size: int, ttl_seconds: float):
+        self.spool_dir = spool_dir
+        self.workers = workers
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.jobs: dict[str, Job] = {}
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks: list[asyncio.Task] = []
+        self._loaded = False
+
+    def path(self, job: Job):
+        return os.path.join(self.spool_dir, job.job_id + EXTENSIONS[job.compression])
+
+    def _sidecar(self, job_id: str):
+        return os.path.join(self.spool_dir, job_id + ".json")
+
+    def _load(self):
+        # finished jobs of a previous process
+        self._loaded = True
+        os.makedirs(self.spool_dir, exist_ok=True)
+        for name in os.listdir(self.spool_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.spool_dir, name)) as f:
+                    info = ExportJob.model_validate_json(f.read())
+            except (OSError, ValueError):
+                continue
+            job = Job(info.job_id, info.kind, info.compression)
+            job.status, job.rows, job.bytes = info.status, info.rows, info.bytes
+            job.created_at, job.finished_at = info.created_at, info.finished_at
+            if os.path.exists(self.path(job)):
+                self.jobs[job.job_id] = job
+        # files that expired while no process was running
+        self._sweep()
+
+    def _sweep(self):
+        now = datetime.now()
+        for job in [j for j in self.jobs.values() if j.finished_at and now - j.finished_at > self.ttl]:
+            del self.jobs[job.job_id]
+            for path in (self.path(job), self._sidecar(job.job_id)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def get(self, job_id: str, kind: str):
+        if not self._loaded:
+            self._load()
+        self._sweep()
+        job = self.jobs.get(job_id)
+        if job is None or job.kind != kind:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Export job not found.")
+        return job
+
+    def submit(self, kind: str, compression: str, params: dict, build, fields: list[str]):
+        """Queue an export, or return the job of an identical one that did not fail."""
+        if not self._loaded:
+            self._load()
+        self._sweep()
+        _compressor(compression)
+
+        key = job_id(kind, compression, params)
+        job = self.jobs.get(key)
+        if job is not None and job.status != "failed":
+            return job
+
+        job = Job(key, kind, compression, build, fields)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Export queue is full, retry later."
+            )
+        self.jobs[key] = job
+        if not self._tasks:
+            # fresh contexts, so the workers are not accounted to the request that started them
+            self._tasks = [
+                asyncio.create_task(self._work(), context=contextvars.Context())
+                for _ in range(self.workers)
+            ]
+        return job
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                # exports share the export lane with /export requests
+                async with lane_slot("export", bounded=False):
+                    await self._run(job)
+            except Exception as exc:
+                logger.exception("export job %s failed", job.job_id)
+                try:
+                    os.remove(self.path(job) + ".part")
+                except FileNotFoundError:
+                    pass
+                job.status, job.error = "failed", str(exc)
+                job.finished_at = datetime.now()
+            finally:
+                job.build = None
+                self._queue.task_done()
+
+    async def _run(self, job: Job):
+        job.status = "running"
+        path = self.path(job)
+        part = path + ".part"
+        compressor = _compressor(job.compression)
+
+        def progress(n: int):
+            job.rows += n
+
+        def write(f, data: bytes):
+            data = compressor.compress(data)
+            f.write(data)
+            return len(data)
+
+        # the statement is built and streamed on one replica session
+        with open(part, "wb") as f:
+            async with read_session() as session:
+                stmt = await job.build(session)
+                async for chunk in iter_csv(stmt, job.fields, progress, session):
+                    # compression and disk writes stay off the event loop
+                    job.bytes += await asyncio.to_thread(write, f, chunk.encode())
+            tail = compressor.flush()
+            f.write(tail)
+            job.bytes += len(tail)
+        os.replace(part, path)
+
+        job.status = "done"
+        job.finished_at = datetime.now()
+        with open(self._sidecar(job.job_id), "w") as f:
+            f.write(job.info().model_dump_json())
+
+
+export_jobs = ExportJobs(
+    settings.EXPORT_SPOOL_DIR,
+    settings.EXPORT_JOB_WORKERS,
+    settings.EXPORT_JOB_QUEUE_SIZE,
+    settings.EXPORT_JOB_TTL_SECONDS,
+)
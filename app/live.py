@@ -0,0 +1,268 @@
+"""
+Live grouped spam updates over Server-Sent Events.
+
+One background task serves every subscriber. Each tick it aggregates only
+the rows with `ts` in (watermark, now - LIVE_LATENESS_SECONDS] into
+per-minute partials, drops the minutes that left the window, and compares
+the groups whose totals changed with what subscribers last saw:
+
+    enter   a group crossed the 20/30 frequency thresholds
+    update  a qualified group's frequency/first message changed
+    label   a qualified group's label flipped
+    leave   a group no longer qualifies (its rows left the window)
+
+A subscriber first receives a `snapshot` of every qualified group, then one
+`delta` event per tick with changes. The task stops with the last subscriber.
+Window edges move by whole minutes; rows later than the lateness grace are
+not picked up.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, func, case
+from app.config import settings
+from app.replicas import read_session
+from app.metrics import stage
+from app.models import SMS_Data
+from app.rollup import AGG_MESSAGE_KEY, floor_minute
+from app.serialization import json_datetime
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("content", "frequency")
+
+
+class Partial:
+    """Aggregates of one group over some rows, mergeable like the rollup buckets."""
+
+    __slots__ = ("first_ts", "frequency", "agg_key", "agg_message", "spam_count", "not_spam_count")
+
+    def __init__(self, first_ts, frequency, agg_key, agg_message, spam_count, not_spam_count):
+        self.first_ts = first_ts
+        self.frequency = frequency
+        self.agg_key = agg_key
+        self.agg_message = agg_message
+        self.spam_count = spam_count
+        self.not_spam_count = not_spam_count
+
+    def merge(self, other: "Partial"):
+        self.first_ts = min(self.first_ts, other.first_ts)
+        self.frequency += other.frequency
+        if other.agg_key is not None and (self.agg_key is None or other.agg_key < self.agg_key):
+            self.agg_key, self.agg_message = other.agg_key, other.agg_message
+        self.spam_count += other.spam_count
+        self.not_spam_count += other.not_spam_count
+
+    def copy(self):
+        return Partial(*(getattr(self, name) for name in self.__slots__))
+
+
+def _qualified(total: Partial | None, key: dict):
+    """The listing row of a group, None when it does not pass the spam/not_spam thresholds."""
+    if total is None:
+        return None
+    spam = total.frequency >= 20 and total.spam_count > total.not_spam_count
+    not_spam = total.frequency >= 30 and total.spam_count <= total.not_spam_count
+    if not (spam or not_spam):
+        return None
+    return {
+        **key,
+        "frequency": int(total.frequency),
+        "ts": json_datetime(total.first_ts),
+        "agg_message": total.agg_message,
+        "label": "spam" if total.spam_count >= total.not_spam_count else "not_spam",
+    }
+
+
+def _as_datetime(value):
+    # date_trunc comes back as text from some drivers
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+def _event(name: str, payload):
+    return f"event: {name}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+class LiveFeed:
+    def __init__(self):
+        self.subscribers = {kind: set() for kind in KINDS}
+        self._task: asyncio.Task | None = None
+        self._reset()
+
+    def _reset(self):
+        self.watermark: datetime | None = None
+        # minute -> (group_id, sdt_in) -> Partial
+        self.buckets: dict[datetime, dict[tuple, Partial]] = {}
+        self.phones: dict[str, set[str]] = defaultdict(set)
+        self.groups = {kind: {} for kind in KINDS}
+
+    # --- subscribers ---
+
+    def subscribe(self, kind: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=settings.LIVE_QUEUE_SIZE)
+        self.subscribers[kind].add(queue)
+        if self.watermark is not None:
+            queue.put_nowait(self._snapshot(kind))
+        if self._task is None:
+            # a fresh context, so the task is not accounted to the request that started it
+            self._task = asyncio.create_task(self._run(), context=contextvars.Context())
+        return queue
+
+    def unsubscribe(self, kind: str, queue: asyncio.Queue):
+        self.subscribers[kind].discard(queue)
+        if self._task is not None and not any(self.subscribers.values()):
+            self._task.cancel()
+            self._task = None
+            self._reset()
+
+    def _snapshot(self, kind: str):
+        return "snapshot", {
+            "watermark": self.watermark.isoformat(),
+            "groups": list(self.groups[kind].values()),
+        }
+
+    def _publish(self, kind: str, message):
+        for queue in self.subscribers[kind]:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # a slow reader skips the backlog and starts over from the current state
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self._snapshot(kind))
+
+    async def stream(self, kind: str):
+        queue = self.subscribe(kind)
+        try:
+            while True:
+                try:
+                    name, payload = await asyncio.wait_for(queue.get(), settings.LIVE_HEARTBEAT_SECONDS)
+                except TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield _event(name, payload)
+        finally:
+            self.unsubscribe(kind, queue)
+
+    # --- incremental aggregation ---
+
+    async def _run(self):
+        while True:
+            try:
+                async with read_session() as session:
+                    with stage("live_tick"):
+                        await self.tick(session)
+            except Exception:
+                logger.exception("live feed tick failed")
+            await asyncio.sleep(settings.LIVE_TICK_SECONDS)
+
+    async def tick(self, session, now: datetime | None = None):
+        end = (now or datetime.now()) - timedelta(seconds=settings.LIVE_LATENESS_SECONDS)
+        cutoff = floor_minute(end - timedelta(seconds=settings.LIVE_WINDOW_SECONDS))
+        since = (
+            SMS_Data.ts > self.watermark if self.watermark is not None
+            else SMS_Data.ts >= cutoff
+        )
+
+        bucket = func.date_trunc("minute", SMS_Data.ts)
+        result = await session.execute(
+            select(
+                bucket.label("bucket"),
+                SMS_Data.group_id,
+                SMS_Data.sdt_in,
+                func.min(SMS_Data.ts).label("first_ts"),
+                func.count().label("frequency"),
+                func.min(AGG_MESSAGE_KEY).label("agg_key"),
+                func.min_by(SMS_Data.text_sms, AGG_MESSAGE_KEY).label("agg_message"),
+                func.sum(case((SMS_Data.predicted_label == 'spam', 1), else_=0)).label("spam_count"),
+                func.sum(case((SMS_Data.predicted_label == 'not_spam', 1), else_=0)).label("not_spam_count"),
+            )
+            .where(since, SMS_Data.ts <= end)
+            .group_by(bucket, SMS_Data.group_id, SMS_Data.sdt_in)
+        )
+
+        touched = set()
+        for r in result:
+            key = (r.group_id, r.sdt_in)
+            partial = Partial(r.first_ts, r.frequency, r.agg_key, r.agg_message, r.spam_count, r.not_spam_count)
+            minute = self.buckets.setdefault(_as_datetime(r.bucket), {})
+            if key in minute:
+                minute[key].merge(partial)
+            else:
+                minute[key] = partial
+            self.phones[r.group_id].add(r.sdt_in)
+            touched.add(key)
+
+        for minute in [m for m in self.buckets if m < cutoff]:
+            touched.update(self.buckets.pop(minute))
+
+        bootstrap = self.watermark is None
+        self.watermark = end
+        changes = self._apply(touched)
+        for kind in KINDS:
+            if bootstrap:
+                self._publish(kind, self._snapshot(kind))
+            elif changes[kind]:
+                self._publish(kind, ("delta", {"watermark": end.isoformat(), "changes": changes[kind]}))
+
+    def _total(self, keys):
+        total = None
+        for minute in self.buckets.values():
+            for key in keys:
+                partial = minute.get(key)
+                if partial is None:
+                    continue
+                if total is None:
+                    total = partial.copy()
+                else:
+                    total.merge(partial)
+        return total
+
+    def _apply(self, touched: set[tuple]):
+        changes = {kind: [] for kind in KINDS}
+        touched_groups = set()
+        for group_id, sdt_in in touched:
+            total = self._total([(group_id, sdt_in)])
+            if total is None:
+                self.phones[group_id].discard(sdt_in)
+            self._diff("content", (group_id, sdt_in), _qualified(total, {"group_id": group_id, "sdt_in": sdt_in}), changes)
+            touched_groups.add(group_id)
+
+        for group_id in touched_groups:
+            phones = self.phones.get(group_id)
+            total = self._total([(group_id, sdt_in) for sdt_in in phones]) if phones else None
+            if not phones:
+                self.phones.pop(group_id, None)
+            self._diff("frequency", group_id, _qualified(total, {"group_id": group_id}), changes)
+        return changes
+
+    def _diff(self, kind: str, key, row: dict | None, changes: dict):
+        current = self.groups[kind]
+        previous = current.get(key)
+        if row is None:
+            if previous is not None:
+                del current[key]
+                changes[kind].append({"type": "leave", **{k: previous[k] for k in ("group_id", "sdt_in") if k in previous}})
+            return
+        current[key] = row
+        if previous is None:
+            changes[kind].append({"type": "enter", **row})
+        elif previous["label"] != row["label"]:
+            changes[kind].append({"type": "label", **row})
+        elif previous != row:
+            changes[kind].append({"type": "update", **row})
+
+
+live_feed = LiveFeed()
+
+
+def live_response(kind: str):
+    return StreamingResponse(
+        live_feed.stream(kind),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,11 +1,56 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.routers import content
 from app.routers import frequency
+from app.routers import internal
+from app.routers import metrics
+from app.routers import batch
 from fastapi.exceptions import HTTPException
 from fastapi.requests import Request
 from fastapi.responses import JSONResponse
+from app.config import settings
+from app.db import engine, warm_up_pool
+from app.replicas import replica_set
+from app.rollup import refresh_loop
+from app.search import check_columns
+from app.window import window_store
+from app.feedback_queue import feedback_queue
+from app.metrics import MetricsMiddleware
+from app.budget import BudgetMiddleware
+from app.admission import AdmissionMiddleware
+from app.compression import CompressionMiddleware
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await warm_up_pool(settings.DB_POOL_WARMUP)
+    await check_columns()
+    await replica_set.start()
+    if settings.WINDOW_STORE_ENABLED:
+        await window_store.start()
+    if settings.FEEDBACK_WRITE_BEHIND:
+        await feedback_queue.start()
+    if settings.ROLLUP_REFRESH_IN_APP:
+        await refresh_loop.start()
+    yield
+    await refresh_loop.stop()
+    await feedback_queue.stop()
+    await window_store.stop()
+    await replica_set.stop()
+    await engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
+# innermost, a streamed export is compressed as its chunks come out of the handler
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+# queue waits count against the time budget, a disconnect while queued leaves the queue
+if settings.ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware)
+# inside the metrics middleware, so budget timeouts are recorded with their 504
+app.add_middleware(BudgetMiddleware)
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
@@ -37,6 +82,9 @@ async def http_exception_handler(request: Request, exc: HTTPException):
 
 app.include_router(content.router)
 app.include_router(frequency.router)
+app.include_router(internal.router)
+app.include_router(metrics.router)
+app.include_router(batch.router)
 
 @app.get("/")
 def root():
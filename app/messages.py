@@ -0,0 +1,39 @@
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.metrics import stage
+from app.models import SMS_Data
+from app.schemas import BasePaginatedResponseMessages, MessageCount
+
+
+async def group_messages(session: AsyncSession, filters, page: int, page_size: int):
+    """
+    One page of the distinct messages of a group (rows matching `filters`),
+    most frequent first, in the order of the top messages embedded in the listings.
+    """
+    count = func.count().label("count")
+    stmt = (
+        select(SMS_Data.text_sms, count, func.count().over().label("messages_total"))
+        .where(*filters)
+        .group_by(SMS_Data.text_sms)
+        .order_by(count.desc(), SMS_Data.text_sms)
+        .offset((page - 1) * page_size)
+        .limit(page_size)
+    )
+    with stage("messages_query"):
+        rows = (await session.execute(stmt)).all()
+
+    if not rows:
+        return BasePaginatedResponseMessages(
+            status_code=200, message="No data found", data=[], error=False, error_message="",
+            page=page, limit=page_size, total=0
+        )
+    return BasePaginatedResponseMessages(
+        status_code=200,
+        message="Success",
+        data=[MessageCount(text_sms=r.text_sms, count=r.count) for r in rows],
+        error=False,
+        error_message="",
+        page=page,
+        limit=page_size,
+        total=rows[0].messages_total
+    )
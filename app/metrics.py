@@ -0,0 +1,260 @@
+"""
+Request, stage and query metrics in the Prometheus text format.
+
+Handlers mark their Python stages with `stage(name)`. Statements executed
+while a stage is active are timed by the engine's cursor events and labelled
+with the endpoint and the stage. `/metrics` renders everything; a request
+sent with the debug header gets its own breakdown in a Server-Timing header.
+"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from starlette.routing import Match
+from app.config import settings
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = ""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, labels: tuple = (), amount: float = 1):
+        self.inc(labels, -amount)
+
+    def set(self, labels: tuple, value: float):
+        self.values[labels] = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, labels: tuple, value: float):
+        # [per-bucket counts..., +Inf count, sum]
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for labels, series in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series):
+                cumulative += count
+                le = 'le="{}"'.format(bound if bound == "+Inf" else _number(bound))
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time from request start to the end of the response body.",
+    ("endpoint", "status"),
+)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being handled.", ("endpoint",))
+STAGE_DURATION = Histogram(
+    "app_stage_duration_seconds", "Time spent in a handler stage, database time included.",
+    ("endpoint", "stage"),
+)
+QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Statement execution time, from cursor execute to its return.",
+    ("endpoint", "stage"),
+)
+QUERY_ROWS = Counter(
+    "db_rows_returned_total", "Rows returned or affected, as reported by the driver's rowcount.",
+    ("endpoint", "stage"),
+)
+QUERIES_IN_FLIGHT = Gauge("db_queries_in_flight", "Statements being executed.", ("endpoint", "stage"))
+REQUEST_CANCELLATIONS = Counter(
+    "app_request_cancellations_total", "Requests cut short by their time budget or a client disconnect.",
+    ("endpoint", "reason"),
+)
+QUERIES_KILLED = Counter(
+    "db_queries_killed_total", "KILL QUERY sent for the connections of a cancelled request.", ("endpoint",)
+)
+ADMISSION_ACTIVE = Gauge("app_admission_active", "Requests running in an admission lane.", ("lane",))
+ADMISSION_WAITING = Gauge("app_admission_waiting", "Requests queued for an admission lane.", ("lane",))
+ADMISSION_REJECTED = Counter(
+    "app_admission_rejected_total", "Requests turned away because their lane queue was full.", ("lane",)
+)
+
+REGISTRY = (
+    REQUEST_DURATION, REQUESTS_IN_FLIGHT, STAGE_DURATION, QUERY_DURATION, QUERY_ROWS, QUERIES_IN_FLIGHT,
+    REQUEST_CANCELLATIONS, QUERIES_KILLED, ADMISSION_ACTIVE, ADMISSION_WAITING, ADMISSION_REJECTED,
+)
+
+
+def render_metrics():
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+class RequestTimings:
+    """Stage and query timings of one request, summed per name for the Server-Timing header."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.entries = {}
+
+    def add(self, name: str, seconds: float):
+        total, count = self.entries.get(name, (0.0, 0))
+        self.entries[name] = (total + seconds, count + 1)
+
+    def server_timing(self):
+        parts = [
+            f'{name};dur={total * 1000:.3f};desc="{count}x"'
+            for name, (total, count) in self.entries.items()
+        ]
+        parts.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.3f}")
+        return ", ".join(parts)
+
+
+_request: ContextVar[RequestTimings | None] = ContextVar("request_timings", default=None)
+_stage: ContextVar[str] = ContextVar("stage", default="unstaged")
+
+
+def current_endpoint():
+    timings = _request.get()
+    return timings.endpoint if timings else "background"
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block of a handler; statements executed inside it are labelled with `name`."""
+    token = _stage.set(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _stage.reset(token)
+        timings = _request.get()
+        STAGE_DURATION.observe((current_endpoint(), name), elapsed)
+        if timings:
+            timings.add(f"stage.{name}", elapsed)
+
+
+def instrument_engine(engine):
+    """Time every statement of an (async) engine with its endpoint and stage."""
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        labels = (current_endpoint(), _stage.get())
+        QUERIES_IN_FLIGHT.inc(labels)
+        conn.info.setdefault("query_start", []).append((labels, time.perf_counter()))
+
+    def _finish(conn, cursor=None):
+        labels, start = conn.info["query_start"].pop()
+        elapsed = time.perf_counter() - start
+        QUERIES_IN_FLIGHT.dec(labels)
+        QUERY_DURATION.observe(labels, elapsed)
+        if cursor is not None and cursor.rowcount >= 0:
+            QUERY_ROWS.inc(labels, cursor.rowcount)
+        timings = _request.get()
+        if timings:
+            timings.add(f"db.{labels[1]}", elapsed)
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        _finish(conn, cursor)
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        # cursor is unset when the statement failed before it got one
+        if conn is not None and getattr(exception_context, "cursor", None) is not None and conn.info.get("query_start"):
+            _finish(conn)
+
+
+def _endpoint_of(scope):
+    """'METHOD /route/path' of the route that will handle the request."""
+    app = scope.get("app")
+    for route in getattr(app, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return f"{scope['method']} {route.path}"
+    return f"{scope['method']} unmatched"
+
+
+class MetricsMiddleware:
+    """Request duration and in-flight metrics, plus the per-request breakdown when asked for."""
+
+    def __init__(self, app):
+        self.app = app
+        self.debug_header = settings.METRICS_DEBUG_HEADER.lower().encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings(_endpoint_of(scope))
+        debug = any(name == self.debug_header for name, _ in scope["headers"])
+        status = 500
+
+        async def send_with_timings(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if debug:
+                    headers = [*message.get("headers", ()), (b"server-timing", timings.server_timing().encode())]
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        token = _request.set(timings)
+        REQUESTS_IN_FLIGHT.inc((timings.endpoint,))
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            REQUESTS_IN_FLIGHT.dec((timings.endpoint,))
+            REQUEST_DURATION.observe((timings.endpoint, str(status)), time.perf_counter() - timings.start)
+            _request.reset(token)
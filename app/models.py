@@ -1,11 +1,31 @@
 from datetime import datetime
-from sqlalchemy import Column, String, DateTime, Boolean, create_engine
+from sqlalchemy import Column, Computed, String, DateTime, Boolean, BigInteger, Numeric, create_engine, literal_column
 from sqlalchemy.orm import declarative_base
 from app.config import settings
+from app.phone import canonical_phone_sql, reversed_phone_sql
 
 Base = declarative_base()
 
 
+def text_sms_lower_column():
+    # generated by the database, carries the keyword n-gram index (see app/search.py)
+    return Column("text_sms_lower", String(500), Computed("lower(text_sms)", persisted=True), nullable=True)
+
+
+def phone_columns():
+    # generated by the database, canonical sdt_in and its reverse for phone matching (see app/phone.py)
+    return (
+        Column(
+            "sdt_in_canonical", String(100), Computed(canonical_phone_sql(literal_column("sdt_in")), persisted=True),
+            nullable=True, index=True
+        ),
+        Column(
+            "sdt_in_reversed", String(100), Computed(reversed_phone_sql(literal_column("sdt_in")), persisted=True),
+            nullable=True, index=True
+        ),
+    )
+
+
 class SMS_Data(Base):
     __tablename__ = settings.TABLE_NAME
 
@@ -20,4 +40,41 @@ class SMS_Data(Base):
     llm_label = Column(String(100), nullable=True)
     confidence = Column(String(100), nullable=True)
     feedback = Column(Boolean, nullable=True)
+    # only declared when used, `python -m app.search init` adds them to an existing table
+    if settings.KEYWORD_SEARCH == "ngram":
+        text_sms_lower = text_sms_lower_column()
+    if settings.PHONE_INDEXED:
+        sdt_in_canonical, sdt_in_reversed = phone_columns()
+
+
+# Per-minute partial aggregates of SMS_Data, maintained by app/rollup.py
+class SMS_Rollup(Base):
+    __tablename__ = f"{settings.TABLE_NAME}_rollup_minute"
+
+    bucket = Column(DateTime, primary_key=True)
+    group_id = Column(String(100), primary_key=True)
+    sdt_in = Column(String(100), primary_key=True)
+
+    first_ts = Column(DateTime)
+    frequency = Column(BigInteger)
+    agg_message = Column(String(500), nullable=True)
+    agg_key = Column(Numeric(38, 0), nullable=True)
+    spam_count = Column(BigInteger)
+    not_spam_count = Column(BigInteger)
+
+
+# Rollup coverage: buckets in [covered_from, watermark) are complete
+class Rollup_State(Base):
+    __tablename__ = f"{settings.TABLE_NAME}_rollup_state"
+
+    name = Column(String(100), primary_key=True)
+    covered_from = Column(DateTime)
+    watermark = Column(DateTime)
+
+
+# Written on the primary and read back from the replicas to measure their lag (see app/replicas.py)
+class Replica_Heartbeat(Base):
+    __tablename__ = f"{settings.TABLE_NAME}_heartbeat"
 
+    name = Column(String(100), primary_key=True)
+    ts = Column(DateTime)
@@ -0,0 +1,99 @@
+"""
+Phone number matching on sdt_in.
+
+Numbers are compared in a canonical form: digits only, with the
+international (00) and national (0) prefixes rewritten to the country code,
+so +84 912 345 678, 0912345678 and 84912345678 are the same number. The
+canonical value and its reverse are generated columns of SMS_Data with
+PHONE_INDEXED (see `python -m app.search init`), so exact, prefix and suffix
+matches are index lookups; with PHONE_INDEXED off the same expressions are
+computed inline. A suffix is matched on the digits as typed ("0678"), unless
+it is a whole number (leading "+", or a national number with its trunk 0),
+which is made canonical first.
+"""
+import re
+from typing import Literal
+from fastapi import HTTPException
+from sqlalchemy import case, func
+from app.config import settings
+
+PhoneMatch = Literal["exact", "prefix", "suffix", "contains"]
+# digits from which a suffix starting with 0 is a whole national number (trunk 0 + subscriber number)
+NATIONAL_NUMBER_DIGITS = 10
+
+
+def canonical_phone(value: str):
+    """Python twin of `canonical_phone_sql`, applied to the searched number."""
+    digits = re.sub(r"[^0-9]", "", value)
+    if digits.startswith("00"):
+        return digits[2:]
+    if digits.startswith("0"):
+        return settings.PHONE_COUNTRY_CODE + digits[1:]
+    return digits
+
+
+def canonical_phone_sql(column):
+    digits = func.regexp_replace(column, "[^0-9]", "")
+    return case(
+        (func.substr(digits, 1, 2) == "00", func.substr(digits, 3)),
+        (func.substr(digits, 1, 1) == "0", func.concat(settings.PHONE_COUNTRY_CODE, func.substr(digits, 2))),
+        else_=digits,
+    )
+
+
+def reversed_phone_sql(column):
+    return func.reverse(canonical_phone_sql(column))
+
+
+def _suffix_digits(phone_num: str):
+    # the last digits as typed, unless they are a whole number: "0678" stays, "0912 345 678" is canonical
+    digits = re.sub(r"[^0-9]", "", phone_num)
+    whole = phone_num.lstrip().startswith("+") or (digits.startswith("0") and len(digits) >= NATIONAL_NUMBER_DIGITS)
+    return canonical_phone(phone_num) if whole else digits
+
+
+def _match_value(phone_num: str, match: PhoneMatch):
+    # canonical digits of the searched number, reversed for suffix matches against the reversed column
+    value = _suffix_digits(phone_num)[::-1] if match == "suffix" else canonical_phone(phone_num)
+    if not value:
+        raise HTTPException(status_code=400, detail=f"phone_num has no digits to {match}-match.")
+    return value
+
+
+def phone_filter(model, phone_num: str, match: PhoneMatch = "contains"):
+    """
+    Filter `model.sdt_in` by `phone_num`. Models without the generated
+    columns (e.g. the rollup) get the expressions computed inline.
+    """
+    if match == "contains":
+        return model.sdt_in.ilike(f"%{phone_num}%")
+
+    indexed = settings.PHONE_INDEXED and hasattr(model, "sdt_in_canonical")
+    value = _match_value(phone_num, match)
+    if match == "suffix":
+        column = model.sdt_in_reversed if indexed else reversed_phone_sql(model.sdt_in)
+    else:
+        column = model.sdt_in_canonical if indexed else canonical_phone_sql(model.sdt_in)
+
+    # LIKE, not =, also for exact: the StarRocks n-gram index only prunes LIKE
+    return column.like(value if match == "exact" else f"{value}%")
+
+
+def phone_predicate(phone_num: str, match: PhoneMatch = "contains"):
+    """
+    Python twin of `phone_filter` for rows held in memory (see app/window.py):
+    a test of one sdt_in value, None when only the database can tell.
+    """
+    if match == "contains":
+        # LIKE wildcards and non-ASCII case folding are left to the database
+        if not phone_num.isascii() or any(c in phone_num for c in "%_\\"):
+            return None
+        needle = phone_num.lower()
+        return lambda sdt_in: sdt_in is not None and needle in sdt_in.lower()
+
+    value = _match_value(phone_num, match)
+    if match == "suffix":
+        return lambda sdt_in: sdt_in is not None and canonical_phone(sdt_in)[::-1].startswith(value)
+    if match == "prefix":
+        return lambda sdt_in: sdt_in is not None and canonical_phone(sdt_in).startswith(value)
+    return lambda sdt_in: sdt_in is not None and canonical_phone(sdt_in) == value
@@ -0,0 +1,185 @@
+"""
+Read replica routing.
+
+The GET listing and export routes take their session from `get_read_session`,
+which picks a replica in rotation (round-robin or least connections); the
+feedback PUT routes keep `get_session` on the primary. Every
+DB_REPLICA_LAG_CHECK_SECONDS the primary writes a heartbeat row and each
+replica's copy of it is read back: a replica whose copy is older than
+DB_REPLICA_MAX_LAG_SECONDS, or that cannot be read, leaves the rotation until
+it catches up. With no replica in rotation reads go to the primary. Where the
+database does not replicate on its own (the benchmark stand-in), `replicate`
+is handed each heartbeat written on the primary to copy it to the replicas.
+
+    python -m app.replicas init     # create the heartbeat table on the primary
+"""
+import argparse
+import asyncio
+import contextvars
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Awaitable, Callable
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app.config import settings
+from app.db import SessionLocal, engine, make_engine
+from app.models import Base, Replica_Heartbeat
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_NAME = "primary"
+
+
+class Replica:
+    def __init__(self, url: str):
+        url = make_url(url)
+        self.name = f"{url.host}:{url.port}" if url.host else url.database
+        # a plain pool: the wait stats of /internal/pool stay the primary's
+        self.engine = make_engine(url, poolclass=AsyncAdaptedQueuePool)
+        self.sessions = async_sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False, class_=AsyncSession)
+        self.in_use = 0
+        self.served = 0
+        self.lag: float | None = None
+        self.error: str | None = None
+
+    @property
+    def in_rotation(self):
+        return self.lag is not None and self.lag <= settings.DB_REPLICA_MAX_LAG_SECONDS
+
+    def status(self):
+        return {
+            "name": self.name,
+            "in_rotation": self.in_rotation,
+            "lag_seconds": None if self.lag is None else round(self.lag, 3),
+            "error": self.error,
+            "in_use": self.in_use,
+            "served": self.served,
+        }
+
+
+class ReplicaSet:
+    def __init__(self, urls: list[str], policy: str):
+        self.replicas = [Replica(url) for url in urls]
+        self.policy = policy
+        self._turn = itertools.count()
+        self._task: asyncio.Task | None = None
+        self.primary_reads = 0
+        # async (heartbeat ts) -> None, copies the heartbeat where nothing replicates it
+        self.replicate: Callable[[datetime], Awaitable] | None = None
+
+    def choose(self) -> Replica | None:
+        candidates = [r for r in self.replicas if r.in_rotation]
+        if not candidates:
+            return None
+        if self.policy == "least_connections":
+            return min(candidates, key=lambda r: r.in_use)
+        return candidates[next(self._turn) % len(candidates)]
+
+    @asynccontextmanager
+    async def session(self):
+        """A session on a replica in rotation, on the primary when there is none."""
+        replica = self.choose()
+        if replica is None:
+            self.primary_reads += 1
+            async with SessionLocal() as session:
+                yield session
+            return
+
+        replica.in_use += 1
+        replica.served += 1
+        try:
+            async with replica.sessions() as session:
+                yield session
+        finally:
+            replica.in_use -= 1
+
+    async def check_lag(self):
+        """Write the heartbeat on the primary, then measure how far behind each replica is."""
+        try:
+            heartbeat = datetime.now()
+            async with SessionLocal() as session:
+                await session.merge(Replica_Heartbeat(name=HEARTBEAT_NAME, ts=heartbeat))
+                await session.commit()
+            if self.replicate is not None:
+                await self.replicate(heartbeat)
+        except Exception:
+            # the replicas keep their last state, this says nothing about them
+            logger.exception("replica heartbeat write failed")
+            return
+
+        for replica in self.replicas:
+            try:
+                async with replica.sessions() as session:
+                    ts = await session.scalar(
+                        select(Replica_Heartbeat.ts).where(Replica_Heartbeat.name == HEARTBEAT_NAME)
+                    )
+            except Exception as exc:
+                replica.lag, replica.error = None, str(exc)
+                continue
+            if ts is None:
+                replica.lag, replica.error = None, "no heartbeat replicated yet"
+                continue
+            was_in_rotation = replica.in_rotation
+            replica.lag, replica.error = max((datetime.now() - ts).total_seconds(), 0.0), None
+            if was_in_rotation and not replica.in_rotation:
+                logger.warning("replica %s lags %.1fs, out of rotation", replica.name, replica.lag)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.DB_REPLICA_LAG_CHECK_SECONDS)
+            await self.check_lag()
+
+    async def start(self):
+        if not self.replicas:
+            return
+        # replicas enter the rotation once their lag has been measured
+        await self.check_lag()
+        self._task = asyncio.create_task(self._run(), context=contextvars.Context())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def status(self):
+        return {
+            "policy": self.policy,
+            "max_lag_seconds": settings.DB_REPLICA_MAX_LAG_SECONDS,
+            "primary_reads": self.primary_reads,
+            "replicas": [r.status() for r in self.replicas],
+        }
+
+
+replica_set = ReplicaSet(settings.DB_REPLICA_URLS, settings.DB_REPLICA_POLICY)
+
+
+def read_session():
+    """Session for read-only work outside a request (streamed exports, live feed, export jobs)."""
+    return replica_set.session()
+
+
+# Dependency for the read-only routes
+async def get_read_session():
+    async with replica_set.session() as session:
+        yield session
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m app.replicas", description="Read replica routing")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("init", help="Create the heartbeat table on the primary")
+    parser.parse_args()
+
+    async def _init():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=[Replica_Heartbeat.__table__])
+        await engine.dispose()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_init())
@@ -0,0 +1,284 @@
+import argparse
+import asyncio
+import contextvars
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, case, and_, or_, delete, insert, union_all, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.db import SessionLocal, engine
+from app.models import Base, SMS_Data, SMS_Rollup, Rollup_State
+from app.phone import PhoneMatch, phone_filter
+from app.utils import naive
+
+logger = logging.getLogger(__name__)
+
+STATE_NAME = "minute"
+BACKFILL_CHUNK = timedelta(hours=1)
+
+# ordering key used by min_by to pick the representative message of a group
+AGG_MESSAGE_KEY = func.unix_timestamp(SMS_Data.ts) * 1000000000 + func.xx_hash3_64(SMS_Data.id)
+
+
+def floor_minute(dt: datetime):
+    return dt.replace(second=0, microsecond=0)
+
+
+def ceil_minute(dt: datetime):
+    floored = floor_minute(dt)
+    return floored if floored == dt else floored + timedelta(minutes=1)
+
+
+async def get_state(session: AsyncSession):
+    return await session.get(Rollup_State, STATE_NAME)
+
+
+async def rebuild_buckets(session: AsyncSession, start: datetime, end: datetime):
+    """
+    Recompute the buckets in [start, end) from the raw table.
+    Idempotent: existing buckets in the range are replaced.
+    """
+    bucket = func.date_trunc("minute", SMS_Data.ts)
+    source = (
+        select(
+            bucket.label("bucket"),
+            SMS_Data.group_id,
+            SMS_Data.sdt_in,
+            func.min(SMS_Data.ts).label("first_ts"),
+            func.count().label("frequency"),
+            func.min_by(SMS_Data.text_sms, AGG_MESSAGE_KEY).label("agg_message"),
+            func.min(AGG_MESSAGE_KEY).label("agg_key"),
+            func.sum(case((SMS_Data.predicted_label == 'spam', 1), else_=0)).label("spam_count"),
+            func.sum(case((SMS_Data.predicted_label == 'not_spam', 1), else_=0)).label("not_spam_count"),
+        )
+        .where(SMS_Data.ts >= start, SMS_Data.ts < end)
+        .group_by(bucket, SMS_Data.group_id, SMS_Data.sdt_in)
+    )
+    await session.execute(
+        delete(SMS_Rollup).where(SMS_Rollup.bucket >= start, SMS_Rollup.bucket < end)
+    )
+    await session.execute(
+        insert(SMS_Rollup).from_select(
+            ["bucket", "group_id", "sdt_in", "first_ts", "frequency",
+             "agg_message", "agg_key", "spam_count", "not_spam_count"],
+            source
+        )
+    )
+
+
+async def stale_minutes(session: AsyncSession, start: datetime, end: datetime):
+    """Minutes in [start, end), both on the minute, whose raw row count differs from the frequency of their buckets."""
+    minute = func.date_trunc("minute", SMS_Data.ts, type_=DateTime)
+    raw = dict((await session.execute(
+        select(minute, func.count())
+        .where(SMS_Data.ts >= start, SMS_Data.ts < end)
+        .group_by(minute)
+    )).all())
+    rolled = dict((await session.execute(
+        select(SMS_Rollup.bucket, func.sum(SMS_Rollup.frequency))
+        .where(SMS_Rollup.bucket >= start, SMS_Rollup.bucket < end)
+        .group_by(SMS_Rollup.bucket)
+    )).all())
+    return sorted(m for m in raw.keys() | rolled.keys() if raw.get(m, 0) != rolled.get(m, 0))
+
+
+async def refresh(session: AsyncSession, now: datetime | None = None):
+    """
+    Advance the watermark to the last closed minute (minus the lateness grace).
+    On first run the rollup starts covering from that minute; use `backfill`
+    to extend coverage into the past.
+
+    Rows that arrive after their minute was rolled up are caught by comparing
+    the row counts of the last ROLLUP_RECHECK_MINUTES sealed minutes with their
+    buckets and rebuilding the minutes that differ. Later rows stay out of the
+    rollup until a `backfill` over their minute.
+    """
+    end = floor_minute((now or datetime.now()) - timedelta(seconds=settings.ROLLUP_LATENESS_SECONDS))
+    state = await get_state(session)
+    if state is None:
+        session.add(Rollup_State(name=STATE_NAME, covered_from=end, watermark=end))
+        await session.commit()
+        return end
+
+    if settings.ROLLUP_RECHECK_MINUTES:
+        recheck_from = max(state.covered_from, state.watermark - timedelta(minutes=settings.ROLLUP_RECHECK_MINUTES))
+        stale = await stale_minutes(session, recheck_from, state.watermark)
+        for minute in stale:
+            await rebuild_buckets(session, minute, minute + timedelta(minutes=1))
+        if stale:
+            await session.commit()
+            logger.info("rollup rebuilt %d minutes with late rows", len(stale))
+
+    start = state.watermark
+    while start < end:
+        chunk_end = min(start + BACKFILL_CHUNK, end)
+        await rebuild_buckets(session, start, chunk_end)
+        state.watermark = chunk_end
+        await session.commit()
+        start = chunk_end
+    return state.watermark
+
+
+async def backfill(session: AsyncSession, from_datetime: datetime, now: datetime | None = None):
+    """
+    Rebuild every bucket from `from_datetime` up to the current watermark,
+    one hour per transaction, then move `covered_from` back.
+    """
+    watermark = await refresh(session, now)
+    start = floor_minute(naive(from_datetime))
+    state = await get_state(session)
+
+    chunk_start = start
+    while chunk_start < watermark:
+        chunk_end = min(chunk_start + BACKFILL_CHUNK, watermark)
+        await rebuild_buckets(session, chunk_start, chunk_end)
+        await session.commit()
+        logger.info("rollup backfilled %s -> %s", chunk_start, chunk_end)
+        chunk_start = chunk_end
+
+    state.covered_from = min(state.covered_from, start)
+    await session.commit()
+    return state.covered_from, state.watermark
+
+
+async def grouped_cte(
+    session: AsyncSession,
+    from_datetime: datetime,
+    to_datetime: datetime,
+    phone_num: str | None = None,
+    by_phone: bool = True,
+    phone_match: PhoneMatch = "contains",
+):
+    """
+    Build the grouped cte (same columns as the raw one) from rollup buckets.
+    Minutes of the window not fully covered by the rollup are aggregated
+    from the raw table and merged in. Return None when the rollup covers
+    no full minute of the window, so the caller can use the raw query.
+    """
+    state = await get_state(session)
+    if state is None:
+        return None
+
+    from_datetime, to_datetime = naive(from_datetime), naive(to_datetime)
+    start = max(ceil_minute(from_datetime), state.covered_from)
+    end = min(floor_minute(to_datetime), state.watermark)
+    if start >= end:
+        return None
+
+    rollup_filters = [SMS_Rollup.bucket >= start, SMS_Rollup.bucket < end]
+    raw_filters = [
+        SMS_Data.ts.between(from_datetime, to_datetime),
+        or_(SMS_Data.ts < start, SMS_Data.ts >= end),
+    ]
+    if phone_num:
+        rollup_filters.append(phone_filter(SMS_Rollup, phone_num, phone_match))
+        raw_filters.append(phone_filter(SMS_Data, phone_num, phone_match))
+
+    rollup_part = select(
+        SMS_Rollup.group_id,
+        SMS_Rollup.sdt_in,
+        SMS_Rollup.first_ts,
+        SMS_Rollup.frequency,
+        SMS_Rollup.agg_message,
+        SMS_Rollup.agg_key,
+        SMS_Rollup.spam_count,
+        SMS_Rollup.not_spam_count,
+    ).where(*rollup_filters)
+
+    raw_part = (
+        select(
+            SMS_Data.group_id,
+            SMS_Data.sdt_in,
+            func.min(SMS_Data.ts).label("first_ts"),
+            func.count().label("frequency"),
+            func.min_by(SMS_Data.text_sms, AGG_MESSAGE_KEY).label("agg_message"),
+            func.min(AGG_MESSAGE_KEY).label("agg_key"),
+            func.sum(case((SMS_Data.predicted_label == 'spam', 1), else_=0)).label("spam_count"),
+            func.sum(case((SMS_Data.predicted_label == 'not_spam', 1), else_=0)).label("not_spam_count"),
+        )
+        .where(and_(*raw_filters))
+        .group_by(SMS_Data.group_id, SMS_Data.sdt_in)
+    )
+
+    partials = union_all(rollup_part, raw_part).subquery("partials")
+    group_cols = [partials.c.group_id, partials.c.sdt_in] if by_phone else [partials.c.group_id]
+
+    return (
+        select(
+            *group_cols,
+            func.min(partials.c.first_ts).label("first_ts"),
+            func.sum(partials.c.frequency).label("frequency"),
+            func.min_by(partials.c.agg_message, partials.c.agg_key).label("agg_message"),
+            func.sum(partials.c.spam_count).label("spam_count"),
+            func.sum(partials.c.not_spam_count).label("not_spam_count"),
+        )
+        .group_by(*group_cols)
+        .cte("cte")
+    )
+
+
+async def run_refresh_loop(interval: int | None = None):
+    interval = interval or settings.ROLLUP_INTERVAL_SECONDS
+    while True:
+        try:
+            async with SessionLocal() as session:
+                watermark = await refresh(session)
+            logger.info("rollup watermark at %s", watermark)
+        except Exception:
+            logger.exception("rollup refresh failed")
+        await asyncio.sleep(interval)
+
+
+class RefreshLoop:
+    """`run_refresh_loop` in the background of the app, with ROLLUP_REFRESH_IN_APP."""
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        self._task = asyncio.create_task(run_refresh_loop(), context=contextvars.Context())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+refresh_loop = RefreshLoop()
+
+
+async def _main(args):
+    if args.command == "init":
+        async with engine.begin() as conn:
+            await conn.run_sync(
+                Base.metadata.create_all,
+                tables=[SMS_Rollup.__table__, Rollup_State.__table__]
+            )
+    elif args.command == "backfill":
+        async with SessionLocal() as session:
+            covered_from, watermark = await backfill(session, datetime.fromisoformat(args.from_datetime))
+        print(f"Rollup covers [{covered_from}, {watermark})")
+    elif args.command == "refresh":
+        if args.loop:
+            await run_refresh_loop()
+        async with SessionLocal() as session:
+            print(f"Rollup watermark at {await refresh(session)}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m app.rollup", description="Maintain the per-minute rollup table")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("init", help="Create the rollup tables")
+    backfill_parser = sub.add_parser("backfill", help="Rebuild buckets from a point in time up to the watermark")
+    backfill_parser.add_argument("from_datetime", help="ISO datetime, e.g. 2025-01-01T00:00:00")
+    refresh_parser = sub.add_parser("refresh", help="Roll up newly closed minutes")
+    refresh_parser.add_argument("--loop", action="store_true", help="Keep refreshing every ROLLUP_INTERVAL_SECONDS")
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import Response
+from app.admission import LaneFull, lane_slot
+from app.cache import result_cache, listing_key
+from app.metrics import stage
+from app.replicas import read_session
+from app.routers.content import content_listing, content_listing_span
+from app.routers.frequency import frequency_listing, frequency_listing_span
+from app.schemas import *
+from app.serialization import error_response
+from app.utils import *
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/batch",
+    tags=['Batch']
+)
+
+LISTINGS = {
+    "content": (content_listing, content_listing_span),
+    "frequency": (frequency_listing, frequency_listing_span),
+}
+
+
+@router.post("/")
+async def batch_listing(queries: list[ListingQuery]) -> BatchResponse:
+    if not queries:
+        raise HTTPException(status_code=400, detail="No queries provided")
+    if len(queries) > settings.BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BATCH_MAX_QUERIES} queries per batch")
+
+    # queries with the same filters (offset pages) form one unit, cursor queries run alone
+    bodies: list[bytes | None] = [None] * len(queries)
+    units = {}
+    for i, q in enumerate(queries):
+        try:
+            from_datetime, to_datetime = validate_time_range(
+                q.from_datetime, q.to_datetime, snap_seconds=settings.CACHE_WINDOW_SNAP_SECONDS
+            )
+        except HTTPException as exc:
+            bodies[i] = error_response(exc.status_code, str(exc.detail)).body
+            continue
+        phone = (q.phone_num, q.phone_match) if q.kind == "content" else ()
+        filters = (q.kind, from_datetime, to_datetime, q.text_keyword, *phone, q.total_mode)
+        units.setdefault(filters if q.cursor is None else i, (filters, []))[1].append(i)
+
+    # each unit on its own session, at most BATCH_CONCURRENCY at once
+    semaphore = asyncio.Semaphore(settings.BATCH_CONCURRENCY)
+
+    async def run(filters, indexes):
+        async with semaphore:
+            try:
+                async with lane_slot("listing"), read_session() as session:
+                    results = await _run_unit(session, filters, [queries[i] for i in indexes])
+            except HTTPException as exc:
+                results = [error_response(exc.status_code, str(exc.detail)).body] * len(indexes)
+            except LaneFull as exc:
+                results = [error_response(503, f"Too many listing requests, retry after {exc.retry_after}s.").body] * len(indexes)
+            except Exception:
+                logger.exception("batch query failed")
+                results = [error_response(500, "Internal error").body] * len(indexes)
+        for i, body in zip(indexes, results):
+            bodies[i] = body
+
+    await asyncio.gather(*(run(filters, indexes) for filters, indexes in units.values()))
+
+    content = (
+        b'{"status_code":200,"message":"Success","error":false,"error_message":null,"data":['
+        + b",".join(bodies) + b"]}"
+    )
+    return Response(content=content, media_type="application/json")
+
+
+async def _run_unit(session, filters, queries: list[ListingQuery]) -> list[bytes]:
+    """Bodies of queries sharing `filters`; several uncached pages come from one query over their span."""
+    kind, from_datetime, to_datetime, text_keyword, *phone, total_mode = filters
+    listing, listing_span = LISTINGS[kind]
+    if len(queries) == 1:
+        q = queries[0]
+        return [await listing(session, from_datetime, to_datetime, text_keyword, *phone, q.page, q.page_size, q.cursor, total_mode)]
+
+    keys = [
+        listing_key(kind, from_datetime, to_datetime, text_keyword, *phone, q.page, q.page_size, None, total_mode)
+        for q in queries
+    ]
+    with stage("cache_lookup"):
+        bodies = [await result_cache.get(key) for key in keys]
+    missing = [j for j, body in enumerate(bodies) if body is None]
+    pages = [(queries[j].page, queries[j].page_size) for j in missing]
+
+    span = max(p * s for p, s in pages) - min((p - 1) * s for p, s in pages) if pages else 0
+    if len(missing) > 1 and span <= settings.BATCH_SPAN_MAX_ROWS:
+        spanned = await listing_span(
+            session, from_datetime, to_datetime, text_keyword, *phone, pages, [keys[j] for j in missing], total_mode
+        )
+        for j, body in zip(missing, spanned):
+            bodies[j] = body
+    else:
+        for j in missing:
+            q = queries[j]
+            bodies[j] = await listing(session, from_datetime, to_datetime, text_keyword, *phone, q.page, q.page_size, None, total_mode)
+    return bodies
@@ -1,13 +1,29 @@
-from typing import Annotated
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import StreamingResponse
+from typing import Annotated, Literal
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse, JSONResponse, Response, FileResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, text, func, case, and_, or_, bindparam, update
+from sqlalchemy import select, text, func, case, and_, or_, bindparam, update, literal
 from app.db import get_session
+from app.replicas import get_read_session
+from app.export import streaming_export
+from app.jobs import export_jobs, MEDIA_TYPES as JOB_MEDIA_TYPES
+from app.live import live_response
+from app import rollup
+from app.cache import result_cache, listing_key
+from app.coalesce import listing_flight
+from app.conditional import conditional_get, data_watermark
+from app.window import window_store
+from app.totals import TotalMode, totals_key, cached_total, store_total, approx_total
+from app.feedback import bulk_update_feedback
+from app.feedback_queue import feedback_queue
+from app.messages import group_messages
+from app.search import keyword_filter
+from app.serialization import model_body, page_payload, export_rows, frequency_groups
 from app.models import SMS_Data
 from app.schemas import *
 from app.utils import *
 from app.config import settings
+from app.metrics import stage
 from datetime import datetime
 from pydantic import BeforeValidator
 from collections import defaultdict
@@ -20,7 +36,8 @@ router = APIRouter(
 
 @router.get("/")
 async def get_spam_base_on_content(
-    session: Annotated[AsyncSession, Depends(get_session)],
+    request: Request,
+    session: Annotated[AsyncSession, Depends(get_read_session)],
     from_datetime: Annotated[
         datetime|None, 
         Query(description="Start time (epoch)"),
@@ -42,59 +59,217 @@ async def get_spam_base_on_content(
         BeforeValidator(validate_page_size)
     ] = 10,
     text_keyword: Annotated[str, Query(description="Filter messages that contain this keyword (case insensitive)")] = None,
+    cursor: Annotated[str|None, Query(description="Opaque cursor from a previous page (next_cursor/prev_cursor), takes precedence over page")] = None,
+    total_mode: Annotated[TotalMode, Query(description="exact counts the qualified groups (once per filters), approx estimates them")] = "exact"
 ) -> BasePaginatedResponseFrequency:
 
     # time validation
-    from_datetime, to_datetime = validate_time_range(from_datetime, to_datetime)
+    from_datetime, to_datetime = validate_time_range(
+        from_datetime, to_datetime, snap_seconds=settings.CACHE_WINDOW_SNAP_SECONDS
+    )
+
+    # a poller holding the current ETag gets a 304 before any query
+    not_modified, validators = await conditional_get(
+        request, listing_key("frequency", from_datetime, to_datetime, text_keyword, page, page_size, cursor, total_mode), to_datetime
+    )
+    if not_modified:
+        return not_modified
+
+    body = await frequency_listing(session, from_datetime, to_datetime, text_keyword, page, page_size, cursor, total_mode)
+    return Response(content=body, media_type="application/json", headers=validators)
+
+
+async def frequency_listing(session: AsyncSession, from_datetime, to_datetime, text_keyword, page, page_size, cursor, total_mode="exact") -> bytes:
+    """Body of a validated listing query, also used by the batch endpoint."""
+
+    # cached result of the same normalized query
+    cache_key = listing_key("frequency", from_datetime, to_datetime, text_keyword, page, page_size, cursor, total_mode)
+    with stage("cache_lookup"):
+        cached = await result_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # identical concurrent requests share one query
+    return await listing_flight.do(
+        cache_key,
+        lambda: _frequency_page(session, from_datetime, to_datetime, text_keyword, page, page_size, cursor, total_mode, cache_key)
+    )
+
+
+async def _frequency_page(session: AsyncSession, from_datetime, to_datetime, text_keyword, page, page_size, cursor, total_mode, cache_key) -> bytes:
+    """Run the listing query, store the encoded body in the result cache and return it."""
+    grouped_records, messages_dict, direction, position = await _frequency_rows(
+        session, from_datetime, to_datetime, text_keyword,
+        lambda stmt, sort_key: paginate(stmt, sort_key, page, page_size, cursor),
+        lambda keys, key_size: paginate_sorted(keys, key_size, page, page_size, cursor),
+        total_mode
+    )
+    return await _frequency_body(grouped_records, messages_dict, direction, position, page, page_size, cache_key)
+
+
+async def frequency_listing_span(session: AsyncSession, from_datetime, to_datetime, text_keyword, pages, cache_keys, total_mode="exact") -> list[bytes]:
+    """Several offset pages (page, page_size) of one query, cut from a single query over the rows they span."""
+    start = min((page - 1) * page_size for page, page_size in pages)
+    end = max(page * page_size for page, page_size in pages)
+    grouped_records, messages_dict, _, _ = await _frequency_rows(
+        session, from_datetime, to_datetime, text_keyword,
+        lambda stmt, sort_key: (stmt.order_by(*sort_key).offset(start).limit(end - start + 1), None, None),
+        lambda keys, key_size: (range(start, min(end + 1, len(keys))), None, None),
+        total_mode
+    )
+    bodies = []
+    for (page, page_size), cache_key in zip(pages, cache_keys):
+        first = (page - 1) * page_size - start
+        bodies.append(await _frequency_body(
+            grouped_records[first:first + page_size + 1], messages_dict, None, None, page, page_size, cache_key
+        ))
+    return bodies
+
+
+async def _frequency_rows(session: AsyncSession, from_datetime, to_datetime, text_keyword, paginate_groups, paginate_keys, total_mode="exact"):
+    """
+    The page groups in sort order and their message counts.
+    `paginate_groups(stmt, sort_key)` orders and slices the qualified groups like `paginate`,
+    `paginate_keys(keys, key_size)` does the same for the in-memory window like `paginate_sorted`.
+    """
+
+    # served from the in-memory window when it holds the whole range
+    if window_store.covers(from_datetime, to_datetime, text_keyword):
+        with stage("window_query"):
+            return window_store.listing("frequency", from_datetime, to_datetime, paginate_keys)
 
     # base filter  
     filters = [SMS_Data.ts.between(from_datetime, to_datetime)]
     if text_keyword:
-        filters.append(SMS_Data.text_sms.ilike(f"%{text_keyword}%"))
+        filters.append(keyword_filter(text_keyword))
 
-    # cte for pre-calculate
-    cte = (
-        select(
-            SMS_Data.group_id,
-            func.min(SMS_Data.ts).label("first_ts"),
-            func.count().label("frequency"),
-            func.min_by(
-                SMS_Data.text_sms, 
-                func.unix_timestamp(SMS_Data.ts) * 1000000000 + func.xx_hash3_64(SMS_Data.id)
-            ).label("agg_message"),
-            func.sum(case((SMS_Data.predicted_label == 'spam', 1), else_=0)).label("spam_count"),
-            func.sum(case((SMS_Data.predicted_label == 'not_spam', 1), else_=0)).label("not_spam_count"),
+    # cte for pre-calculate, served from the rollup when it covers the window
+    cte = None
+    if settings.ROLLUP_ENABLED and not text_keyword:
+        with stage("rollup_plan"):
+            cte = await rollup.grouped_cte(session, from_datetime, to_datetime, by_phone=False)
+    if cte is None:
+        cte = (
+            select(
+                SMS_Data.group_id,
+                func.min(SMS_Data.ts).label("first_ts"),
+                func.count().label("frequency"),
+                func.min_by(
+                    SMS_Data.text_sms, 
+                    func.unix_timestamp(SMS_Data.ts) * 1000000000 + func.xx_hash3_64(SMS_Data.id)
+                ).label("agg_message"),
+                func.sum(case((SMS_Data.predicted_label == 'spam', 1), else_=0)).label("spam_count"),
+                func.sum(case((SMS_Data.predicted_label == 'not_spam', 1), else_=0)).label("not_spam_count"),
+            )
+            .where(and_(*filters))
+            .group_by(SMS_Data.group_id)
+            .cte("cte")
         )
-        .where(and_(*filters))
-        .group_by(SMS_Data.group_id)
-        .cte("cte")
-    )
+
+    # total of the filters: cached by an earlier page, estimated once with total_mode=approx,
+    # otherwise counted with this page (see app/totals.py)
+    total_key = totals_key("frequency", from_datetime, to_datetime, text_keyword)
+    total, estimated = await cached_total(total_key)
+    if estimated and total_mode == "exact":
+        total, estimated = None, False
+    if total is None and total_mode == "approx":
+        with stage("approx_total"):
+            total, estimated = await approx_total(session, filters, (SMS_Data.group_id,)), True
+        await store_total(total_key, total, estimated=True)
 
     # spam and not_spam condition
     spam_condition = and_(cte.c.frequency >= 20, cte.c.spam_count > cte.c.not_spam_count)
     not_spam_condition = and_(cte.c.frequency >= 30, cte.c.spam_count <= cte.c.not_spam_count)
 
-    # main query
-    main_stmt = (
+    # qualified groups, a counted total is counted before the keyset seek
+    qualified = (
         select(
             cte.c.group_id,
             cte.c.first_ts,
             cte.c.frequency,
             cte.c.agg_message,
             case((cte.c.spam_count >= cte.c.not_spam_count, 'spam'), else_='not_spam').label("label"),
-            func.count().over().label("total_records"),
+            (func.count().over() if total is None else literal(total)).label("total_records"),
+            literal(estimated).label("total_estimated"),
         )
         .where(or_(spam_condition, not_spam_condition))
-        .order_by(cte.c.first_ts, cte.c.group_id)
-        .offset((page - 1) * page_size) 
-        .limit(page_size)
+        .subquery("qualified")
+    )
+
+    # page of groups
+    sort_key = (qualified.c.first_ts, qualified.c.group_id)
+    page_stmt, direction, position = paginate_groups(select(qualified), sort_key)
+    page_cte = page_stmt.cte("page")
+
+    # message counts of the page groups, aggregated in one pass over the raw rows
+    msg_subq = (
+        select(
+            SMS_Data.group_id,
+            SMS_Data.text_sms,
+            func.count().label("count")
+        )
+        .where(
+            SMS_Data.group_id.in_(select(page_cte.c.group_id)),
+            *filters
+        )
+        .group_by(SMS_Data.group_id, SMS_Data.text_sms)
+        .subquery("counts")
     )
-    result = await session.execute(main_stmt)
-    grouped_records = result.all()
+
+    # top LISTING_TOP_MESSAGES messages of each group by count, and how many there are
+    msg_subq = select(
+        msg_subq,
+        func.row_number().over(
+            partition_by=msg_subq.c.group_id, order_by=(msg_subq.c.count.desc(), msg_subq.c.text_sms)
+        ).label("rank"),
+        func.count().over(partition_by=msg_subq.c.group_id).label("messages_total"),
+    ).subquery("messages")
+
+    # main query: the page joined to its message counts, in one round trip
+    main_stmt = (
+        select(
+            page_cte.c.group_id,
+            page_cte.c.first_ts,
+            page_cte.c.frequency,
+            page_cte.c.agg_message,
+            page_cte.c.label,
+            page_cte.c.total_records,
+            page_cte.c.total_estimated,
+            msg_subq.c.text_sms,
+            msg_subq.c.count,
+            msg_subq.c.messages_total,
+        )
+        .select_from(page_cte)
+        .outerjoin(
+            msg_subq,
+            and_(msg_subq.c.group_id == page_cte.c.group_id, msg_subq.c.rank <= settings.LISTING_TOP_MESSAGES)
+        )
+        .order_by(page_cte.c.first_ts, page_cte.c.group_id, msg_subq.c.rank)
+    )
+    with stage("page_query"):
+        result = await session.execute(main_stmt)
+
+    # --- Split rows into groups and their message dictionary ---
+    with stage("split_rows"):
+        grouped_records = []
+        messages_dict = defaultdict(list)
+        for m in result.all():
+            if not grouped_records or grouped_records[-1].group_id != m.group_id:
+                grouped_records.append(m)
+            if m.count:
+                messages_dict[m.group_id].append((m.text_sms, m.count))
+    if total is None and grouped_records:
+        await store_total(total_key, grouped_records[0].total_records)
+    return grouped_records, messages_dict, direction, position
+
+
+async def _frequency_body(grouped_records, messages_dict, direction, position, page, page_size, cache_key) -> bytes:
+    """Encode a page of groups, store it in the result cache and return it."""
+    grouped_records, has_next = trim_page(grouped_records, direction, page_size)
     total_records = grouped_records[0].total_records if grouped_records else 0
 
     if total_records == 0:
-        return BasePaginatedResponseContent(
+        response = BasePaginatedResponseFrequency(
             status_code=200,
             message="No data found",
             data=[],
@@ -104,62 +279,82 @@ async def get_spam_base_on_content(
             limit=page_size,
             total=0
         )
+        body = model_body(response)
+        await result_cache.set(cache_key, body)
+        return body
 
-    # get all the message for each group
     group_ids = [r.group_id for r in grouped_records]
 
-    msg_stmt = (
-        select(
-            SMS_Data.group_id,
-            SMS_Data.text_sms,
-            func.count().label("count")
-        )
-        .where(
-            SMS_Data.group_id.in_(group_ids),
-            *filters
-        )
-        .group_by(SMS_Data.group_id, SMS_Data.text_sms)
+    # --- Build result ---
+    start_index = page_start(direction, position, page, page_size, len(grouped_records))
+    page = (start_index - 1) // page_size + 1
+    next_cursor, prev_cursor = page_cursors(
+        (grouped_records[0].first_ts, grouped_records[0].group_id),
+        (grouped_records[-1].first_ts, grouped_records[-1].group_id),
+        start_index, len(grouped_records), has_next
     )
-    result = await session.execute(msg_stmt)
-    all_messages = result.all()
-
-    # --- Build message dictionary ---
-    messages_dict = defaultdict(list)
-    for m in all_messages:
-        messages_dict[m.group_id].append(
-            MessageCount(text_sms=m.text_sms, count=m.count)
-        )
 
-    # --- Build result ---
-    start_index = (page-1) * page_size + 1
-    result = [
-        SMSGroupedFrequency(
-            stt=i,
-            group_id=r.group_id,
-            frequency=r.frequency,
-            ts=r.first_ts,
-            agg_message=r.agg_message,
-            label=r.label,
-            messages=messages_dict.get(r.group_id, [])
-        )
-        for i, r in enumerate(grouped_records, start=start_index)
-    ]
+    # fast path: rows are encoded straight to JSON, skipping model validation
+    if settings.FAST_SERIALIZATION:
+        with stage("serialize"):
+            response = JSONResponse(page_payload(
+                BasePaginatedResponseFrequency,
+                status_code=200,
+                message="Success",
+                data=frequency_groups(grouped_records, messages_dict, start_index),
+                error=False,
+                error_message="",
+                page=page,
+                limit=page_size,
+                total=int(total_records),
+                total_estimated=bool(grouped_records[0].total_estimated),
+                next_cursor=next_cursor,
+                prev_cursor=prev_cursor
+            ))
+        await result_cache.set(cache_key, response.body, tags=group_ids)
+        return response.body
 
-    return BasePaginatedResponseFrequency(
-        status_code=200,
-        message="Success",
-        data=result,
-        error=False,
-        error_message="",
-        page=page,
-        limit=page_size,
-        total=total_records
-    )
+    with stage("serialize"):
+        result = [
+            SMSGroupedFrequency(
+                stt=i,
+                group_id=r.group_id,
+                frequency=r.frequency,
+                ts=r.first_ts,
+                agg_message=r.agg_message,
+                label=r.label,
+                messages=[
+                    MessageCount(text_sms=text_sms, count=count)
+                    for text_sms, count in messages_dict.get(r.group_id, [])
+                ],
+                messages_total=r.messages_total or 0
+            )
+            for i, r in enumerate(grouped_records, start=start_index)
+        ]
+
+        response = BasePaginatedResponseFrequency(
+            status_code=200,
+            message="Success",
+            data=result,
+            error=False,
+            error_message="",
+            page=page,
+            limit=page_size,
+            total=total_records,
+            total_estimated=bool(grouped_records[0].total_estimated),
+            next_cursor=next_cursor,
+            prev_cursor=prev_cursor
+        )
+    body = model_body(response)
+    await result_cache.set(cache_key, body, tags=group_ids)
+    return body
 
 
 @router.get("/export")
 async def export_frequency_data(
-    session: AsyncSession = Depends(get_session),
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_read_session),
     from_datetime: Annotated[
         datetime | None, 
         Query(description="Start time (epoch)"),
@@ -170,66 +365,203 @@ async def export_frequency_data(
         Query(description="End time (epoch)"),
         BeforeValidator(parse_datetime)
     ] = None,
-    text_keyword: str = Query(None, description="Filter messages that contain this keyword (case insensitive)")
+    text_keyword: str = Query(None, description="Filter messages that contain this keyword (case insensitive)"),
+    file_format: Annotated[
+        Literal["json", "csv", "ndjson", "arrow", "parquet"],
+        Query(alias="format", description="json returns one array, csv/ndjson/arrow/parquet are streamed in batches")
+    ] = "json"
 ):
 
     # --- Time validation ---
     from_datetime, to_datetime = validate_time_range(from_datetime, to_datetime)
 
+    not_modified, validators = await conditional_get(
+        request, listing_key("frequency_export", from_datetime, to_datetime, text_keyword, file_format), to_datetime
+    )
+    if not_modified:
+        return not_modified
+
+    main_stmt = await _frequency_export_stmt(session, from_datetime, to_datetime, text_keyword)
+
+    if file_format != "json":
+        exported = streaming_export(main_stmt, SMSExportFrequency, file_format, "frequency_export")
+        exported.headers.update(validators)
+        return exported
+
+    with stage("query"):
+        result = await session.execute(main_stmt)
+        grouped_records = result.all()
+
+    if settings.FAST_SERIALIZATION:
+        with stage("serialize"):
+            return JSONResponse(export_rows(grouped_records, SMSExportFrequency), headers=validators)
+
+    with stage("serialize"):
+        output = [
+            SMSExportFrequency(
+                group_id=r.group_id,
+                frequency=r.frequency,
+                ts=r.ts,
+                agg_message=r.agg_message,
+                label=r.label
+            )
+            for r in grouped_records
+        ]
+
+    response.headers.update(validators)
+    return output
+
+
+async def _frequency_export_stmt(session: AsyncSession, from_datetime, to_datetime, text_keyword):
+    """The export statement, shared by the export endpoint and the export jobs."""
+
     # --- Build filters ---
     filters = [SMS_Data.ts.between(from_datetime, to_datetime)]
     if text_keyword:
-        filters.append(SMS_Data.text_sms.ilike(f"%{text_keyword}%"))
+        filters.append(keyword_filter(text_keyword))
 
-    cte = (
-        select(
-            SMS_Data.group_id,
-            func.min(SMS_Data.ts).label("first_ts"),
-            func.count().label("frequency"),
-            func.min_by(
-                SMS_Data.text_sms, 
-                func.unix_timestamp(SMS_Data.ts) * 1000000000 + func.xx_hash3_64(SMS_Data.id)
-            ).label("agg_message"),
-            func.sum(case((SMS_Data.predicted_label == 'spam', 1), else_=0)).label("spam_count"),
-            func.sum(case((SMS_Data.predicted_label == 'not_spam', 1), else_=0)).label("not_spam_count"),
+    # cte for pre-calculate, served from the rollup when it covers the window
+    cte = None
+    if settings.ROLLUP_ENABLED and not text_keyword:
+        with stage("rollup_plan"):
+            cte = await rollup.grouped_cte(session, from_datetime, to_datetime, by_phone=False)
+    if cte is None:
+        cte = (
+            select(
+                SMS_Data.group_id,
+                func.min(SMS_Data.ts).label("first_ts"),
+                func.count().label("frequency"),
+                func.min_by(
+                    SMS_Data.text_sms, 
+                    func.unix_timestamp(SMS_Data.ts) * 1000000000 + func.xx_hash3_64(SMS_Data.id)
+                ).label("agg_message"),
+                func.sum(case((SMS_Data.predicted_label == 'spam', 1), else_=0)).label("spam_count"),
+                func.sum(case((SMS_Data.predicted_label == 'not_spam', 1), else_=0)).label("not_spam_count"),
+            )
+            .where(and_(*filters))
+            .group_by(SMS_Data.group_id)
+            .cte("cte")
         )
-        .where(and_(*filters))
-        .group_by(SMS_Data.group_id)
-        .cte("cte")
-    )
 
     # spam and not_spam condition
     spam_condition = and_(cte.c.frequency >= 20, cte.c.spam_count > cte.c.not_spam_count)
     not_spam_condition = and_(cte.c.frequency >= 30, cte.c.spam_count <= cte.c.not_spam_count)
 
-    # main query
+    # main query, columns follow the SMSExportFrequency field order
     main_stmt = (
         select(
             cte.c.group_id,
-            cte.c.first_ts,
             cte.c.frequency,
+            cte.c.first_ts.label("ts"),
             cte.c.agg_message,
             case((cte.c.spam_count >= cte.c.not_spam_count, 'spam'), else_='not_spam').label("label"),
         )
         .where(or_(spam_condition, not_spam_condition))
     )
-    result = await session.execute(main_stmt)
-    grouped_records = result.all()
-
-    output = [
-        SMSExportFrequency(
-            group_id=r.group_id,
-            frequency=r.frequency,
-            ts=r.first_ts,
-            agg_message=r.agg_message,
-            label=r.label
-        )
-        for r in grouped_records
-    ]
+    return main_stmt
 
-    return output
+
+# export written to a compressed file in the background, identical submissions share the job
+@router.post("/export/jobs", status_code=202)
+async def submit_frequency_export_job(
+    from_datetime: Annotated[
+        datetime | None, 
+        Query(description="Start time (epoch)"),
+        BeforeValidator(parse_datetime)
+    ] = None,
+    to_datetime: Annotated[
+        datetime | None, 
+        Query(description="End time (epoch)"),
+        BeforeValidator(parse_datetime)
+    ] = None,
+    text_keyword: Annotated[str, Query(description="Filter messages that contain this keyword (case insensitive)")] = None,
+    compression: Annotated[Literal["gzip", "zstd"], Query(description="Compression of the CSV file")] = "gzip",
+) -> ExportJobResponse:
+
+    # time validation, the default window is snapped so repeated submissions share the job
+    from_datetime, to_datetime = validate_time_range(
+        from_datetime, to_datetime, snap_seconds=settings.CACHE_WINDOW_SNAP_SECONDS
+    )
+    params = dict(from_datetime=from_datetime, to_datetime=to_datetime, text_keyword=text_keyword)
+    job = export_jobs.submit(
+        "frequency", compression, params,
+        lambda session: _frequency_export_stmt(session, **params),
+        list(SMSExportFrequency.model_fields)
+    )
+    return ExportJobResponse(
+        status_code=202, message="Accepted", data=job.info(), error=False, error_message=None
+    )
+
+
+@router.get("/export/jobs/{job_id}")
+async def get_frequency_export_job(job_id: str) -> ExportJobResponse:
+    job = export_jobs.get(job_id, "frequency")
+    return ExportJobResponse(
+        status_code=200, message="Success", data=job.info(), error=False, error_message=None
+    )
 
 
+# finished file, Range requests resume an interrupted download
+@router.get("/export/jobs/{job_id}/download")
+async def download_frequency_export_job(job_id: str):
+    job = export_jobs.get(job_id, "frequency")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Export job is {job.status}.")
+    return FileResponse(export_jobs.path(job), media_type=JOB_MEDIA_TYPES[job.compression], filename=job.filename)
+
+
+# every message of one group, paged, most frequent first: the listing embeds only the top ones
+@router.get("/{group_id}/messages")
+async def get_frequency_group_messages(
+    request: Request,
+    session: Annotated[AsyncSession, Depends(get_read_session)],
+    group_id: str,
+    from_datetime: Annotated[
+        datetime|None, 
+        Query(description="Start time (epoch)"),
+        BeforeValidator(parse_datetime)
+    ] = None,
+    to_datetime: Annotated[
+        datetime|None, 
+        Query(description="End time (epoch)"),
+        BeforeValidator(parse_datetime)
+    ] = None,
+    page: Annotated[
+        int, 
+        Query(ge=1, description="The page number"),
+        BeforeValidator(validate_page)
+    ] = 1,
+    page_size: Annotated[
+        int, 
+        Query(description="The number of record in one page", enum=[10, 20, 50, 100]),
+        BeforeValidator(validate_page_size)
+    ] = 10,
+    text_keyword: Annotated[str, Query(description="Filter messages that contain this keyword (case insensitive)")] = None
+) -> BasePaginatedResponseMessages:
+
+    # time validation, same window as the listing
+    from_datetime, to_datetime = validate_time_range(
+        from_datetime, to_datetime, snap_seconds=settings.CACHE_WINDOW_SNAP_SECONDS
+    )
+
+    not_modified, validators = await conditional_get(
+        request, listing_key("frequency_messages", from_datetime, to_datetime, group_id, page, page_size, text_keyword), to_datetime
+    )
+    if not_modified:
+        return not_modified
+
+    filters = [SMS_Data.ts.between(from_datetime, to_datetime), SMS_Data.group_id == group_id]
+    if text_keyword:
+        filters.append(keyword_filter(text_keyword))
+    messages = await group_messages(session, filters, page, page_size)
+    return Response(content=model_body(messages), media_type="application/json", headers=validators)
+
+
+# snapshot of the qualified groups of the last hour, then one delta event per tick
+@router.get("/live")
+async def live_frequency_updates():
+    return live_response("frequency")
+
 @router.put("/")
 async def feedback_base_on_frequency(
     user_feedback: list[FrequencyFeedback],
@@ -240,35 +572,26 @@ async def feedback_base_on_frequency(
             status_code=400, detail="No feedback data provided"
         )
 
-    # 1. Condition parameter
-    where_conditions = [] 
-    case_conditions = []
-    update_params = {}
-
-    for idx, item in enumerate(user_feedback):
-        gid_key = f"gid_{idx}"
-        fb_key = f"fb_{idx}"
-        
-        update_params[gid_key] = item.group_id
-        update_params[fb_key] = item.feedback
-
-        condition = SMS_Data.group_id == bindparam(gid_key)
-        where_conditions.append(condition)
-        case_conditions.append((condition, bindparam(fb_key)))
-
-    # 2. update condition and query
-    combined_where = or_(*where_conditions)
-    combined_case = case(*case_conditions, else_=SMS_Data.feedback) 
-    
-    stmt_update = (
-        update(SMS_Data)
-        .where(combined_where)
-        .values(feedback=combined_case)
-    )
+    # write-behind: acknowledged once buffered and logged, written by the next flush
+    if settings.FEEDBACK_WRITE_BEHIND:
+        queued, sequence = await feedback_queue.enqueue("frequency", user_feedback)
+        response = FeedbackQueuedResponse(
+            status_code=202,
+            message=f"Queued {queued} feedback keys",
+            error=False,
+            error_message=None,
+            queued=queued,
+            sequence=sequence
+        )
+        return JSONResponse(status_code=202, content=response.model_dump(mode="json"))
 
-    result = await session.execute(stmt_update, update_params)
-    await session.commit()
-    total_updated = result.rowcount or 0
+    # deduplicated (last one wins), batched, one UPDATE per feedback value per batch
+    with stage("update"):
+        batch_counts = await bulk_update_feedback(session, user_feedback, (SMS_Data.group_id,))
+    total_updated = sum(batch_counts)
+    with stage("cache_invalidate"):
+        await result_cache.invalidate(item.group_id for item in user_feedback)
+    data_watermark.bump_feedback()
     
     # handle exception
     if total_updated == 0:
@@ -277,9 +600,11 @@ async def feedback_base_on_frequency(
             detail="No records matched your condition."
         )
     
-    return BaseResponse(
+    return FeedbackResponse(
         status_code=200,
         message=f"Updated {total_updated} records",
         error=False,
-        error_message=None
+        error_message=None,
+        updated=total_updated,
+        batches=batch_counts
     )
\ No newline at end of file
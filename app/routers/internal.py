@@ -0,0 +1,63 @@
+from fastapi import APIRouter, HTTPException
+from app.admission import lanes
+from app.cache import result_cache
+from app.coalesce import listing_flight
+from app.conditional import data_watermark
+from app.db import pool_status
+from app.feedback_queue import feedback_queue
+from app.replicas import replica_set
+from app.window import window_store
+
+
+router = APIRouter(
+    prefix="/internal",
+    tags=['Internal']
+)
+
+
+@router.get("/cache")
+async def get_cache_stats():
+    return result_cache.stats()
+
+
+@router.get("/pool")
+async def get_pool_stats():
+    return pool_status()
+
+
+@router.get("/coalescing")
+async def get_coalescing_stats():
+    return listing_flight.stats()
+
+
+@router.get("/replicas")
+async def get_replica_stats():
+    return replica_set.status()
+
+
+@router.get("/admission")
+async def get_admission_stats():
+    return {name: lane.stats() for name, lane in lanes.items()}
+
+
+@router.get("/window")
+async def get_window_stats():
+    return window_store.status()
+
+
+@router.get("/watermark")
+async def get_watermark_stats():
+    return data_watermark.status()
+
+
+@router.get("/feedback")
+async def get_feedback_queue_stats():
+    return feedback_queue.status()
+
+
+# read-your-writes with write-behind feedback: everything accepted before this call is written
+@router.post("/feedback/flush")
+async def flush_feedback_queue():
+    if not await feedback_queue.flush():
+        raise HTTPException(status_code=503, detail=f"Feedback flush failed: {feedback_queue.last_error}")
+    return feedback_queue.status()
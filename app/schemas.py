@@ -1,5 +1,9 @@
-from pydantic import BaseModel, ConfigDict, field_validator
+from typing import Annotated, Literal
+from pydantic import BaseModel, BeforeValidator, ConfigDict, field_validator
 from datetime import datetime, timezone, timedelta
+from app.phone import PhoneMatch
+from app.totals import TotalMode
+from app.utils import parse_datetime, validate_page, validate_page_size
 
 # Model for GET API
 class MessageCount(BaseModel):
@@ -15,11 +19,14 @@ class BaseData(BaseModel):
     label: str
 
 class SMSGroupedFrequency(BaseData):
+    # the top LISTING_TOP_MESSAGES messages, out of messages_total
     messages: list[MessageCount]
+    messages_total: int
 
 class SMSGroupedContent(BaseData):
     sdt_in: str
     messages: list[MessageCount]
+    messages_total: int
 
 class BaseResponse(BaseModel):
     status_code: int
@@ -32,12 +39,26 @@ class BasePaginatedResponseContent(BaseResponse):
     page: int
     limit: int
     total: int
+    # total is an approx estimate (total_mode=approx), not a count
+    total_estimated: bool = False
+    next_cursor: str|None = None
+    prev_cursor: str|None = None
 
 class BasePaginatedResponseFrequency(BaseResponse):
     data: list[SMSGroupedFrequency]|None = None
     page: int
     limit: int
     total: int
+    # total is an approx estimate (total_mode=approx), not a count
+    total_estimated: bool = False
+    next_cursor: str|None = None
+    prev_cursor: str|None = None
+
+class BasePaginatedResponseMessages(BaseResponse):
+    data: list[MessageCount]|None = None
+    page: int
+    limit: int
+    total: int
 
 
 
@@ -52,6 +73,15 @@ class FrequencyFeedback(BaseFeedback):
 
 class ContentFeedback(FrequencyFeedback):
     sdt_in: str
+
+class FeedbackResponse(BaseResponse):
+    updated: int
+    batches: list[int]
+
+# write-behind: distinct keys buffered, and the sequence number to compare with `flushed_sequence`
+class FeedbackQueuedResponse(BaseResponse):
+    queued: int
+    sequence: int
     
 
 # Model for export
@@ -71,6 +101,42 @@ class SMSExportContent(BaseModel):
     label: str
 
 
+# Model for export jobs
+class ExportJob(BaseModel):
+    job_id: str
+    kind: str
+    status: Literal["queued", "running", "done", "failed"]
+    compression: str
+    rows: int
+    bytes: int
+    created_at: datetime
+    finished_at: datetime|None = None
+    error: str|None = None
+    download_url: str|None = None
+
+class ExportJobResponse(BaseResponse):
+    data: ExportJob
+
+
+# Model for the batch listing endpoint: the query parameters of GET /content/ or /frequency/
+class ListingQuery(BaseModel):
+    kind: Literal["content", "frequency"]
+    from_datetime: Annotated[datetime|None, BeforeValidator(parse_datetime)] = None
+    to_datetime: Annotated[datetime|None, BeforeValidator(parse_datetime)] = None
+    page: Annotated[int, BeforeValidator(validate_page)] = 1
+    page_size: Annotated[int, BeforeValidator(validate_page_size)] = 10
+    text_keyword: str|None = None
+    # content only
+    phone_num: str|None = None
+    phone_match: PhoneMatch = "contains"
+    cursor: str|None = None
+    total_mode: TotalMode = "exact"
+
+class BatchResponse(BaseResponse):
+    # one listing response per query, in request order, errors included
+    data: list[dict]
+
+
 
 
 
@@ -119,3 +185,4 @@ class SMSExportContent(BaseModel):
 #             return v.astimezone(UTC_PLUS_7)
 
 #         raise ValueError(f"Unsupported datetime format: {v}")
+
@@ -0,0 +1,123 @@
+"""
+Keyword search on text_sms.
+
+`ILIKE '%kw%'` lowercases and scans every message of the window. With
+KEYWORD_SEARCH=ngram the same match runs as `text_sms_lower LIKE lower('%kw%')`
+on a generated `lower(text_sms)` column carrying a StarRocks n-gram bloom
+filter index, so segments that cannot contain the keyword are skipped. The
+semantics are the ones of the ILIKE path: the dialect compiles ILIKE to
+`lower(x) LIKE lower(y)` too.
+
+`init` also adds the phone matching columns of app/phone.py. text_sms_lower is
+only part of the model with KEYWORD_SEARCH=ngram, the phone columns only with
+PHONE_INDEXED; the app refuses to start while a declared column is missing
+from the table.
+
+    python -m app.search init [--gram-num 3]
+"""
+import argparse
+import asyncio
+import logging
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.dialects import mysql
+from app.config import settings
+from app.db import engine
+from app.models import SMS_Data, phone_columns, text_sms_lower_column
+
+logger = logging.getLogger(__name__)
+
+# generated columns with an n-gram bloom filter index
+SEARCH_COLUMNS = (text_sms_lower_column(), *phone_columns())
+
+
+def index_name(column):
+    return f"idx_{settings.TABLE_NAME}_{column.name}_ngram"
+
+
+def keyword_filter(keyword: str):
+    """Case-insensitive substring match of `keyword` in text_sms."""
+    pattern = f"%{keyword}%"
+    if settings.KEYWORD_SEARCH == "ngram":
+        return SMS_Data.text_sms_lower.like(func.lower(pattern))
+    return SMS_Data.text_sms.ilike(pattern)
+
+
+async def check_columns():
+    """Raise RuntimeError when a generated column the settings use is missing from the table."""
+    missing = []
+    async with engine.connect() as conn:
+        for column in SEARCH_COLUMNS:
+            if column.name not in SMS_Data.__table__.c:
+                continue
+            try:
+                await conn.execute(select(SMS_Data.__table__.c[column.name]).limit(0))
+            except DBAPIError:
+                missing.append(column.name)
+                await conn.rollback()
+    if missing:
+        raise RuntimeError(f"{settings.TABLE_NAME} has no {', '.join(missing)}: run `python -m app.search init`")
+
+
+async def _wait_for_schema_change(conn, poll_seconds: float = 2):
+    # StarRocks schema changes are asynchronous, one job per table at a time
+    while True:
+        result = await conn.execute(text(
+            f"SHOW ALTER TABLE COLUMN WHERE TableName = '{settings.TABLE_NAME}' ORDER BY CreateTime DESC LIMIT 1"
+        ))
+        job = result.mappings().first()
+        if job is None or job["State"] == "FINISHED":
+            return
+        if job["State"] == "CANCELLED":
+            raise RuntimeError(f"schema change on {settings.TABLE_NAME} cancelled: {job['Msg']}")
+        logger.info("waiting for schema change on %s (%s)", settings.TABLE_NAME, job["State"])
+        await asyncio.sleep(poll_seconds)
+
+
+def _expression_sql(column):
+    # rendered without doubled percent signs, text() takes care of them
+    return column.computed.sqltext.compile(
+        dialect=mysql.dialect(paramstyle="named"), compile_kwargs={"literal_binds": True}
+    )
+
+
+async def init_index(gram_num: int):
+    """Add the generated search columns and their NGRAMBF indexes (StarRocks)."""
+    if engine.dialect.name != "mysql":
+        raise SystemExit(
+            f"init targets StarRocks; a {engine.dialect.name} table gets the search columns from create_all"
+        )
+    async with engine.connect() as conn:
+        for column in SEARCH_COLUMNS:
+            columns = await conn.execute(text(f"SHOW COLUMNS FROM {settings.TABLE_NAME} LIKE '{column.name}'"))
+            if columns.first() is None:
+                await conn.execute(text(
+                    f"ALTER TABLE {settings.TABLE_NAME} ADD COLUMN {column.name} "
+                    f"{column.type.compile(dialect=mysql.dialect())} NULL AS {_expression_sql(column)}"
+                ))
+                await _wait_for_schema_change(conn)
+
+        existing = {row.Key_name for row in await conn.execute(text(f"SHOW INDEX FROM {settings.TABLE_NAME}"))}
+        for column in SEARCH_COLUMNS:
+            if index_name(column) not in existing:
+                await conn.execute(text(
+                    f"CREATE INDEX {index_name(column)} ON {settings.TABLE_NAME} ({column.name}) USING NGRAMBF "
+                    f"(\"gram_num\" = \"{gram_num}\", \"bloom_filter_false_positive_probability\" = \"0.05\")"
+                ))
+                await _wait_for_schema_change(conn)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m app.search", description="Maintain the search indexes")
+    sub = parser.add_subparsers(dest="command", required=True)
+    init_parser = sub.add_parser("init", help="Add the generated search columns and their n-gram bloom filter indexes")
+    init_parser.add_argument("--gram-num", type=int, default=3, help="n-gram length; shorter keywords are not pruned")
+
+    logging.basicConfig(level=logging.INFO)
+    args = parser.parse_args()
+    asyncio.run(init_index(args.gram_num))
+    print(
+        f"{settings.TABLE_NAME}: {', '.join(c.name for c in SEARCH_COLUMNS)} indexed; "
+        "set KEYWORD_SEARCH=ngram and PHONE_INDEXED=true to use them"
+    )
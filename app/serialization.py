@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+def json_datetime(v: datetime):
+    # same text as pydantic's JSON mode (UTC is written as "Z")
+    if v.utcoffset() == timedelta(0):
+        return v.replace(tzinfo=None).isoformat() + "Z"
+    return v.isoformat()
+
+
+def model_body(model: BaseModel) -> bytes:
+    """Encode a response model exactly as FastAPI would send it."""
+    return JSONResponse(model.model_dump(mode="json")).body
+
+
+def page_payload(model: type[BaseModel], **values):
+    """Envelope of a paginated response, keys in `model` field order."""
+    return {name: values.get(name, field.default) for name, field in model.model_fields.items()}
+
+
+def content_groups(rows, messages_dict, start_index: int):
+    """`SMSGroupedContent` dicts built straight from the page rows."""
+    return [
+        {
+            "stt": i,
+            "group_id": r.group_id,
+            "frequency": int(r.frequency),
+            "ts": json_datetime(r.first_ts),
+            "agg_message": r.agg_message,
+            "label": r.label,
+            "sdt_in": r.sdt_in,
+            "messages": [
+                {"text_sms": text_sms, "count": int(count)}
+                for text_sms, count in messages_dict.get((r.group_id, r.sdt_in), [])
+            ],
+            "messages_total": int(r.messages_total or 0),
+        }
+        for i, r in enumerate(rows, start=start_index)
+    ]
+
+
+def frequency_groups(rows, messages_dict, start_index: int):
+    """`SMSGroupedFrequency` dicts built straight from the page rows."""
+    return [
+        {
+            "stt": i,
+            "group_id": r.group_id,
+            "frequency": int(r.frequency),
+            "ts": json_datetime(r.first_ts),
+            "agg_message": r.agg_message,
+            "label": r.label,
+            "messages": [
+                {"text_sms": text_sms, "count": int(count)}
+                for text_sms, count in messages_dict.get(r.group_id, [])
+            ],
+            "messages_total": int(r.messages_total or 0),
+        }
+        for i, r in enumerate(rows, start=start_index)
+    ]
+
+
+def export_rows(rows, model: type[BaseModel]):
+    """Export dicts from rows whose columns follow the `model` field order."""
+    fields = tuple(model.model_fields)
+    return [
+        {
+            name: json_datetime(v) if isinstance(v, datetime) else int(v) if name == "frequency" else v
+            for name, v in zip(fields, row)
+        }
+        for row in rows
+    ]
+
+
+def error_response(status_code: int, message: str, headers: dict | None = None):
+    """The failure envelope of the HTTPException handler, for responses sent by a middleware."""
+    return JSONResponse(
+        status_code=status_code,
+        content={
+            "status_code": status_code,
+            "message": "Failure",
+            "data": None,
+            "error": True,
+            "error_message": message,
+            "page": None,
+            "limit": None,
+            "total": None,
+        },
+        headers=headers,
+    )
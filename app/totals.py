@@ -0,0 +1,88 @@
+"""
+Listing totals.
+
+`total` is the number of qualified groups of the filters, whatever the page.
+Counting it with `count() over ()` on every page makes the database materialize
+every qualified group, when a page only needs the first rows in sort order.
+So the exact total is counted with the first page of a filter set and cached
+under a key without page, page_size or cursor, and the next pages are plain
+top-N queries. Totals are kept in their own small in-process TTL store rather than
+the listing result cache: they are counted whatever CACHE_BACKEND is, take no
+cache slots and do not show in the cache hit/miss stats. With `total_mode=approx` the count is skipped too: the total
+is a HyperLogLog estimate (`approx_count_distinct`) of the groups with
+matching rows, taken before the frequency thresholds, stored like an exact
+total, and the response says `total_estimated: true`. The estimate usually
+overshoots the qualified groups but can fall short of them, so pagination
+never relies on `total`: a page fetches one row more than it shows to know
+whether a next page exists (see `paginate`).
+"""
+import time
+from collections import OrderedDict
+from typing import Literal
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.cache import listing_key
+from app.config import settings
+from app.models import SMS_Data
+
+TotalMode = Literal["exact", "approx"]
+
+
+class TotalsStore:
+    """Totals by key with a per-entry TTL, the least recently used dropped above `max_entries`."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, total, estimated)
+
+    def get(self, key: str) -> tuple[int | None, bool]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(key, None)
+            return None, False
+        self._entries.move_to_end(key)
+        return entry[1], entry[2]
+
+    def set(self, key: str, total: int, estimated: bool = False):
+        if self.ttl <= 0:
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = (time.monotonic() + self.ttl, int(total), estimated)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+totals_store = TotalsStore(settings.TOTALS_TTL_SECONDS, settings.TOTALS_MAX_ENTRIES)
+
+
+def totals_key(kind: str, from_datetime, to_datetime, *filters):
+    """Key of the total of a listing, shared by all its pages."""
+    return "total:" + listing_key(kind, from_datetime, to_datetime, *filters)
+
+
+async def cached_total(key: str) -> tuple[int | None, bool]:
+    """(total, whether it is an estimate), (None, False) when none is stored."""
+    return totals_store.get(key)
+
+
+async def store_total(key: str, total: int, estimated: bool = False):
+    # feedback does not change which groups qualify, the entry is never invalidated
+    totals_store.set(key, total, estimated)
+
+
+async def approx_total(session: AsyncSession, filters, key_columns) -> int:
+    """HyperLogLog estimate of the distinct `key_columns` among the rows matching `filters`."""
+    key = key_columns[0] if len(key_columns) == 1 else func.concat(*_separated(key_columns))
+    return int(await session.scalar(select(func.approx_count_distinct(key)).where(*filters)) or 0)
+
+
+def _separated(columns):
+    # "a" + "bc" and "ab" + "c" stay apart
+    for i, column in enumerate(columns):
+        if i:
+            yield "\x1f"
+        yield column
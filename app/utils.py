@@ -1,15 +1,20 @@
+import base64
+import binascii
+import json
+from bisect import bisect_left, bisect_right
 from datetime import datetime, timedelta, timezone
 from fastapi import HTTPException, status
-from sqlalchemy import func, select
+from sqlalchemy import func, select, tuple_
 from app.models import *
 
 def validate_time_range(
     from_datetime: datetime | None,
     to_datetime: datetime | None,
+    snap_seconds: int = 0,
 ):
     """
     Validate and normalize a time range:
-    - Default: last `max_hours` if both None.
+    - Default: last `max_hours` if both None, ending on a multiple of `snap_seconds`.
     - Not exceed `max_hours`.
     - `to_datetime` <= now.
     - `from_datetime` >= min(ts) in DB.
@@ -17,6 +22,8 @@ def validate_time_range(
 
     if from_datetime is None and to_datetime is None: 
         to_datetime = datetime.now()
+        if snap_seconds:
+            to_datetime = datetime.fromtimestamp(int(to_datetime.timestamp()) // snap_seconds * snap_seconds)
         from_datetime = to_datetime - timedelta(hours=1)
     else:
         if from_datetime is None:
@@ -37,6 +44,11 @@ def validate_time_range(
 
 
 
+def naive(dt: datetime):
+    # the driver binds aware datetimes by their wall clock, do the same here
+    return dt.replace(tzinfo=None) if dt.tzinfo else dt
+
+
 def parse_datetime(v: str | int | float):
     if v is None:
         return None
@@ -84,3 +96,101 @@ def validate_page(page):
     else:
         return 1
 
+
+def encode_cursor(direction: str, position: int, *key):
+    """
+    Build an opaque keyset cursor:
+    - `direction`: "next" (seek after `key`) or "prev" (seek before `key`).
+    - `position`: the `stt` of the row the cursor points at.
+    - `key`: the sort key of that row, e.g. (first_ts, group_id[, sdt_in]).
+    """
+    payload = {
+        "d": direction,
+        "n": position,
+        "k": [k.isoformat() if isinstance(k, datetime) else k for k in key],
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, key_size: int):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        direction, position, key = payload["d"], int(payload["n"]), list(payload["k"])
+        if direction not in ("next", "prev") or len(key) != key_size:
+            raise ValueError
+        key[0] = datetime.fromisoformat(key[0])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor."
+        )
+    return direction, position, tuple(key)
+
+
+def paginate(stmt, sort_key, page: int, page_size: int, cursor: str | None):
+    """
+    Order and slice `stmt`:
+    - Without cursor: OFFSET/LIMIT on `page`.
+    - With cursor: seek past the cursor key with a row-value comparison.
+    One row more than the page is fetched, `trim_page` drops it and tells whether a next page exists.
+    Return (stmt, direction, position); direction is None in offset mode.
+    """
+    if not cursor:
+        stmt = stmt.order_by(*sort_key).offset((page - 1) * page_size).limit(page_size + 1)
+        return stmt, None, None
+
+    direction, position, key = decode_cursor(cursor, len(sort_key))
+    if direction == "next":
+        stmt = stmt.where(tuple_(*sort_key) > tuple_(*key)).order_by(*sort_key)
+    else:
+        stmt = stmt.where(tuple_(*sort_key) < tuple_(*key)).order_by(*(c.desc() for c in sort_key))
+    return stmt.limit(page_size + 1), direction, position
+
+
+def paginate_sorted(keys: list, key_size: int, page: int, page_size: int, cursor: str | None):
+    """
+    Twin of `paginate` for sort keys already in order (the in-memory window, see app/window.py).
+    Return (range of the page's indexes in `keys`, direction, position).
+    """
+    if not cursor:
+        start = (page - 1) * page_size
+        return range(start, min(start + page_size + 1, len(keys))), None, None
+
+    direction, position, key = decode_cursor(cursor, key_size)
+    # NULLs sort first, like the empty string
+    key = tuple("" if k is None else k for k in key)
+    if direction == "next":
+        start = bisect_right(keys, key)
+        return range(start, min(start + page_size + 1, len(keys))), direction, position
+    end = bisect_left(keys, key)
+    return range(max(end - page_size - 1, 0), end), direction, position
+
+
+def trim_page(rows: list, direction: str | None, page_size: int):
+    """
+    Drop the extra row fetched by `paginate`/`paginate_sorted`, rows in sort order.
+    Return (page rows, whether a next page exists); seeking back, the rows after
+    the page are the ones the cursor came from.
+    """
+    if direction == "prev":
+        return rows[-page_size:] if len(rows) > page_size else rows, True
+    return rows[:page_size], len(rows) > page_size
+
+
+def page_start(direction: str | None, position: int | None, page: int, page_size: int, n_rows: int):
+    """Return the `stt` of the first row of the fetched page."""
+    if direction is None:
+        return (page - 1) * page_size + 1
+    if direction == "next":
+        return position + 1
+    return max(position - n_rows, 1)
+
+
+def page_cursors(first_key: tuple, last_key: tuple, start_index: int, n_rows: int, has_next: bool):
+    """Return (next_cursor, prev_cursor) around the fetched page."""
+    end_index = start_index + n_rows - 1
+    next_cursor = encode_cursor("next", end_index, *last_key) if has_next else None
+    prev_cursor = encode_cursor("prev", start_index, *first_key) if start_index > 1 else None
+    return next_cursor, prev_cursor
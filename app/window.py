@@ -0,0 +1,366 @@
+"""
+In-memory window of the latest SMS_Data rows, answering the GET listings.
+
+With WINDOW_STORE_ENABLED a background task tails the table by `ts`: every
+WINDOW_TICK_SECONDS it re-reads the rows newer than `watermark -
+WINDOW_LATENESS_SECONDS` up to now, and drops the rows older than
+WINDOW_RETENTION_SECONDS. Rows are kept in ts order in numpy columns with
+headroom at the end, so a tick appends in place. group_id, sdt_in, text_sms
+and predicted_label hold codes into per-column dictionaries, and each row
+also carries the code of its (group_id, sdt_in) pair, so grouping is a
+bincount. The min_by key of the representative message is the database's own
+AGG_MESSAGE_KEY, read with the row.
+
+A listing whose range lies within [covered_from, watermark] and has no
+text_keyword is answered from memory, a phone filter is evaluated once per
+distinct sdt_in. A range may end up to WINDOW_TICK_SECONDS past the
+watermark, as the default last-hour window ending at now does between two
+ticks: it is answered as of the watermark, one tick behind at most. The other listings, and all of them while the store warms
+up, take the SQL path. Rows written more than WINDOW_LATENESS_SECONDS after
+their `ts` are not picked up.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from app.config import settings
+from app.db import SessionLocal
+from app.metrics import stage
+from app.models import SMS_Data
+from app.phone import PhoneMatch, phone_predicate
+from app.rollup import AGG_MESSAGE_KEY
+from app.utils import naive
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# a listing row shaped like the rows of the SQL path
+WindowGroup = namedtuple("WindowGroup", "group_id sdt_in first_ts frequency agg_message label total_records total_estimated messages_total")
+
+COLUMNS = {
+    "ts": "datetime64[us]",
+    "group": "int32",
+    "phone": "int32",
+    "pair": "int32",
+    "text": "int32",
+    "label": "int32",
+    # AGG_MESSAGE_KEY can exceed int64, it is kept as (key + 2**64) in two words
+    "key_hi": "uint8",
+    "key_lo": "uint64",
+}
+KEY_OFFSET = 1 << 64
+KEY_MASK = (1 << 64) - 1
+# dictionaries are rebuilt once they hold this many more values than there are rows
+COMPACT_SLACK = 4096
+
+
+class Dictionary:
+    """Distinct values of a column; rows store their int32 code."""
+
+    def __init__(self):
+        self.values = []
+        self.index = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, value):
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def encode(self, values):
+        return np.fromiter(map(self.code, values), dtype="int32", count=len(values))
+
+    def lookup(self, value):
+        """Code of `value`, -1 when it has none."""
+        return self.index.get(value, -1)
+
+    def compact(self, codes):
+        """Keep the values still referenced by `codes`, return the old -> new code mapping."""
+        used = np.unique(codes)
+        remap = np.full(len(self.values), -1, dtype="int32")
+        remap[used] = np.arange(len(used), dtype="int32")
+        self.replace([self.values[i] for i in used.tolist()])
+        return remap
+
+    def replace(self, values):
+        self.values = values
+        self.index = {v: i for i, v in enumerate(values)}
+
+
+def _text_order(value):
+    # NULLs sort first, like the empty string
+    return "" if value is None else value
+
+
+def _ranks(dictionary: Dictionary, codes):
+    """Position of each code's value in text order, so string columns sort as integers."""
+    distinct, inverse = np.unique(codes, return_inverse=True)
+    order = sorted(range(len(distinct)), key=lambda i: _text_order(dictionary.values[distinct[i]]))
+    ranks = np.empty(len(distinct), dtype="int64")
+    ranks[order] = np.arange(len(distinct))
+    return ranks[inverse]
+
+
+class WindowStore:
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self.watermark: datetime | None = None
+        self.covered_from: datetime | None = None
+        self.columns = {}
+        self.head = self.tail = 0
+        self.hits = 0
+        self.fallbacks = 0
+        self.tick_seconds: float | None = None
+
+    def _reset(self):
+        self.watermark = self.covered_from = None
+        self.columns = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self.head = self.tail = 0
+        self.groups, self.phones, self.texts, self.labels = Dictionary(), Dictionary(), Dictionary(), Dictionary()
+        self.pairs = Dictionary()  # (group code, phone code)
+
+    # --- lifecycle ---
+
+    async def start(self):
+        if np is None:
+            raise RuntimeError("WINDOW_STORE_ENABLED requires the 'numpy' package")
+        self._reset()
+        # the first tick loads the whole retention window in the background, listings use SQL until then
+        self._task = asyncio.create_task(self._run(), context=contextvars.Context())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            try:
+                # the primary: rows a lagging replica has not seen yet would never be picked up
+                async with SessionLocal() as session:
+                    with stage("window_tick"):
+                        await self.tick(session)
+            except Exception:
+                logger.exception("window store tick failed")
+            self.tick_seconds = time.perf_counter() - started
+            await asyncio.sleep(settings.WINDOW_TICK_SECONDS)
+
+    # --- tailing ---
+
+    async def tick(self, session, now: datetime | None = None):
+        end = now or datetime.now()
+        cutoff = end - timedelta(seconds=settings.WINDOW_RETENTION_SECONDS)
+        since = None
+        if self.watermark is not None:
+            since = max(self.watermark - timedelta(seconds=settings.WINDOW_LATENESS_SECONDS), cutoff)
+
+        stmt = (
+            select(
+                SMS_Data.ts,
+                SMS_Data.group_id,
+                SMS_Data.sdt_in,
+                SMS_Data.text_sms,
+                SMS_Data.predicted_label,
+                AGG_MESSAGE_KEY.label("agg_key"),
+            )
+            .where(SMS_Data.ts > since if since is not None else SMS_Data.ts >= cutoff, SMS_Data.ts <= end)
+            .order_by(SMS_Data.ts)
+        )
+        result = await session.stream(stmt.execution_options(yield_per=settings.EXPORT_BATCH_SIZE))
+        # new dictionary codes are not referenced by any row yet, encoding can interleave with readers
+        batches = [self._encode(rows) async for rows in result.partitions()]
+
+        # the rows are swapped in without yielding, a listing never sees half a tick
+        if since is not None:
+            self.tail = self.head + int(np.searchsorted(self._rows()["ts"], np.datetime64(since, "us"), side="right"))
+        for batch in batches:
+            self._append(batch)
+        self.head += int(np.searchsorted(self._rows()["ts"], np.datetime64(cutoff, "us"), side="left"))
+        self.covered_from, self.watermark = cutoff, end
+        if max(map(len, self._dictionaries().values())) > 2 * (self.tail - self.head) + COMPACT_SLACK:
+            self._compact()
+
+    def _encode(self, rows):
+        ts, group_id, sdt_in, text_sms, predicted_label, agg_key = zip(*rows)
+        groups = self.groups.encode(group_id)
+        phones = self.phones.encode(sdt_in)
+        keys = [int(k) + KEY_OFFSET for k in agg_key]
+        return {
+            "ts": np.array(ts, dtype="datetime64[us]"),
+            "group": groups,
+            "phone": phones,
+            "pair": self.pairs.encode(list(zip(groups.tolist(), phones.tolist()))),
+            "text": self.texts.encode(text_sms),
+            "label": self.labels.encode(predicted_label),
+            "key_hi": np.fromiter((k >> 64 for k in keys), dtype="uint8", count=len(keys)),
+            "key_lo": np.fromiter((k & KEY_MASK for k in keys), dtype="uint64", count=len(keys)),
+        }
+
+    def _rows(self):
+        """Views of the rows in the window."""
+        return {name: column[self.head:self.tail] for name, column in self.columns.items()}
+
+    def _append(self, batch):
+        n = len(batch["ts"])
+        live = self.tail - self.head
+        if self.tail + n > len(self.columns["ts"]):
+            # move the rows to the front of fresh arrays, with as much room again for the next ticks
+            capacity = max(2 * (live + n), 1024)
+            for name, column in self.columns.items():
+                moved = np.empty(capacity, dtype=column.dtype)
+                moved[:live] = column[self.head:self.tail]
+                self.columns[name] = moved
+            self.head, self.tail = 0, live
+        for name, values in batch.items():
+            self.columns[name][self.tail:self.tail + n] = values
+        self.tail += n
+
+    def _dictionaries(self):
+        return {"group": self.groups, "phone": self.phones, "pair": self.pairs, "text": self.texts, "label": self.labels}
+
+    def _compact(self):
+        # evicted rows leave their values behind, drop them and renumber the rows' codes
+        rows = self._rows()
+        remaps = {}
+        for name, dictionary in self._dictionaries().items():
+            remaps[name] = dictionary.compact(rows[name])
+            rows[name][:] = remaps[name][rows[name]]
+        group_remap, phone_remap = remaps["group"].tolist(), remaps["phone"].tolist()
+        self.pairs.replace([(group_remap[g], phone_remap[p]) for g, p in self.pairs.values])
+
+    # --- listings ---
+
+    def covers(self, from_datetime: datetime, to_datetime: datetime, text_keyword=None, phone_num=None, phone_match: PhoneMatch = "contains"):
+        """Whether a listing can be answered from memory."""
+        if self._task is None:
+            return False
+        covered = (
+            self.watermark is not None
+            and not text_keyword
+            and (not phone_num or phone_predicate(phone_num, phone_match) is not None)
+            and self.covered_from <= naive(from_datetime)
+            # the rows after the watermark are picked up by the next tick
+            and naive(to_datetime) <= self.watermark + timedelta(seconds=settings.WINDOW_TICK_SECONDS)
+        )
+        if covered:
+            self.hits += 1
+        else:
+            self.fallbacks += 1
+        return covered
+
+    def listing(self, kind: str, from_datetime: datetime, to_datetime: datetime, paginate_keys, phone_num=None, phone_match: PhoneMatch = "contains"):
+        """
+        The page groups in sort order and their message counts, as the SQL path returns them.
+        `paginate_keys(keys, key_size)` picks the page out of the sorted qualified groups like `paginate_sorted`.
+        """
+        rows = self._rows()
+        # ts BETWEEN from AND to, both ends included
+        first = np.searchsorted(rows["ts"], np.datetime64(naive(from_datetime), "us"), side="left")
+        last = np.searchsorted(rows["ts"], np.datetime64(naive(to_datetime), "us"), side="right")
+        rows = {name: column[first:last] for name, column in rows.items()}
+        if phone_num:
+            matches = phone_predicate(phone_num, phone_match)
+            keep = np.fromiter(map(matches, self.phones.values), dtype=bool, count=len(self.phones))
+            selected = keep[rows["phone"]]
+            rows = {name: column[selected] for name, column in rows.items()}
+
+        by_phone = kind == "content"
+        by = rows["pair"] if by_phone else rows["group"]
+        size = len(self.pairs) if by_phone else len(self.groups)
+
+        # grouped counts, then the spam/not_spam thresholds
+        frequency = np.bincount(by, minlength=size)
+        spam_count = np.bincount(by[rows["label"] == self.labels.lookup("spam")], minlength=size)
+        not_spam_count = np.bincount(by[rows["label"] == self.labels.lookup("not_spam")], minlength=size)
+        qualified = np.flatnonzero(
+            ((frequency >= 20) & (spam_count > not_spam_count))
+            | ((frequency >= 30) & (spam_count <= not_spam_count))
+        )
+
+        # first_ts: the rows are in ts order, a group's first row has it
+        first_row = np.full(size, len(by), dtype="int64")
+        np.minimum.at(first_row, by, np.arange(len(by)))
+        first_ts = rows["ts"][first_row[qualified]] if len(qualified) else np.empty(0, dtype="datetime64[us]")
+
+        # order by (first_ts, group_id[, sdt_in])
+        if by_phone:
+            group_codes = np.array([self.pairs.values[c][0] for c in qualified.tolist()], dtype="int32")
+            phone_codes = np.array([self.pairs.values[c][1] for c in qualified.tolist()], dtype="int32")
+            order = np.lexsort((_ranks(self.phones, phone_codes), _ranks(self.groups, group_codes), first_ts))
+            phone_codes = phone_codes[order]
+        else:
+            group_codes = qualified
+            order = np.lexsort((_ranks(self.groups, group_codes), first_ts))
+        qualified, group_codes, first_ts = qualified[order], group_codes[order], first_ts[order]
+
+        group_ids = [self.groups.values[c] for c in group_codes.tolist()]
+        sort_keys = [first_ts.astype(datetime).tolist(), [_text_order(g) for g in group_ids]]
+        if by_phone:
+            phones = [self.phones.values[c] for c in phone_codes.tolist()]
+            sort_keys.append([_text_order(p) for p in phones])
+        page, direction, position = paginate_keys(list(zip(*sort_keys)), len(sort_keys))
+        page_codes = qualified[page.start:page.stop]
+
+        # rows of the page groups: their representative message (smallest key) and message counts
+        in_page = np.isin(by, page_codes)
+        page_by, texts = by[in_page], rows["text"][in_page]
+        smallest = np.lexsort((rows["key_lo"][in_page], rows["key_hi"][in_page], page_by))
+        heads = smallest[np.r_[True, page_by[smallest][1:] != page_by[smallest][:-1]]] if len(smallest) else smallest
+        agg_text = dict(zip(page_by[heads].tolist(), texts[heads].tolist()))
+        counted, counts = np.unique(page_by.astype("int64") * max(len(self.texts), 1) + texts, return_counts=True)
+
+        # the top LISTING_TOP_MESSAGES of each group, by count then text like the SQL ranking
+        messages = defaultdict(list)
+        for combined, count in zip(counted.tolist(), counts.tolist()):
+            code, text = divmod(combined, max(len(self.texts), 1))
+            messages[code].append((self.texts.values[text], count))
+        for group_messages in messages.values():
+            group_messages.sort(key=lambda m: (-m[1], _text_order(m[0])))
+
+        grouped_records = []
+        messages_dict = defaultdict(list)
+        for i in page:
+            code = int(qualified[i])
+            key = (group_ids[i], phones[i]) if by_phone else group_ids[i]
+            messages_dict[key] = messages[code][:settings.LISTING_TOP_MESSAGES]
+            grouped_records.append(WindowGroup(
+                group_id=group_ids[i],
+                sdt_in=phones[i] if by_phone else None,
+                first_ts=sort_keys[0][i],
+                frequency=int(frequency[code]),
+                agg_message=self.texts.values[agg_text[code]],
+                label="spam" if spam_count[code] >= not_spam_count[code] else "not_spam",
+                total_records=len(qualified),
+                total_estimated=False,
+                messages_total=len(messages[code]),
+            ))
+        return grouped_records, messages_dict, direction, position
+
+    def status(self):
+        rows = self.tail - self.head
+        return {
+            "enabled": self._task is not None,
+            "covered_from": self.covered_from,
+            "watermark": self.watermark,
+            "rows": rows,
+            "bytes": sum(column.itemsize for column in self.columns.values()) * rows,
+            "distinct": {name: len(dictionary) for name, dictionary in self._dictionaries().items()} if self.columns else {},
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+            "tick_seconds": None if self.tick_seconds is None else round(self.tick_seconds, 6),
+        }
+
+
+window_store = WindowStore()
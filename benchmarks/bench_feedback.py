@@ -0,0 +1,100 @@
+"""
+Feedback update throughput: legacy single OR/CASE statement vs the bulk path.
+
+    python -m benchmarks.bench_feedback                # build + compile only
+    python -m benchmarks.bench_feedback --execute      # also run against the configured DB (rolled back)
+"""
+import argparse
+import asyncio
+import random
+import time
+from sqlalchemy import bindparam, case, or_, update
+from sqlalchemy.dialects import mysql
+from app.feedback import latest_feedback, feedback_update_stmts
+from app.models import SMS_Data
+from app.schemas import ContentFeedback
+
+SIZES = (10, 1_000, 50_000)
+KEY_COLUMNS = (SMS_Data.group_id, SMS_Data.sdt_in)
+
+
+def make_payload(n: int, duplicate_ratio: float = 0.1):
+    rng = random.Random(n)
+    distinct = max(1, int(n * (1 - duplicate_ratio)))
+    return [
+        ContentFeedback(
+            group_id=f"group_{k}",
+            sdt_in=f"09{k:08d}",
+            feedback=rng.random() < 0.5
+        )
+        for k in (rng.randrange(distinct) for _ in range(n))
+    ]
+
+
+def legacy_stmts(items):
+    where_conditions, case_conditions, params = [], [], {}
+    for idx, item in enumerate(items):
+        params[f"gid_{idx}"] = item.group_id
+        params[f"sdt_{idx}"] = item.sdt_in
+        params[f"fb_{idx}"] = item.feedback
+        condition = (SMS_Data.group_id == bindparam(f"gid_{idx}")) & (SMS_Data.sdt_in == bindparam(f"sdt_{idx}"))
+        where_conditions.append(condition)
+        case_conditions.append((condition, bindparam(f"fb_{idx}")))
+    stmt = (
+        update(SMS_Data)
+        .where(or_(*where_conditions))
+        .values(feedback=case(*case_conditions, else_=SMS_Data.feedback))
+    )
+    return [(stmt, params)]
+
+
+def bulk_stmts(items, batch_size: int):
+    pending = list(latest_feedback(items, KEY_COLUMNS).items())
+    return [
+        (stmt, {})
+        for start in range(0, len(pending), batch_size)
+        for stmt in feedback_update_stmts(pending[start:start + batch_size], KEY_COLUMNS)
+    ]
+
+
+def compile_all(stmts):
+    dialect = mysql.dialect()
+    return sum(
+        len(str(stmt.compile(dialect=dialect, compile_kwargs={"render_postcompile": True})))
+        for stmt, _ in stmts
+    )
+
+
+async def execute_all(stmts):
+    from app.db import SessionLocal
+    async with SessionLocal() as session:
+        for stmt, params in stmts:
+            await session.execute(stmt.execution_options(synchronize_session=False), params)
+        await session.rollback()
+
+
+def run(size: int, batch_size: int, execute: bool):
+    items = make_payload(size)
+    rows = []
+    for name, build in (("legacy", legacy_stmts), ("bulk", lambda i: bulk_stmts(i, batch_size))):
+        start = time.perf_counter()
+        stmts = build(items)
+        sql_bytes = compile_all(stmts)
+        if execute:
+            asyncio.run(execute_all(stmts))
+        elapsed = time.perf_counter() - start
+        rows.append((name, size, len(stmts), sql_bytes, elapsed, size / elapsed))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--execute", action="store_true", help="Execute the statements against the configured DB")
+    args = parser.parse_args()
+
+    print(f"{'path':<8}{'items':>8}{'stmts':>7}{'sql bytes':>13}{'seconds':>10}{'items/s':>12}")
+    for size in args.sizes:
+        for name, n, stmts, sql_bytes, elapsed, rate in run(size, args.batch_size, args.execute):
+            print(f"{name:<8}{n:>8}{stmts:>7}{sql_bytes:>13}{elapsed:>10.3f}{rate:>12.0f}")
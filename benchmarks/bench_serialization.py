@@ -0,0 +1,121 @@
+"""
+Listing serialization: response models + FastAPI validation vs rows encoded straight to JSON.
+
+    python -m benchmarks.bench_serialization
+    python -m benchmarks.bench_serialization --page-size 100 --messages 500
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from benchmarks.standin import use_standin
+
+# nothing is queried, but the app settings need a database
+use_standin()
+from app.schemas import BasePaginatedResponseContent, SMSGroupedContent, MessageCount
+from app.serialization import page_payload, content_groups
+
+loop = asyncio.new_event_loop()
+
+PageRow = namedtuple("PageRow", "group_id sdt_in first_ts frequency agg_message label messages_total total_records")
+
+
+def make_page(page_size: int, messages: int, seed: int = 0):
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1, 12, 0, 0)
+    rows, messages_dict = [], {}
+    for g in range(page_size):
+        row = PageRow(
+            group_id=f"group_{g}",
+            sdt_in=f"0912{rng.randrange(10**6):06d}",
+            first_ts=start + timedelta(seconds=g, microseconds=rng.randrange(10**6)),
+            frequency=rng.randrange(20, 5000),
+            agg_message=f"Khuyến mãi {g}: nhận quà tại http://example.com/{g}",
+            label=rng.choice(("spam", "not_spam")),
+            messages_total=messages,
+            total_records=10_000,
+        )
+        rows.append(row)
+        messages_dict[(row.group_id, row.sdt_in)] = [
+            (f"Tin nhắn \"{m}\" số {rng.randrange(10**9)}", rng.randrange(1, 50)) for m in range(messages)
+        ]
+    return rows, messages_dict
+
+
+def legacy_body(field, rows, messages_dict):
+    response = BasePaginatedResponseContent(
+        status_code=200,
+        message="Success",
+        data=[
+            SMSGroupedContent(
+                stt=i,
+                group_id=r.group_id,
+                sdt_in=r.sdt_in,
+                frequency=r.frequency,
+                ts=r.first_ts,
+                agg_message=r.agg_message,
+                label=r.label,
+                messages=[
+                    MessageCount(text_sms=text_sms, count=count)
+                    for text_sms, count in messages_dict.get((r.group_id, r.sdt_in), [])
+                ],
+                messages_total=r.messages_total,
+            )
+            for i, r in enumerate(rows, start=1)
+        ],
+        error=False,
+        error_message="",
+        page=1,
+        limit=len(rows),
+        total=rows[0].total_records,
+    )
+    # what FastAPI does with the declared return type
+    content = loop.run_until_complete(serialize_response(field=field, response_content=response))
+    return JSONResponse(content).body
+
+
+def fast_body(rows, messages_dict):
+    return JSONResponse(page_payload(
+        BasePaginatedResponseContent,
+        status_code=200,
+        message="Success",
+        data=content_groups(rows, messages_dict, 1),
+        error=False,
+        error_message="",
+        page=1,
+        limit=len(rows),
+        total=int(rows[0].total_records),
+    )).body
+
+
+def timed(fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--messages", type=int, nargs="+", default=[1, 20, 200])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    field = create_model_field(name="Response", type_=BasePaginatedResponseContent, mode="serialization")
+    print(f"{'messages/group':>15}{'bytes':>11}{'legacy ms':>12}{'fast ms':>10}{'speedup':>9}")
+    for n in args.messages:
+        rows, messages_dict = make_page(args.page_size, n)
+        legacy = legacy_body(field, rows, messages_dict)
+        fast = fast_body(rows, messages_dict)
+        assert legacy == fast, "fast serialization output differs from the response model output"
+        t_legacy = timed(lambda: legacy_body(field, rows, messages_dict), args.repeat)
+        t_fast = timed(lambda: fast_body(rows, messages_dict), args.repeat)
+        print(f"{n:>15}{len(fast):>11}{t_legacy * 1000:>12.2f}{t_fast * 1000:>10.2f}{t_legacy / t_fast:>8.1f}x")
@@ -0,0 +1,254 @@
+"""
+Load driver for the listing, messages, batch, export and feedback routes.
+
+    python -m benchmarks.load --output bench_results.json
+    python -m benchmarks.load --skip-generate --baseline bench_results.json --output after.json
+    python -m benchmarks.load --base-url http://staging:8000 --skip-generate
+
+By default it generates the synthetic dataset into the SQLite stand-in,
+starts the app on it (`benchmarks.serve`), and for each concurrency level
+sends --requests requests per endpoint. Latency percentiles, throughput and
+the server's peak RSS are written to --output and compared with --baseline,
+the --output of an earlier run.
+
+Left out: export job polling and downloads (their paths carry the id of a
+submitted job, only the submission is measured), the /live SSE streams,
+which never end, and /internal and /metrics. The arrow and parquet exports
+need pyarrow on the server, without it they count as errors.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from dataclasses import asdict
+from datetime import timedelta, timezone
+import httpx
+from benchmarks.generator import GeneratorConfig, add_generator_args, config_from_args, group_id_for, phone_for, load
+from benchmarks.standin import DEFAULT_URL, use_standin
+
+
+def build_endpoints(cfg: GeneratorConfig):
+    """(name, method, path, params, json body) of the measured requests, over the generated window."""
+    window = {
+        "from_datetime": (cfg.end - cfg.window + timedelta(seconds=1)).replace(tzinfo=timezone.utc).isoformat(),
+        "to_datetime": cfg.end.replace(tzinfo=timezone.utc).isoformat(),
+    }
+    rng = random.Random(cfg.seed)
+    groups = [rng.randrange(cfg.groups) for _ in range(50)]
+    content_feedback = [
+        {"group_id": group_id_for(g), "sdt_in": phone_for(cfg, g, 0), "feedback": bool(i % 2)}
+        for i, g in enumerate(groups)
+    ]
+    frequency_feedback = [{"group_id": group_id_for(g), "feedback": bool(i % 2)} for i, g in enumerate(groups)]
+    batch = [
+        {"kind": kind, **window, "page": page, "page_size": 50}
+        for kind in ("content", "frequency") for page in (1, 2, 3)
+    ]
+    group_id, sdt_in = group_id_for(groups[0]), phone_for(cfg, groups[0], 0)
+    return [
+        ("content_list", "GET", "/content/", {**window, "page_size": 50}, None),
+        ("content_list_deep_page", "GET", "/content/", {**window, "page_size": 50, "page": 10}, None),
+        ("content_list_keyword", "GET", "/content/", {**window, "page_size": 50, "text_keyword": "khuyen mai"}, None),
+        ("content_list_phone", "GET", "/content/", {**window, "page_size": 50, "phone_num": "0900"}, None),
+        ("content_list_phone_exact", "GET", "/content/",
+         {**window, "page_size": 50, "phone_num": phone_for(cfg, groups[0], 0), "phone_match": "exact"}, None),
+        ("content_messages", "GET", f"/content/{group_id}/{sdt_in}/messages", {**window, "page_size": 50}, None),
+        ("content_export", "GET", "/content/export", window, None),
+        ("content_export_csv", "GET", "/content/export", {**window, "format": "csv"}, None),
+        ("content_export_ndjson", "GET", "/content/export", {**window, "format": "ndjson"}, None),
+        ("content_export_arrow", "GET", "/content/export", {**window, "format": "arrow"}, None),
+        ("content_export_parquet", "GET", "/content/export", {**window, "format": "parquet"}, None),
+        # identical submissions share one job, after the first this measures the submission path
+        ("content_export_job", "POST", "/content/export/jobs", window, None),
+        ("content_feedback", "PUT", "/content/", None, content_feedback),
+        ("frequency_list", "GET", "/frequency/", {**window, "page_size": 50}, None),
+        ("frequency_list_deep_page", "GET", "/frequency/", {**window, "page_size": 50, "page": 5}, None),
+        ("frequency_list_keyword", "GET", "/frequency/", {**window, "page_size": 50, "text_keyword": "khuyen mai"}, None),
+        ("frequency_messages", "GET", f"/frequency/{group_id}/messages", {**window, "page_size": 50}, None),
+        ("frequency_export", "GET", "/frequency/export", window, None),
+        ("frequency_export_csv", "GET", "/frequency/export", {**window, "format": "csv"}, None),
+        ("frequency_export_job", "POST", "/frequency/export/jobs", window, None),
+        ("frequency_feedback", "PUT", "/frequency/", None, frequency_feedback),
+        ("batch", "POST", "/batch/", None, batch),
+    ]
+
+
+def percentile(sorted_values, q: float):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+async def run_level(client: httpx.AsyncClient, endpoint, concurrency: int, requests: int):
+    name, method, path, params, body = endpoint
+    latencies, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, params=params, json=body)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "throughput_rps": round(requests / elapsed, 3),
+    }
+
+
+async def run_all(base_url: str, endpoints, levels, requests: int, timeout: float):
+    results = {}
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        for endpoint in endpoints:
+            results[endpoint[0]] = {}
+            for concurrency in levels:
+                stats = await run_level(client, endpoint, concurrency, requests)
+                results[endpoint[0]][str(concurrency)] = stats
+                print(
+                    f"{endpoint[0]:<26}c={concurrency:<4}p50={stats['p50_ms']:>9.2f}ms "
+                    f"p95={stats['p95_ms']:>9.2f}ms p99={stats['p99_ms']:>9.2f}ms "
+                    f"{stats['throughput_rps']:>8.1f} req/s errors={stats['errors']}"
+                )
+    return results
+
+
+def peak_rss_mb(pid: int):
+    """Peak resident set size of a process (Linux /proc), None when unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def start_server(url: str, port: int, cache: bool):
+    env = dict(os.environ)
+    if cache:
+        env.setdefault("CACHE_BACKEND", "memory")
+    else:
+        env["CACHE_BACKEND"] = "none"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.serve", "--url", url, "--port", str(port)],
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("benchmark server exited during startup")
+        try:
+            if httpx.get(base_url + "/", timeout=1).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("benchmark server did not start within 30s")
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """Print per endpoint/level changes against a baseline, return the regressions."""
+    regressions = []
+    for name, levels in results["results"].items():
+        for level, stats in levels.items():
+            base = baseline.get("results", {}).get(name, {}).get(level)
+            if not base:
+                continue
+            p95_change = stats["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+            rps_change = stats["throughput_rps"] / base["throughput_rps"] - 1 if base["throughput_rps"] else 0.0
+            regressed = p95_change > tolerance or rps_change < -tolerance
+            if regressed:
+                regressions.append((name, level))
+            print(
+                f"{name:<26}c={level:<4}p95 {p95_change:+7.1%}  throughput {rps_change:+7.1%}"
+                f"{'  REGRESSION' if regressed else ''}"
+            )
+    base_rss, rss = baseline.get("peak_rss_mb"), results.get("peak_rss_mb")
+    if base_rss and rss:
+        print(f"peak RSS {rss} MB (baseline {base_rss} MB, {rss / base_rss - 1:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=DEFAULT_URL, help="Database URL of the stand-in (or a real DB)")
+    parser.add_argument("--base-url", help="Hit an already running app instead of starting one")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--skip-generate", action="store_true", help="Reuse the existing dataset")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--cache", action="store_true", help="Keep the result cache enabled on the server")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="Results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative p95/throughput regression")
+    add_generator_args(parser)
+    args = parser.parse_args()
+
+    cfg = config_from_args(args)
+    use_standin(args.url)
+    if not args.skip_generate:
+        asyncio.run(load(args.url, cfg))
+
+    process = None
+    base_url = args.base_url
+    if base_url is None:
+        process, base_url = start_server(args.url, args.port, args.cache)
+    try:
+        results = asyncio.run(run_all(base_url, build_endpoints(cfg), args.concurrency, args.requests, args.timeout))
+        rss = peak_rss_mb(process.pid) if process else None
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    report = {
+        "meta": {
+            "generator": {k: str(v) for k, v in asdict(cfg).items()},
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "cache": args.cache,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "peak_rss_mb": rss,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
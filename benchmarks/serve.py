@@ -0,0 +1,40 @@
+"""
+Run the app against the local stand-in database.
+
+    python -m benchmarks.serve --url sqlite+aiosqlite:///bench.db --port 8001
+
+A copy of the database file can stand in for a read replica. SQLite does not
+replicate: the replica gets the heartbeat of the primary, so it enters the
+rotation, but not the feedback written to the primary.
+
+    cp bench.db replica.db
+    python -m benchmarks.serve --url sqlite+aiosqlite:///bench.db --replica-url sqlite+aiosqlite:///replica.db
+"""
+import argparse
+import json
+import os
+from benchmarks.standin import DEFAULT_URL, install_shims, replicate_heartbeat, use_standin
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--replica-url", action="append", default=[], help="read replica, repeatable")
+    args = parser.parse_args()
+
+    use_standin(args.url)
+    if args.replica_url:
+        os.environ["DB_REPLICA_URLS"] = json.dumps(args.replica_url)
+
+    import uvicorn
+    from app.db import engine
+    from app.main import app
+    from app.replicas import replica_set
+
+    install_shims(engine)
+    for replica in replica_set.replicas:
+        install_shims(replica.engine)
+    # SQLite does not replicate, the heartbeat is copied so the replicas enter the rotation
+    replicate_heartbeat(replica_set)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
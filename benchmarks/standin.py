@@ -0,0 +1,156 @@
+"""
+Local stand-in for the StarRocks backend: SQLite (aiosqlite) with the
+StarRocks-only functions the queries use registered as Python shims.
+"""
+import hashlib
+import os
+import re
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+DEFAULT_URL = "sqlite+aiosqlite:///bench.db"
+DEFAULT_TABLE = "sms_data"
+
+# same text layout as SQLAlchemy's SQLite DateTime storage, so comparisons stay lexical-safe
+SQLITE_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+class MinBy:
+    """min_by(value, key): the value of the row with the smallest key."""
+
+    def __init__(self):
+        self.key = None
+        self.value = None
+
+    def step(self, value, key):
+        if key is not None and (self.key is None or key < self.key):
+            self.key, self.value = key, value
+
+    def finalize(self):
+        return self.value
+
+
+class ApproxCountDistinct:
+    """approx_count_distinct(value), counted exactly: the stand-in has no HyperLogLog."""
+
+    def __init__(self):
+        self.values = set()
+
+    def step(self, value):
+        if value is not None:
+            self.values.add(value)
+
+    def finalize(self):
+        return len(self.values)
+
+
+def xx_hash3_64(value):
+    # a stable 64-bit hash shifted to 56 bits, so unix_timestamp * 1e9 + hash stays in SQLite's int64
+    if value is None:
+        return None
+    digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True) >> 8
+
+
+def _parse(value):
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+def unix_timestamp(value):
+    return None if value is None else int(_parse(value).timestamp())
+
+
+def date_trunc(unit, value):
+    if value is None:
+        return None
+    dt = _parse(value)
+    if unit == "second":
+        dt = dt.replace(microsecond=0)
+    elif unit == "minute":
+        dt = dt.replace(second=0, microsecond=0)
+    elif unit == "hour":
+        dt = dt.replace(minute=0, second=0, microsecond=0)
+    else:
+        raise ValueError(f"date_trunc unit not supported by the stand-in: {unit}")
+    return dt.strftime(SQLITE_DATETIME_FORMAT)
+
+
+def regexp_replace(value, pattern, replacement):
+    return None if value is None else re.sub(pattern, replacement, str(value))
+
+
+def concat(*values):
+    return None if None in values else "".join(str(v) for v in values)
+
+
+def reverse(value):
+    return None if value is None else str(value)[::-1]
+
+
+def _register(conn):
+    conn.create_aggregate("min_by", 2, MinBy)
+    conn.create_aggregate("approx_count_distinct", 1, ApproxCountDistinct)
+    conn.create_function("xx_hash3_64", 1, xx_hash3_64, deterministic=True)
+    conn.create_function("unix_timestamp", 1, unix_timestamp, deterministic=True)
+    conn.create_function("date_trunc", 2, date_trunc, deterministic=True)
+    conn.create_function("regexp_replace", 3, regexp_replace, deterministic=True)
+    conn.create_function("concat", -1, concat, deterministic=True)
+    conn.create_function("reverse", 1, reverse, deterministic=True)
+    # LIKE 'prefix%' on the phone columns can then seek their (binary) indexes
+    conn.execute("PRAGMA case_sensitive_like = ON")
+
+
+def install_shims(engine: AsyncEngine):
+    """Register the shims on every new connection of an aiosqlite engine."""
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        # aiosqlite runs the sqlite3 connection in its own thread
+        dbapi_connection.run_async(lambda conn: conn._execute(_register, conn._conn))
+
+
+def create_standin_engine(url: str = DEFAULT_URL, **kwargs):
+    engine = create_async_engine(url, **kwargs)
+    install_shims(engine)
+    return engine
+
+
+def replicate_heartbeat(replica_set, lag_seconds: dict[str, float] | None = None):
+    """
+    Stand-in replication: copy every heartbeat the primary writes to each replica
+    database, `lag_seconds[replica.name]` seconds old, so replicas rotate in (and
+    out, when lagging) as they would behind a replicating primary.
+    """
+    from datetime import timedelta
+    from app.models import Replica_Heartbeat
+    from app.replicas import HEARTBEAT_NAME
+
+    lag_seconds = lag_seconds if lag_seconds is not None else {}
+
+    async def replicate(ts: datetime):
+        for replica in replica_set.replicas:
+            async with replica.engine.begin() as conn:
+                await conn.run_sync(Replica_Heartbeat.__table__.create, checkfirst=True)
+            async with replica.sessions() as session:
+                lag = timedelta(seconds=lag_seconds.get(replica.name, 0))
+                await session.merge(Replica_Heartbeat(name=HEARTBEAT_NAME, ts=ts - lag))
+                await session.commit()
+
+    replica_set.replicate = replicate
+    return lag_seconds
+
+
+def use_standin(url: str = DEFAULT_URL):
+    """
+    Point the app settings at `url` before `app` is imported. The DB_* parts
+    are required by Settings but unused once DATABASE_URL is set.
+    """
+    os.environ["DATABASE_URL"] = url
+    for name, value in (
+        ("DB_USER", "bench"), ("DB_PASSWORD", "bench"), ("DB_HOST", "localhost"),
+        ("DB_PORT", "0"), ("DB_DATABASE", "bench"), ("TABLE_NAME", DEFAULT_TABLE),
+    ):
+        os.environ.setdefault(name, value)
@@ -0,0 +1,43 @@
+"""
+The tests run the app against the SQLite stand-in of benchmarks/standin.py,
+on a small generated dataset shared by the whole session. The settings are
+read when `app` is first imported, so they are set here, before any test
+module imports it.
+"""
+import os
+import tempfile
+import pytest
+from fastapi.testclient import TestClient
+from benchmarks.generator import GeneratorConfig
+from benchmarks.standin import install_shims, use_standin
+
+TMP_DIR = tempfile.mkdtemp(prefix="fastapi_async_tests_")
+DATABASE_URL = f"sqlite+aiosqlite:///{TMP_DIR}/tests.db"
+use_standin(DATABASE_URL)
+os.environ["EXPORT_SPOOL_DIR"] = os.path.join(TMP_DIR, "export_spool")
+os.environ["FEEDBACK_LOG_DIR"] = os.path.join(TMP_DIR, "feedback_log")
+
+DATASET = GeneratorConfig(rows=4000, groups=60, phones_per_group=2)
+WINDOW = {
+    "from_datetime": (DATASET.end - DATASET.window).isoformat() + "Z",
+    "to_datetime": DATASET.end.isoformat() + "Z",
+}
+
+
+@pytest.fixture(scope="session")
+def client():
+    from benchmarks.generator import load
+    from app.db import engine
+    from app.main import app
+
+    install_shims(engine)
+    with TestClient(app) as client:
+        # the dataset is loaded on the app's event loop, the pooled connections belong to it
+        client.portal.call(load, DATABASE_URL, DATASET)
+        yield client
+
+
+@pytest.fixture(scope="session")
+def run(client):
+    """Run a coroutine function on the app's event loop."""
+    return client.portal.call
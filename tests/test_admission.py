@@ -0,0 +1,38 @@
+import asyncio
+import httpx
+from app import admission
+from app.admission import AdmissionMiddleware, Lane
+
+
+def test_full_lane_answers_503_with_retry_after(monkeypatch):
+    lane = Lane("listing", limit=1, queue_size=1)
+    lane.service_time = 2.0
+    monkeypatch.setitem(admission.lanes, "listing", lane)
+    query_done = asyncio.Event()
+
+    async def slow_query(scope, receive, send):
+        # stands in for a listing whose query is still running
+        await query_done.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=AdmissionMiddleware(slow_query))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            running = asyncio.create_task(client.get("/frequency/"))
+            queued = asyncio.create_task(client.get("/frequency/"))
+            while lane.waiting < 1:
+                await asyncio.sleep(0.01)
+            rejected = await client.get("/frequency/")
+            query_done.set()
+            return rejected, await running, await queued
+
+    rejected, running, queued = asyncio.run(scenario())
+
+    assert rejected.status_code == 503
+    # one request ahead in the queue, at 2s a request through a single slot
+    assert rejected.headers["Retry-After"] == "4"
+    assert rejected.json()["error"]
+    assert running.status_code == queued.status_code == 200
+    assert lane.rejected == 1 and lane.admitted == 2
+    assert lane.active == 0 and lane.waiting == 0
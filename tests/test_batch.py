@@ -0,0 +1,74 @@
+import pytest
+from app.routers import batch
+from tests.conftest import WINDOW
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """The listing and span calls made by the batch route, by kind."""
+    calls = []
+
+    def counted(kind, name, function):
+        async def wrapper(*args, **kwargs):
+            calls.append((kind, name))
+            return await function(*args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(batch, "LISTINGS", {
+        kind: (counted(kind, "listing", listing), counted(kind, "span", span))
+        for kind, (listing, span) in batch.LISTINGS.items()
+    })
+    return calls
+
+
+def get_listing(client, kind, **params):
+    return client.get(f"/{kind}/", params={**WINDOW, **params}).json()
+
+
+def test_pages_of_one_filter_set_share_a_span_query(client, calls):
+    queries = [{"kind": "frequency", **WINDOW, "page": page, "page_size": 10} for page in (3, 1, 2)]
+
+    response = client.post("/batch/", json=queries)
+
+    assert response.status_code == 200
+    assert calls == [("frequency", "span")]
+    assert response.json()["data"] == [get_listing(client, "frequency", page=page, page_size=10) for page in (3, 1, 2)]
+
+
+def test_failing_items_do_not_fail_the_others(client, monkeypatch):
+    _, span = batch.LISTINGS["content"]
+
+    async def broken(*args, **kwargs):
+        raise RuntimeError("content listing down")
+
+    monkeypatch.setitem(batch.LISTINGS, "content", (broken, span))
+    queries = [
+        {"kind": "frequency", **WINDOW, "page_size": 10},
+        {"kind": "frequency", "from_datetime": WINDOW["to_datetime"], "to_datetime": WINDOW["from_datetime"]},
+        {"kind": "content", **WINDOW, "page_size": 10},
+    ]
+
+    data = client.post("/batch/", json=queries).json()["data"]
+
+    assert data[0] == get_listing(client, "frequency", page_size=10)
+    assert data[1]["status_code"] == 400 and data[1]["error"]
+    assert data[2]["status_code"] == 500 and data[2]["error_message"] == "Internal error"
+
+
+def test_responses_follow_request_order(client, calls):
+    queries = [
+        {"kind": "content", **WINDOW, "page": 2, "page_size": 10},
+        {"kind": "frequency", **WINDOW, "page": 1, "page_size": 20},
+        {"kind": "content", **WINDOW, "page": 1, "page_size": 10},
+        {"kind": "frequency", **WINDOW, "page_size": 20, "total_mode": "approx"},
+    ]
+
+    data = client.post("/batch/", json=queries).json()["data"]
+
+    expected = [
+        get_listing(client, q["kind"], **{k: v for k, v in q.items() if k not in WINDOW and k != "kind"})
+        for q in queries
+    ]
+    assert data == expected
+    # the two content pages share one span, the frequency ones differ in total_mode and run alone
+    assert sorted(calls) == [("content", "span"), ("frequency", "listing"), ("frequency", "listing")]
@@ -0,0 +1,70 @@
+import asyncio
+import httpx
+from app import budget
+from app.budget import BudgetMiddleware
+
+
+class Killer:
+    """Stands in for the engine KILL QUERY goes through, recording the statements."""
+
+    def __init__(self):
+        self.statements = []
+
+    def connect(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        self.statements.append(str(statement))
+
+
+def test_exceeded_budget_answers_504_and_kills_the_query(monkeypatch):
+    engine, killer = object(), Killer()
+    monkeypatch.setitem(budget.BUDGETS, "listing", 0.2)
+    monkeypatch.setitem(budget._killers, engine, killer)
+    connection = {"server_id": 42}
+    cancelled = []
+
+    async def slow_query(scope, receive, send):
+        # a statement on a connection as instrument_budget records it, then a query that never returns
+        budget._budget.get().connections[id(connection)] = (engine, connection)
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=BudgetMiddleware(slow_query))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/frequency/")
+
+    response = asyncio.run(scenario())
+
+    assert response.status_code == 504
+    assert response.json()["error_message"] == "The request exceeded its listing time budget."
+    assert killer.statements == ["KILL QUERY 42"]
+    assert cancelled == [True]
+    # the pool discards the connection on its next checkout
+    assert connection["doomed"] is True
+
+
+def test_requests_without_a_budget_pass_through(monkeypatch):
+    monkeypatch.setitem(budget.BUDGETS, "listing", 0)
+
+    async def handler(scope, receive, send):
+        assert budget._budget.get() is None
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=BudgetMiddleware(handler))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/frequency/")
+
+    assert asyncio.run(scenario()).status_code == 200
@@ -0,0 +1,52 @@
+import pytest
+from app.cache import MemoryCache, listing_key
+from app.routers import batch, content, frequency
+from app import feedback_queue
+from app.utils import parse_datetime
+from tests.conftest import WINDOW
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = MemoryCache(ttl=60, max_entries=100)
+    for module in (content, frequency, batch, feedback_queue):
+        monkeypatch.setattr(module, "result_cache", cache)
+    return cache
+
+
+def page_key(page):
+    window = parse_datetime(WINDOW["from_datetime"]), parse_datetime(WINDOW["to_datetime"])
+    return listing_key("frequency", *window, None, page, 10, None, "exact")
+
+
+def get_page(client, page):
+    response = client.get("/frequency/", params={**WINDOW, "page": page, "page_size": 10})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_feedback_drops_the_pages_holding_its_groups(client, run, cache):
+    first, second = get_page(client, 1), get_page(client, 2)
+    assert get_page(client, 1) == first
+    assert cache.hits == 1 and cache.stats()["size"] == 2
+
+    group_id = first["data"][0]["group_id"]
+    written = client.put("/frequency/", json=[{"group_id": group_id, "feedback": True}])
+
+    assert written.status_code == 200
+    assert run(cache.get, page_key(1)) is None
+    assert run(cache.get, page_key(2)) is not None
+    assert cache.invalidations == 1
+    assert get_page(client, 2) == second
+
+
+def test_content_feedback_drops_the_pages_holding_its_group(client, run, cache):
+    page = client.get("/content/", params={**WINDOW, "page_size": 10}).json()
+    group = page["data"][0]
+    assert cache.stats()["size"] == 1
+
+    written = client.put("/content/", json=[{"group_id": group["group_id"], "sdt_in": group["sdt_in"], "feedback": False}])
+
+    assert written.status_code == 200
+    assert cache.stats()["size"] == 0
+    assert cache.invalidations == 1
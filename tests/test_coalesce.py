@@ -0,0 +1,35 @@
+import asyncio
+import httpx
+from app.coalesce import SingleFlight
+from app.routers import frequency
+from tests.conftest import WINDOW
+
+
+def test_concurrent_identical_listings_run_one_query(client, run, monkeypatch):
+    flight = SingleFlight(wait_timeout=10)
+    monkeypatch.setattr(frequency, "listing_flight", flight)
+    page = frequency._frequency_page
+    queries = []
+
+    async def slow_page(*args):
+        # a query long enough for the other requests to arrive while it runs
+        queries.append(args)
+        await asyncio.sleep(0.2)
+        return await page(*args)
+
+    monkeypatch.setattr(frequency, "_frequency_page", slow_page)
+
+    async def listings():
+        transport = httpx.ASGITransport(app=client.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await asyncio.gather(*(
+                http.get("/frequency/", params={**WINDOW, "page": 2, "page_size": 10}) for _ in range(5)
+            ))
+
+    responses = run(listings)
+
+    assert len(queries) == 1
+    assert flight.leaders == 1 and flight.followers == 4
+    assert {response.status_code for response in responses} == {200}
+    assert len({response.content for response in responses}) == 1
+    assert responses[0].json()["data"]
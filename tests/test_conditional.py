@@ -0,0 +1,76 @@
+from datetime import timedelta
+import pytest
+from sqlalchemy import insert
+from app.config import settings
+from app.db import SessionLocal
+from app.models import SMS_Data
+from benchmarks.generator import phone_for
+from tests.conftest import DATASET, WINDOW
+
+# ends well before the newest ts: closed; WINDOW ends on it: open
+CLOSED = {
+    "from_datetime": (DATASET.end - DATASET.window).isoformat() + "Z",
+    "to_datetime": (DATASET.end - timedelta(minutes=30)).isoformat() + "Z",
+}
+
+
+@pytest.fixture(autouse=True)
+def conditional(monkeypatch):
+    monkeypatch.setattr(settings, "CONDITIONAL_GET_ENABLED", True)
+    # the watermark is read on every request and settled as soon as it is read
+    monkeypatch.setattr(settings, "CONDITIONAL_WATERMARK_SECONDS", 0)
+
+
+def etag_of(client, params):
+    response = client.get("/frequency/", params={**params, "page_size": 10})
+    assert response.status_code == 200
+    return response.headers["ETag"]
+
+
+def test_current_etag_gets_304(client):
+    etag = etag_of(client, CLOSED)
+
+    response = client.get("/frequency/", params={**CLOSED, "page_size": 10}, headers={"If-None-Match": etag})
+
+    assert etag.startswith('W/"')
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+    # another page is another validator
+    assert client.get("/frequency/", params={**CLOSED, "page_size": 10, "page": 2}, headers={"If-None-Match": etag}).status_code == 200
+
+
+@pytest.mark.parametrize("if_none_match, status", [
+    ("{etag}", 304),
+    ("{strong}", 304),
+    ('W/"other", {etag}', 304),
+    ("*", 304),
+    ('W/"other"', 200),
+])
+def test_if_none_match_compares_weakly(client, if_none_match, status):
+    etag = etag_of(client, CLOSED)
+    header = if_none_match.format(etag=etag, strong=etag.removeprefix("W/"))
+
+    response = client.get("/frequency/", params={**CLOSED, "page_size": 10}, headers={"If-None-Match": header})
+
+    assert response.status_code == status
+
+
+def test_new_rows_change_open_windows_only(client, run):
+    closed, open_ = etag_of(client, CLOSED), etag_of(client, WINDOW)
+    newest = {
+        "id": "conditional-newest", "ts": DATASET.end + timedelta(seconds=5), "sdt_in": phone_for(DATASET, 5, 0),
+        "group_id": "grp-000005", "text_sms": "newest message", "predicted_label": "spam", "feedback": False,
+    }
+
+    async def insert_newest():
+        async with SessionLocal() as session:
+            await session.execute(insert(SMS_Data), [newest])
+            await session.commit()
+
+    run(insert_newest)
+
+    assert etag_of(client, CLOSED) == closed
+    assert etag_of(client, WINDOW) != open_
+    response = client.get("/frequency/", params={**WINDOW, "page_size": 10}, headers={"If-None-Match": open_})
+    assert response.status_code == 200
@@ -0,0 +1,61 @@
+import gzip
+import os
+import time
+from datetime import timedelta
+import pytest
+from app.jobs import export_jobs
+from tests.conftest import WINDOW
+
+
+def wait_for(client, url, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(url).json()["data"]
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"{url} did not finish within {timeout}s")
+
+
+@pytest.mark.parametrize("kind", ["content", "frequency"])
+def test_job_file_matches_streamed_export(client, kind):
+    submitted = client.post(f"/{kind}/export/jobs", params=WINDOW)
+    job_id = submitted.json()["data"]["job_id"]
+
+    job = wait_for(client, f"/{kind}/export/jobs/{job_id}")
+    download = client.get(job["download_url"])
+    streamed = client.get(f"/{kind}/export", params={**WINDOW, "format": "csv"})
+
+    assert submitted.status_code == 202
+    assert job["status"] == "done"
+    assert download.headers["content-type"] == "application/gzip"
+    assert gzip.decompress(download.content).decode() == streamed.text
+    assert job["rows"] == streamed.text.count("\n") - 1
+    # the same export is not run twice
+    assert client.post(f"/{kind}/export/jobs", params=WINDOW).json()["data"]["job_id"] == job_id
+
+
+def test_download_supports_ranges(client):
+    job_id = client.post("/frequency/export/jobs", params=WINDOW).json()["data"]["job_id"]
+    job = wait_for(client, f"/frequency/export/jobs/{job_id}")
+
+    full = client.get(job["download_url"]).content
+    partial = client.get(job["download_url"], headers={"Range": "bytes=10-"})
+
+    assert partial.status_code == 206
+    assert partial.content == full[10:]
+
+
+def test_expired_jobs_are_swept_on_lookup(client, monkeypatch):
+    job_id = client.post("/content/export/jobs", params=WINDOW).json()["data"]["job_id"]
+    wait_for(client, f"/content/export/jobs/{job_id}")
+    path = export_jobs.path(export_jobs.jobs[job_id])
+
+    monkeypatch.setattr(export_jobs, "ttl", timedelta(0))
+
+    assert client.get(f"/content/export/jobs/{job_id}").status_code == 404
+    assert not os.path.exists(path)
+
+
+def test_unknown_job_is_not_found(client):
+    assert client.get("/content/export/jobs/unknown").status_code == 404
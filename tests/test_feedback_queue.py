@@ -0,0 +1,72 @@
+import os
+from sqlalchemy import select
+from app import feedback_queue
+from app.db import SessionLocal
+from app.models import SMS_Data
+from app.schemas import ContentFeedback, FrequencyFeedback
+from benchmarks.generator import group_id_for, phone_for
+from tests.conftest import DATASET
+
+
+def queue(log_dir, owner):
+    q = feedback_queue.FeedbackQueue(str(log_dir))
+    q.owner = owner
+    return q
+
+
+async def crash(q):
+    # the process is gone: nothing flushed, its lock released with its file descriptors
+    q._task.cancel()
+    os.close(q._fd)
+    os.close(q._lock_fd)
+
+
+async def feedback_of(column, value):
+    async with SessionLocal() as session:
+        return set((await session.scalars(select(SMS_Data.feedback).where(column == value))).all())
+
+
+def test_new_queue_recovers_crashed_queue_feedback(client, run, tmp_path):
+    group, sdt_in = group_id_for(10), phone_for(DATASET, 11, 0)
+
+    async def scenario():
+        crashed, live = queue(tmp_path, "host-a-1"), queue(tmp_path, "host-b-1")
+        await crashed.start()
+        await live.start()
+        await crashed.enqueue("frequency", [FrequencyFeedback(group_id=group, feedback=True)])
+        await crashed.enqueue("content", [ContentFeedback(group_id=group_id_for(11), sdt_in=sdt_in, feedback=True)])
+        # a live worker's flush leaves the other worker's segments alone
+        assert await live.flush()
+        assert any("host-a-1" in name for name in os.listdir(tmp_path))
+        await crash(crashed)
+
+        recovering = queue(tmp_path, "host-c-1")
+        await recovering.start()
+        recovered = {kind: dict(keys) for kind, keys in recovering.pending.items()}
+        assert await recovering.flush()
+        await live.stop()
+        await recovering.stop()
+        return recovered, await feedback_of(SMS_Data.group_id, group), await feedback_of(SMS_Data.sdt_in, sdt_in)
+
+    recovered, group_feedback, phone_feedback = run(scenario)
+
+    assert recovered == {
+        "frequency": {(group,): True},
+        "content": {(group_id_for(11), sdt_in): True},
+    }
+    assert group_feedback == {True}
+    assert phone_feedback == {True}
+    assert os.listdir(tmp_path) == []
+
+
+def test_frequency_feedback_supersedes_pending_content_feedback(tmp_path):
+    q = queue(tmp_path, "host-d-1")
+
+    q._buffer("content", (group_id_for(20), phone_for(DATASET, 20, 0)), True)
+    q._buffer("content", (group_id_for(21), phone_for(DATASET, 21, 0)), True)
+    q._buffer("frequency", (group_id_for(20),), False)
+
+    assert q.pending == {
+        "frequency": {(group_id_for(20),): False},
+        "content": {(group_id_for(21), phone_for(DATASET, 21, 0)): True},
+    }
@@ -0,0 +1,95 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import delete, insert
+from app.config import settings
+from app.db import SessionLocal
+from app.live import live_feed
+from app.models import SMS_Data
+from benchmarks.generator import phone_for
+from tests.conftest import DATASET
+
+SCOPE = {
+    "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+    "path": "/frequency/live", "raw_path": b"/frequency/live", "root_path": "", "query_string": b"",
+    "headers": [(b"host", b"test")], "server": ("test", 80), "client": ("test", 50000),
+}
+
+
+@pytest.fixture
+def live_settings(monkeypatch):
+    # a window reaching back to the dataset, ticking fast, rows picked up as soon as they are written
+    window = datetime.now() - (DATASET.end - DATASET.window) + timedelta(minutes=2)
+    monkeypatch.setattr(settings, "LIVE_WINDOW_SECONDS", int(window.total_seconds()))
+    monkeypatch.setattr(settings, "LIVE_LATENESS_SECONDS", 0)
+    monkeypatch.setattr(settings, "LIVE_TICK_SECONDS", 0.1)
+
+
+@pytest.fixture
+def live_rows(run):
+    rows = [
+        {
+            "id": f"live-{i}", "ts": None, "sdt_in": phone_for(DATASET, 7, 0), "group_id": "grp-live",
+            "text_sms": "live message", "predicted_label": "spam", "feedback": False,
+        }
+        for i in range(25)
+    ]
+    yield rows
+
+    async def remove():
+        async with SessionLocal() as session:
+            await session.execute(delete(SMS_Data).where(SMS_Data.group_id == "grp-live"))
+            await session.commit()
+
+    run(remove)
+
+
+async def next_event(messages):
+    while True:
+        message = await asyncio.wait_for(messages.get(), 10)
+        chunk = message.get("body", b"").decode()
+        if chunk.startswith("event:"):
+            name, data = chunk.strip().split("\n")
+            return name.removeprefix("event: "), json.loads(data.removeprefix("data: "))
+
+
+def test_snapshot_then_delta_then_clean_disconnect(client, run, live_settings, live_rows):
+    async def scenario():
+        messages, disconnected = asyncio.Queue(), asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        request = asyncio.create_task(client.app(dict(SCOPE), receive, messages.put))
+        start = await asyncio.wait_for(messages.get(), 10)
+        snapshot = await next_event(messages)
+
+        ts = datetime.now()
+        async with SessionLocal() as session:
+            await session.execute(insert(SMS_Data), [{**row, "ts": ts} for row in live_rows])
+            await session.commit()
+        delta = await next_event(messages)
+
+        disconnected.set()
+        await asyncio.wait_for(request, 10)
+        return start, snapshot, delta
+
+    start, snapshot, delta = run(scenario)
+
+    assert start["status"] == 200
+    assert (b"content-type", b"text/event-stream; charset=utf-8") in start["headers"]
+    name, payload = snapshot
+    assert name == "snapshot"
+    assert payload["groups"]
+    assert "grp-live" not in {group["group_id"] for group in payload["groups"]}
+    name, payload = delta
+    assert name == "delta"
+    [change] = payload["changes"]
+    assert {key: change[key] for key in ("type", "group_id", "frequency", "agg_message", "label")} == {
+        "type": "enter", "group_id": "grp-live", "frequency": 25, "agg_message": "live message", "label": "spam",
+    }
+    # the last subscriber gone, the feed stops its task
+    assert not any(live_feed.subscribers.values())
+    assert live_feed._task is None
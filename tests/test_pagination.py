@@ -0,0 +1,98 @@
+import pytest
+from sqlalchemy import event
+from app.cache import NullCache, result_cache
+from app.totals import totals_store
+from tests.conftest import WINDOW
+
+
+def walk_offset(client, path, params):
+    pages, page = [], 1
+    while True:
+        body = client.get(path, params={**params, "page": page}).json()
+        if not body["data"]:
+            return pages
+        pages.append(body)
+        page += 1
+
+
+def walk_cursor(client, path, params):
+    pages = [client.get(path, params=params).json()]
+    while pages[-1]["next_cursor"]:
+        pages.append(client.get(path, params={**params, "cursor": pages[-1]["next_cursor"]}).json())
+    return pages
+
+
+def walk_back(client, path, params, last_page):
+    pages = [last_page]
+    while pages[-1]["prev_cursor"]:
+        pages.append(client.get(path, params={**params, "cursor": pages[-1]["prev_cursor"]}).json())
+    return pages[::-1]
+
+
+def rows(pages):
+    return [group for page in pages for group in page["data"]]
+
+
+@pytest.mark.parametrize("kind", ["content", "frequency"])
+@pytest.mark.parametrize("total_mode", ["exact", "approx"])
+def test_cursor_walks_match_offset_pages(client, kind, total_mode):
+    path, params = f"/{kind}/", {**WINDOW, "page_size": 10, "total_mode": total_mode}
+
+    offset_pages = walk_offset(client, path, params)
+    forward = walk_cursor(client, path, params)
+    backward = walk_back(client, path, params, forward[-1])
+
+    assert len(offset_pages) > 2
+    assert rows(forward) == rows(offset_pages)
+    assert rows(backward) == rows(offset_pages)
+    assert len(forward) == len(offset_pages)
+    assert all(page["data"] for page in forward)
+    assert [group["stt"] for group in rows(forward)] == list(range(1, len(rows(forward)) + 1))
+
+
+@pytest.mark.parametrize("kind", ["content", "frequency"])
+def test_exact_total_counts_every_group(client, kind):
+    path, params = f"/{kind}/", {**WINDOW, "page_size": 10}
+
+    first = client.get(path, params=params).json()
+
+    assert first["total"] == len(rows(walk_offset(client, path, params)))
+    assert first["prev_cursor"] is None
+
+
+def test_last_page_has_no_next_cursor(client):
+    params = {**WINDOW, "page_size": 10}
+    total = client.get("/frequency/", params=params).json()["total"]
+
+    last = client.get("/frequency/", params={**params, "page": -(-total // 10)}).json()
+
+    assert last["data"]
+    assert last["next_cursor"] is None
+
+
+@pytest.mark.parametrize("kind", ["content", "frequency"])
+def test_total_is_counted_once_without_result_cache(client, kind):
+    from app.db import engine
+
+    counts = []
+
+    def count_totals(conn, cursor, statement, parameters, context, executemany):
+        if "approx_count_distinct" in statement or "OVER () AS total_records" in statement:
+            counts.append(statement)
+
+    totals_store.clear()
+    path, params = f"/{kind}/", {**WINDOW, "page_size": 10}
+    event.listen(engine.sync_engine, "before_cursor_execute", count_totals)
+    try:
+        for mode in ("exact", "approx"):
+            pages = walk_offset(client, path, {**params, "total_mode": mode})
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", count_totals)
+
+    assert isinstance(result_cache, NullCache)
+    assert len(pages) > 2
+    # the exact total of the first page serves every later page, approx ones included
+    assert len(counts) == 1
+    assert {page["total"] for page in pages} == {pages[0]["total"]}
+    assert not any(page["total_estimated"] for page in pages)
+    assert result_cache.hits == 0
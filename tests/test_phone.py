@@ -0,0 +1,40 @@
+import pytest
+from sqlalchemy import select
+from app.db import SessionLocal
+from app.models import SMS_Data
+from app.phone import phone_filter, phone_predicate
+from benchmarks.generator import phone_for
+from tests.conftest import DATASET
+
+# stored as 0900000006, +84900000007 and 84900000008
+NATIONAL, INTERNATIONAL, BARE = phone_for(DATASET, 3, 0), phone_for(DATASET, 3, 1), phone_for(DATASET, 4, 0)
+
+
+@pytest.mark.parametrize("phone_num, match, expected", [
+    ("+84 900 000 006", "exact", {NATIONAL}),
+    ("0900000007", "exact", {INTERNATIONAL}),
+    ("84900000008", "exact", {BARE}),
+    ("00 84 900000006", "exact", {NATIONAL}),
+    ("09000000", "prefix", {phone_for(DATASET, g, k) for g in range(50) for k in range(2)}),
+    ("+84 9000000 0", "prefix", {phone_for(DATASET, g, k) for g in range(5) for k in range(2)}),
+    ("0006", "suffix", {NATIONAL}),
+    ("06", "suffix", {NATIONAL, phone_for(DATASET, 53, 0)}),
+    # whole numbers, made canonical before they are reversed
+    ("0900000007", "suffix", {INTERNATIONAL}),
+    ("+84900000006", "suffix", {NATIONAL}),
+    ("+8490000000", "contains", {phone_for(DATASET, g, k) for g in range(5) for k in range(2) if phone_for(DATASET, g, k).startswith("+")}),
+])
+def test_phone_match_modes(client, run, phone_num, match, expected):
+    async def matched():
+        async with SessionLocal() as session:
+            stmt = select(SMS_Data.sdt_in).where(phone_filter(SMS_Data, phone_num, match)).distinct()
+            return set((await session.scalars(stmt)).all())
+
+    async def stored():
+        async with SessionLocal() as session:
+            return set((await session.scalars(select(SMS_Data.sdt_in).distinct())).all())
+
+    in_memory = {sdt_in for sdt_in in run(stored) if phone_predicate(phone_num, match)(sdt_in)}
+
+    assert run(matched) == expected
+    assert in_memory == expected
@@ -0,0 +1,78 @@
+import os
+import sqlite3
+import pytest
+from sqlalchemy import select
+from app.config import settings
+from app.models import Replica_Heartbeat, SMS_Data
+from app.replicas import Replica, replica_set
+from benchmarks.generator import group_id_for
+from benchmarks.standin import install_shims, replicate_heartbeat
+from tests.conftest import TMP_DIR, WINDOW
+
+
+@pytest.fixture
+def replica(client, run, monkeypatch):
+    path = os.path.join(TMP_DIR, "replica.db")
+    with sqlite3.connect(os.path.join(TMP_DIR, "tests.db")) as primary, sqlite3.connect(path) as copy:
+        primary.backup(copy)
+        # a fresh copy: no heartbeat until one is replicated
+        copy.execute(f"DELETE FROM {Replica_Heartbeat.__tablename__}")
+    replica = Replica(f"sqlite+aiosqlite:///{path}")
+    install_shims(replica.engine)
+    monkeypatch.setattr(replica_set, "replicas", [replica])
+    monkeypatch.setattr(replica_set, "replicate", None)
+    yield replica
+    run(replica.engine.dispose)
+
+
+def feedback_on(sessions, run, group_id):
+    async def read():
+        async with sessions() as session:
+            return set((await session.scalars(select(SMS_Data.feedback).where(SMS_Data.group_id == group_id))).all())
+
+    return run(read)
+
+
+def test_replica_without_replicated_heartbeat_stays_out(run, replica):
+    run(replica_set.check_lag)
+
+    assert not replica.in_rotation
+    assert replica.error == "no heartbeat replicated yet"
+
+
+def test_reads_go_to_replica_and_writes_to_primary(client, run, replica):
+    from app.db import SessionLocal
+
+    replicate_heartbeat(replica_set)
+    run(replica_set.check_lag)
+    primary_reads = replica_set.primary_reads
+
+    listing = client.get("/frequency/", params={**WINDOW, "page_size": 10})
+    written = client.put("/frequency/", json=[{"group_id": group_id_for(30), "feedback": True}])
+
+    assert replica.in_rotation
+    assert listing.status_code == 200 and listing.json()["data"]
+    assert replica.served == 1
+    assert replica_set.primary_reads == primary_reads
+    assert written.status_code == 200
+    assert feedback_on(SessionLocal, run, group_id_for(30)) == {True}
+    # the stand-in replica does not get the write
+    assert True not in feedback_on(replica.sessions, run, group_id_for(30))
+
+
+def test_lagging_replica_leaves_rotation(client, run, replica):
+    lag_seconds = replicate_heartbeat(replica_set)
+    run(replica_set.check_lag)
+    assert replica.in_rotation
+
+    lag_seconds[replica.name] = settings.DB_REPLICA_MAX_LAG_SECONDS + 5
+    run(replica_set.check_lag)
+    primary_reads = replica_set.primary_reads
+    served = replica.served
+    listing = client.get("/frequency/", params={**WINDOW, "page_size": 10})
+
+    assert not replica.in_rotation
+    assert replica.lag > settings.DB_REPLICA_MAX_LAG_SECONDS
+    assert listing.status_code == 200
+    assert replica.served == served
+    assert replica_set.primary_reads == primary_reads + 1
@@ -0,0 +1,104 @@
+import asyncio
+import time
+from datetime import timedelta
+import pytest
+from sqlalchemy import insert
+from app import rollup
+from app.config import settings
+from app.db import SessionLocal
+from app.models import SMS_Data
+from benchmarks.generator import phone_for
+from tests.conftest import DATASET
+
+NOW = DATASET.end + timedelta(minutes=30)
+COVERED = DATASET.end - DATASET.window, DATASET.end
+# bounds off the minute, so the listings merge rollup buckets with raw rows
+START, END = DATASET.end - timedelta(minutes=55, seconds=13), DATASET.end - timedelta(seconds=7)
+WINDOW = {"from_datetime": START.isoformat() + "Z", "to_datetime": END.isoformat() + "Z"}
+
+
+@pytest.fixture(scope="module")
+def backfilled(run):
+    async def backfill():
+        async with SessionLocal() as session:
+            return await rollup.backfill(session, COVERED[0], now=NOW)
+
+    return run(backfill)
+
+
+def with_and_without_rollup(client, monkeypatch, path, params):
+    monkeypatch.setattr(settings, "ROLLUP_ENABLED", False)
+    raw = client.get(path, params=params)
+    monkeypatch.setattr(settings, "ROLLUP_ENABLED", True)
+    rolled = client.get(path, params=params)
+    return raw, rolled
+
+
+@pytest.mark.parametrize("path, phone", [
+    ("/content/", False),
+    ("/content/", True),
+    ("/frequency/", False),
+    ("/content/export", False),
+    ("/content/export", True),
+    ("/frequency/export", False),
+])
+def test_rollup_matches_raw_query(client, backfilled, monkeypatch, path, phone):
+    params = {**WINDOW, "phone_num": phone_for(DATASET, 1, 0)[-4:]} if phone else dict(WINDOW)
+    if "export" not in path:
+        params["page_size"] = 100
+
+    raw, rolled = with_and_without_rollup(client, monkeypatch, path, params)
+
+    body = raw.json()
+    assert raw.status_code == rolled.status_code == 200
+    assert body["data"] if isinstance(body, dict) else body
+    assert rolled.json() == body
+
+
+def test_refresh_rebuilds_minutes_with_late_rows(client, backfilled, run, monkeypatch):
+    late_minute = DATASET.end - timedelta(minutes=20)
+    late_rows = [
+        {
+            "id": f"late-{i}", "ts": late_minute + timedelta(seconds=30), "sdt_in": phone_for(DATASET, 3, 0),
+            "group_id": "grp-000003", "text_sms": "late message", "predicted_label": "spam", "feedback": False,
+        }
+        for i in range(3)
+    ]
+
+    async def insert_late_rows():
+        async with SessionLocal() as session:
+            await session.execute(insert(SMS_Data), late_rows)
+            await session.commit()
+            stale = await rollup.stale_minutes(session, *COVERED)
+            await rollup.refresh(session, now=NOW + timedelta(minutes=1))
+            return stale, await rollup.stale_minutes(session, *COVERED)
+
+    stale_before, stale_after = run(insert_late_rows)
+
+    assert stale_before == [late_minute]
+    assert stale_after == []
+    raw, rolled = with_and_without_rollup(client, monkeypatch, "/frequency/", {**WINDOW, "page_size": 100})
+    assert rolled.json() == raw.json()
+
+
+def test_refresh_loop_runs_until_stopped(client, run, monkeypatch):
+    refreshes = []
+
+    async def refresh(session):
+        refreshes.append(session)
+        return NOW
+
+    async def started():
+        await rollup.refresh_loop.start()
+        while len(refreshes) < 2:
+            await asyncio.sleep(0.01)
+        await rollup.refresh_loop.stop()
+
+    monkeypatch.setattr(rollup, "refresh", refresh)
+    monkeypatch.setattr(settings, "ROLLUP_INTERVAL_SECONDS", 0.01)
+    run(started)
+    stopped_at = len(refreshes)
+    time.sleep(0.05)
+
+    assert stopped_at >= 2
+    assert len(refreshes) == stopped_at
@@ -0,0 +1,96 @@
+import time
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import insert
+from app.config import settings
+from app.db import SessionLocal
+from app.models import SMS_Data
+from app.window import window_store
+from benchmarks.generator import phone_for
+from tests.conftest import DATASET, WINDOW
+from tests.test_pagination import rows, walk_cursor, walk_offset
+
+PHONES = {
+    "exact": phone_for(DATASET, 3, 1),
+    "prefix": "+84 9000000",
+    "suffix": "1",
+    "contains": "0000",
+}
+
+
+@pytest.fixture(scope="module")
+def tied_group(run):
+    # a group whose rows share one ts: min_by picks its message on the id hash alone
+    ts = DATASET.end - timedelta(minutes=10)
+    tied = [
+        {
+            "id": f"tie-{i}", "ts": ts, "sdt_in": phone_for(DATASET, 3, 1), "group_id": "grp-tie",
+            "text_sms": f"tied message {i}", "predicted_label": "spam", "feedback": False,
+        }
+        for i in range(25)
+    ]
+
+    async def insert_tied():
+        async with SessionLocal() as session:
+            await session.execute(insert(SMS_Data), tied)
+            await session.commit()
+
+    run(insert_tied)
+
+
+@pytest.fixture
+def start_window(client, run, monkeypatch):
+    """Starts the window store holding the dataset, once the SQL side has been read."""
+    def start():
+        retention = datetime.now() - (DATASET.end - DATASET.window) + timedelta(minutes=1)
+        monkeypatch.setattr(settings, "WINDOW_RETENTION_SECONDS", int(retention.total_seconds()))
+        run(window_store.start)
+        deadline = time.monotonic() + 10
+        while window_store.watermark is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert window_store.watermark is not None
+
+    yield start
+    run(window_store.stop)
+
+
+def listings(client, path, params):
+    return {
+        "offset": rows(walk_offset(client, path, params)),
+        "cursor": rows(walk_cursor(client, path, params)),
+    }
+
+
+@pytest.mark.parametrize("path, phone_match", [
+    ("/frequency/", None),
+    ("/content/", None),
+    ("/content/", "exact"),
+    ("/content/", "prefix"),
+    ("/content/", "suffix"),
+    ("/content/", "contains"),
+])
+def test_window_matches_sql_listings(client, tied_group, start_window, path, phone_match):
+    params = {**WINDOW, "page_size": 10}
+    if phone_match:
+        params.update(phone_num=PHONES[phone_match], phone_match=phone_match)
+
+    sql = listings(client, path, params)
+    start_window()
+    hits = window_store.hits
+    memory = listings(client, path, params)
+
+    assert window_store.hits > hits
+    assert sql["offset"]
+    assert sql["cursor"] == sql["offset"]
+    assert memory == sql
+    if phone_match in (None, "exact"):
+        assert "grp-tie" in {group["group_id"] for group in sql["offset"]}
+
+
+def test_range_ending_within_a_tick_of_the_watermark_is_covered(client, start_window):
+    start_window()
+    start = DATASET.end - DATASET.window
+    tick = timedelta(seconds=settings.WINDOW_TICK_SECONDS)
+
+    assert window_store.covers(start, window_store.watermark + tick / 2)
+    assert not window_store.covers(start, window_store.watermark + 2 * tick)